@@ -2,16 +2,63 @@ import openai
 from dotenv import load_dotenv
 import os
 import json
+import io
 import asyncio
-import requests
+from collections import Counter
+from dataprocessor.corpus import GazetteCorpus, as_text
+from dataprocessor.segmenter import segment_document
+from dataprocessor.chunker import chunk_document, token_counter, ChunkLedger
+from dataprocessor.meeting_info import extract_meeting_info, FIELD_WEIGHTS, DEFAULT_MIN_CONFIDENCE
+
+EXTRACT_BASIC_INFORMATION = {
+    "type": "function",
+    "function": {
+        "name": "extract_basic_information",
+        "description": "Extracts the basic information from a legislative document，請以繁體中文提供相關的資訊。",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "meeting_time": {
+                    "type": "string",
+                    "description": "The time when the meeting took place"
+                },
+                "meeting_location": {
+                    "type": "string",
+                    "description": "The location where the meeting took place"
+                },
+                "attendees": {
+                    "type": "array",
+                    "items": {
+                        "type": "string"
+                    },
+                    "description": "List of attendees"
+                },
+                "meeting_type": {
+                    "type": "string",
+                    "description": "The type of meeting"
+                },
+            },
+            "required": ["meeting_time", "meeting_location", "attendees", "meeting_type"]
+        }
+    }
+}
+
+RUN_TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+DEFAULT_RUN_CONCURRENCY = 4
+
+# 本地解析會議紀錄標頭時，在標頭之後多取的位元組數（涵蓋跨行的出席委員名單）
+HEADER_MARGIN = 2048
 
 class AssistantAPI:
-    def __init__(self):
+    def __init__(self, base_url=None):
         load_dotenv()
         openai.api_key = os.environ.get('OPENAI_API_KEY')
-        self.client = openai.OpenAI()
+        self.client = openai.OpenAI(base_url=base_url)
+        self.async_client = openai.AsyncOpenAI(base_url=base_url)
         self.gazette_assistant_id = 'asst_Cu1eA3qYvbe1vTUMU34Ldlph'
         self.gazette_vector_stores_id = os.environ.get('gazette_vector_stores_id')
+        # 每次執行中本地解析成功與交給 LLM 補齊的會議紀錄數
+        self.extraction_stats = Counter()
 
     def create_assistant(self, name, instructions, tools, model):
         assistant = self.client.beta.assistants.create(
@@ -48,74 +95,78 @@ class AssistantAPI:
         )
 
     def init_assistant(self):
-        extract_basic_information ={
-            "type": "function",
-            "function": {
-                "name": "extract_basic_information",
-                "description": "Extracts the basic information from a legislative document，請以繁體中文提供相關的資訊。",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "meeting_time": {
-                            "type": "string",
-                            "description": "The time when the meeting took place"
-                        },
-                        "meeting_location": {
-                            "type": "string",
-                            "description": "The location where the meeting took place"
-                        },
-                        "attendees": {
-                            "type": "array",
-                            "items": {
-                                "type": "string"
-                            },
-                            "description": "List of attendees"
-                        },
-                        "meeting_type": {
-                            "type": "string",
-                            "description": "The type of meeting"
-                        },
-                    },
-                    "required": ["meeting_time", "meeting_location", "attendees", "meeting_type"]
-                }
-            }
-        }
-
         assistant = self.create_assistant(
             name="台灣立法院公報解析",
             instructions="你是一位資深的立法院公報分析師，你的任務是分析臺灣立法院公報，並以繁體中文提供相關的資訊。",
-            tools=[{"type": "file_search"}, extract_basic_information],
+            tools=[{"type": "file_search"}, EXTRACT_BASIC_INFORMATION],
             model="gpt-4o-mini",
         )
 
         self.gazette_assistant_id = assistant.id
 
-    def new_edition_gazette(self, edition_index):
+    def new_edition_gazette(self, edition_index, chunked=False, data_dir='./data'):
+        # 上傳一期公報並連結到共用的 assistant；同時分析多期時請改用 upload_edition 並將向量庫附加到各自的 thread
+        vector_store_id, first_file_id = self.upload_edition(edition_index, chunked, data_dir)
+        if vector_store_id:
+            self.link_vector_store(vector_store_id)
+        return first_file_id
+
+    def upload_edition(self, edition_index, chunked=False, data_dir='./data'):
+        # 建立這一期的向量庫並上傳文件，不修改 assistant；回傳 (向量庫 ID, 第一個文件的 ID)
 
+        edition_number = edition_index
         if edition_index < 10:
             edition_index = f'0{edition_index}'
 
+        if chunked:
+            # 只上傳之前沒有上傳過的 chunk，每個 TXT 合成一個檔案
+            ledger = ChunkLedger(os.path.join(data_dir, 'chunks', 'uploaded.txt'))
+            file_streams = self.new_chunk_files(edition_number, ledger, data_dir)
+            stats = ledger.stats
+            print(f"略過 {stats['duplicate_chunks']} / {stats['chunks']} 個已上傳的 chunk，"
+                  f"節省 {stats['saved_bytes']} 位元組、{stats['saved_tokens']} tokens")
+            if not file_streams:
+                print("沒有新的內容需要上傳")
+                return None, None
+        else:
+            txt_dir = os.path.join(data_dir, 'txt', f'第{edition_index}期')
+            file_paths = [os.path.join(txt_dir, file) for file in sorted(os.listdir(txt_dir)) if file.endswith('.txt')]
+            file_streams = [open(path, "rb") for path in file_paths]
+
         vector_store = self.create_vector_store(
             name=f"立法院公報第{edition_index}期",
         )
 
-        file_paths = [os.path.join(f'./data/txt/第{edition_index}期/', file) for file in os.listdir(f'./data/txt/第{edition_index}期/') if file.endswith('.txt')]
-
-        file_streams = [open(path, "rb") for path in file_paths]
-        file_batch = self.upload_file(vector_store.id, file_streams)
+        try:
+            file_batch = self.upload_file(vector_store.id, file_streams)
+        finally:
+            for stream in file_streams:
+                stream.close()
+        if chunked:
+            ledger.save()
 
         print(file_batch)
 
-        self.link_vector_store(vector_store.id)
-
         # 列出文件並選擇第一個文件的 ID
         files = self.list_files_in_vector_store(vector_store.id)
         if files:
             first_file_id = files[0].id
-            return first_file_id
+            return vector_store.id, first_file_id
         else:
             print("沒有文件被上傳")
-            return None
+            return vector_store.id, None
+
+    def new_chunk_files(self, edition_index, ledger, data_dir='./data'):
+        count_tokens = token_counter()
+        file_streams = []
+        with GazetteCorpus(data_dir) as corpus:
+            for path in corpus.txt_files(edition_index):
+                chunks = list(ledger.filter(chunk_document(corpus.open(path), count_tokens)))
+                if chunks:
+                    stream = io.BytesIO('\n\n'.join(chunk['text'] for chunk in chunks).encode('utf-8'))
+                    stream.name = os.path.basename(path)
+                    file_streams.append(stream)
+        return file_streams
 
     def create_thread(self, messages):
         thread = self.client.beta.threads.create(
@@ -124,68 +175,150 @@ class AssistantAPI:
         self.thread_id = thread.id
         return thread
 
-    async def run_thread(self, thread_id, assistant_id, instructions):
-        run = self.client.beta.threads.runs.create(
+    async def create_thread_async(self, messages, vector_store_id=None):
+        # 指定向量庫時附加在這個 thread 上，file_search 只會搜尋這個向量庫，不受 assistant 設定影響
+        if vector_store_id is None:
+            return await self.async_client.beta.threads.create(messages=messages)
+        return await self.async_client.beta.threads.create(
+            messages=messages,
+            tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}},
+        )
+
+    async def run_thread(self, thread_id, assistant_id, instructions, poll_interval=1.0):
+        # 以 AsyncOpenAI 執行 run，輪詢與工具呼叫都不會阻塞事件迴圈；回傳 (run, 整理後的訊息)
+        run = await self.async_client.beta.threads.runs.create(
             thread_id=thread_id,
             assistant_id=assistant_id,
             instructions=instructions,
         )
 
-        run_complete = False
-        while not run_complete:
-            run = self.client.beta.threads.runs.poll(
-                thread_id=thread_id,
-                run_id=run.id,
-            )
-            print(f"Run status: {run.status}")
+        status = None
+        while run.status not in RUN_TERMINAL_STATUSES:
+            if run.status != status:
+                status = run.status
+                print(f"Run {run.id} status: {run.status}")
 
             if run.status == "requires_action":
+                tool_outputs = []
                 for tool_call in run.required_action.submit_tool_outputs.tool_calls:
                     function_args = json.loads(tool_call.function.arguments)
-                    meeting_time = function_args.get("meeting_time")
-                    meeting_type = function_args.get("meeting_type")
-                    meeting_location = function_args.get("meeting_location")
-                    attendees = function_args.get("attendees")
-                    print(f"Meeting time: {meeting_time}")
-                    print(f"Meeting location: {meeting_location}")
-                    print(f"Attendees: {attendees}")
-                    print(f"Meeting type: {meeting_type}")
-
                     result = self.extract_basic_information(
-                        meeting_time=meeting_time,
-                        meeting_type=meeting_type,
-                        meeting_location=meeting_location,
-                        attendees=attendees
-                    )
-
-                    await self.client.beta.threads.runs.submitToolOutputs(
-                        thread_id=thread_id,
-                        run_id=run.id,
-                        tool_outputs=[{'tool_call_id': tool_call.id, 'output': result}]
+                        meeting_time=function_args.get("meeting_time"),
+                        meeting_type=function_args.get("meeting_type"),
+                        meeting_location=function_args.get("meeting_location"),
+                        attendees=function_args.get("attendees") or [],
                     )
-            run_complete = run.status in ["completed", "failed"]
-        print("Run complete")
-
-        headers = {
-            'Authorization': f'Bearer {os.environ.get("OPENAI_API_KEY")}',
-            'OpenAI-Beta': 'assistants=v2',
-        }
-        response = requests.get(
-            f'https://api.openai.com/v1/threads/{thread_id}/messages',
-            headers=headers
-        )
-
-        if response.status_code == 200:
-            messages = response.json()["data"]
-            for message in messages:
-                message_info = self.extract_message_info(message)
-                print(json.dumps(message_info, indent=2, ensure_ascii=False))
-        else:
-            print(f"Failed to retrieve messages: {response.status_code}, {response.text}")
+                    tool_outputs.append({'tool_call_id': tool_call.id, 'output': result})
+
+                run = await self.async_client.beta.threads.runs.submit_tool_outputs(
+                    thread_id=thread_id,
+                    run_id=run.id,
+                    tool_outputs=tool_outputs,
+                )
+                continue
+
+            await asyncio.sleep(poll_interval)
+            run = await self.async_client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+        print(f"Run {run.id} complete: {run.status}")
+
+        messages = await self.list_thread_messages(thread_id)
+        for message_info in messages:
+            print(json.dumps(message_info, indent=2, ensure_ascii=False))
+        return run, messages
+
+    async def list_thread_messages(self, thread_id, page_size=100):
+        # SDK 的分頁物件會依 has_more 與 after 自動取得下一頁，依時間先後回傳所有訊息
+        messages = []
+        async for message in self.async_client.beta.threads.messages.list(
+                thread_id=thread_id, order="asc", limit=page_size):
+            messages.append(self.extract_message_info(message.model_dump()))
+        return messages
+
+    async def run_threads(self, jobs, concurrency=DEFAULT_RUN_CONCURRENCY, poll_interval=1.0):
+        # jobs 為 (thread_id, assistant_id, instructions)；以 semaphore 限制同時進行的 run 數，
+        # 結果依 jobs 的順序回傳，失敗的 run 以例外物件表示
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(job):
+            async with semaphore:
+                return await self.run_thread(*job, poll_interval=poll_interval)
+
+        return await asyncio.gather(*(run(job) for job in jobs), return_exceptions=True)
+
+    async def analyze_editions(self, editions, instructions, concurrency=DEFAULT_RUN_CONCURRENCY,
+                               data_dir='./data', poll_interval=1.0):
+        # 同時分析多期公報：上傳仍使用同步的 SDK，因此放到執行緒中，不阻塞其他期的 run。
+        # 各期的向量庫附加在各自的 thread 上，不修改共用的 assistant，避免不同期的 run 搜尋到彼此的公報
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def analyze(edition):
+            async with semaphore:
+                vector_store_id, file_id = await asyncio.to_thread(self.upload_edition, edition, False, data_dir)
+                if not file_id:
+                    return None
+                thread = await self.create_thread_async([{
+                    "role": "user",
+                    "content": f"你是一位熟悉台灣立法院運作的分析師，附檔第{edition}期的公報",
+                }], vector_store_id)
+                return await self.run_thread(thread.id, self.gazette_assistant_id, instructions, poll_interval)
+
+        return await asyncio.gather(*(analyze(edition) for edition in editions), return_exceptions=True)
 
     def extract_basic_information(self, meeting_time, meeting_type, meeting_location, attendees):
         return f"會議時間: {meeting_time}, 會議類型: {meeting_type}, 會議地點: {meeting_location}, 參加者: {', '.join(attendees)}"
 
+    def basic_information(self, record_text, title=None, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        # 先以本地規則解析會議紀錄標頭，欄位不齊全或信心分數不足時才呼叫 LLM
+        info = extract_meeting_info(record_text, title)
+        if not info['missing'] and info['confidence'] >= min_confidence:
+            self.extraction_stats['local'] += 1
+            return {**info, 'source': 'local'}
+
+        self.extraction_stats['llm'] += 1
+        llm_info = self.extract_basic_information_llm(record_text)
+        # 本地已解析的欄位保留，LLM 只補齊缺少的欄位
+        merged = {field: info[field] or llm_info.get(field) for field in FIELD_WEIGHTS}
+        return {**merged, 'confidence': info['confidence'], 'missing': info['missing'], 'source': 'llm'}
+
+    def extract_basic_information_llm(self, record_text):
+        response = self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "你是一位資深的立法院公報分析師，你的任務是分析臺灣立法院公報，並以繁體中文提供相關的資訊。"},
+                {"role": "user", "content": record_text},
+            ],
+            tools=[EXTRACT_BASIC_INFORMATION],
+            tool_choice={"type": "function", "function": {"name": "extract_basic_information"}},
+        )
+        tool_calls = response.choices[0].message.tool_calls or []
+        if not tool_calls:
+            return {}
+        return json.loads(tool_calls[0].function.arguments)
+
+    def count_records(self, edition_index, data_dir='./data'):
+        # 會議紀錄的份數直接由本地分段計算，不需要上傳公報再詢問 assistant；回傳 {文件名稱: 份數}
+        counts = {}
+        with GazetteCorpus(data_dir) as corpus:
+            for path in corpus.txt_files(edition_index):
+                counts[os.path.basename(path)] = sum(1 for _ in segment_document(corpus.open(path)))
+        return counts
+
+    def edition_basic_information(self, edition_index, data_dir='./data'):
+        # 以本地分段找出該期的每一份會議紀錄，只取標頭附近的文字解析基本資料
+        results = []
+        with GazetteCorpus(data_dir) as corpus:
+            for path in corpus.txt_files(edition_index):
+                document = corpus.open(path)
+                for record in segment_document(document):
+                    head = document.slice(record['start'], min(record['end'], record['header_end'] + HEADER_MARGIN))
+                    text = as_text(head)
+                    head.release()
+                    info = self.basic_information(text, record['title'])
+                    results.append({'file': os.path.basename(path), 'record': record['record'],
+                                    'title': record['title'], **info})
+        print(f"本地解析 {self.extraction_stats['local']} 份，LLM 補齊 {self.extraction_stats['llm']} 份")
+        return results
+
     def extract_message_info(self, message):
         message_info = {
             "id": message["id"],
@@ -218,27 +351,11 @@ class AssistantAPI:
 
 if __name__ == "__main__":
 
-    edition = 68
+    editions = [68]
     assistant_api = AssistantAPI()
-    first_file_id = assistant_api.new_edition_gazette(edition)
-
-    if first_file_id:
-        messages = [
-            {
-                "role": "user",
-                "content": f"你是一位熟悉台灣立法院運作的分析師，附檔第{edition}期的公報",
-                "attachments": [
-                    { "file_id": first_file_id, "tools": [{"type": "file_search"}, ] }
-                ],
-            }
-        ]
-
-        thread = assistant_api.create_thread(messages)
-
-        print(thread.tool_resources.file_search)
-        print(thread.id)
-
-        thread_id = thread.id
-        instructions = "請問總共有幾份會議紀錄？"
 
-        asyncio.run(assistant_api.run_thread(thread_id=thread_id, assistant_id=assistant_api.gazette_assistant_id, instructions=instructions))
\ No newline at end of file
+    for edition in editions:
+        counts = assistant_api.count_records(edition)
+        for file_name, count in counts.items():
+            print(f"{file_name}：{count} 份會議紀錄")
+        print(f"第{edition}期總共有 {sum(counts.values())} 份會議紀錄")
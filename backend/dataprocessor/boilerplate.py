@@ -0,0 +1,163 @@
+# dataprocessor/boilerplate.py
+
+import re
+import bisect
+from collections import Counter
+from dataprocessor.conversion import PAGE_MARKER
+from dataprocessor.chunker import SPEAKER_RE
+
+# 轉換後、建立索引前的清理：每一頁重複的頁首（立法院公報　第113卷　第NN期　…）、頁碼，
+# 以及整期中反覆出現的程序性文字，依出現頁數的比例從同一期的文件中學出來後移除。
+# 全形英數字改成半形、各種空白統一，但保留全形標點（分段與發言者判斷依賴「：」）。
+# 只處理 data/txt：merged_md 的頁碼索引以 marker 片段（多頁）為單位，無法依頁統計重複的頁首頁尾，
+# 而 marker 轉換時已經會過濾頁首頁尾。
+
+DEFAULT_MIN_PAGE_RATIO = 0.3
+DEFAULT_MIN_PAGES = 3
+# 頁首頁尾以外的重複行，至少要這麼長才視為程序性文字；發言行（「王委員美惠：…」）一律保留
+DEFAULT_MIN_BODY_LENGTH = 15
+EDGE_LINES = 3
+
+FULLWIDTH_ALNUM = {code: code - 0xFEE0 for code in list(range(0xFF10, 0xFF1A)) + list(range(0xFF21, 0xFF3B))
+                   + list(range(0xFF41, 0xFF5B))}
+SPACE_RE = re.compile(r'[ \t\u00a0\u3000]+')
+# 標準化時會被改寫的片段：連續空白或單一全形英數字
+NORMALIZED_RE = re.compile(r'[ \t\u00a0\u3000]+|[０-９Ａ-Ｚａ-ｚ]')
+DIGITS_RE = re.compile(r'\d+')
+PAGE_NUMBER_RE = re.compile(r'^[-－—\s]*(?:第\s*)?\d{1,4}(?:\s*頁)?[-－—\s]*$')
+
+
+def normalize_with_segments(line):
+    # 全形英數字轉半形；連續空白中有全形空白時保留一個全形空白（標頭欄位「時　間」），否則為一個半形空白。
+    # 同時回傳行內的位移對照 [(標準化後位元組位移, 原始位元組位移)]：兩者差距改變處各記一段
+    line = line.rstrip()
+    parts = []
+    segments = [(0, 0)]
+    clean = original = position = 0
+    for match in NORMALIZED_RE.finditer(line):
+        unchanged = line[position:match.start()]
+        parts.append(unchanged)
+        clean += len(unchanged.encode('utf-8'))
+        original += len(unchanged.encode('utf-8'))
+        raw = match.group()
+        if SPACE_RE.match(raw):
+            replacement = '　' if '　' in raw else ' '
+        else:
+            replacement = raw.translate(FULLWIDTH_ALNUM)
+        parts.append(replacement)
+        clean += len(replacement.encode('utf-8'))
+        original += len(raw.encode('utf-8'))
+        if clean - original != segments[-1][0] - segments[-1][1]:
+            segments.append((clean, original))
+        position = match.end()
+    parts.append(line[position:])
+    return ''.join(parts), segments
+
+
+def normalize_line(line):
+    return normalize_with_segments(line)[0]
+
+
+def line_key(line):
+    # 比對重複行時忽略空白與數字的差異（例如不同頁的頁碼或期數）
+    return DIGITS_RE.sub('#', SPACE_RE.sub('', line))
+
+
+def page_lines(document):
+    # 依 corpus.Document 的頁碼索引產生 (頁碼, [(行的位移, 行文字)])；多頁共用同一範圍時只產生一次
+    previous_span = None
+    for page in sorted(document.page_spans):
+        start, end = document.page_spans[page]
+        if (start, end) == previous_span:
+            continue
+        previous_span = (start, end)
+        lines = []
+        offset = start
+        for raw in bytes(document.slice(start, end)).split(b'\n'):
+            text = raw.decode('utf-8', errors='replace').replace('\x0c', '').replace('\r', '')
+            lines.append((offset, text))
+            offset += len(raw) + 1
+        yield page, lines
+
+
+def edge_indexes(lines):
+    # 每頁開頭與結尾的非空白行在 lines 中的索引
+    non_empty = [index for index, (_, text) in enumerate(lines) if text.strip()]
+    return set(non_empty[:EDGE_LINES] + non_empty[-EDGE_LINES:])
+
+
+def edge_lines(lines):
+    return [lines[index][1] for index in sorted(edge_indexes(lines))]
+
+
+def learn_boilerplate(documents, min_page_ratio=DEFAULT_MIN_PAGE_RATIO, min_pages=DEFAULT_MIN_PAGES,
+                      min_body_length=DEFAULT_MIN_BODY_LENGTH):
+    # 統計同一期所有文件中每一種行出現在幾頁；回傳 (頁首頁尾的重複行, 正文中的重複行) 兩個 key 的集合
+    edge_pages = Counter()
+    body_pages = Counter()
+    pages = 0
+    for document in documents:
+        for _, lines in page_lines(document):
+            pages += 1
+            edge_pages.update({line_key(text) for text in edge_lines(lines) if not SPEAKER_RE.match(text)})
+            body_pages.update({line_key(text) for _, text in lines
+                               if len(SPACE_RE.sub('', text)) >= min_body_length and not SPEAKER_RE.match(text)})
+    threshold = max(min_pages, min_page_ratio * pages)
+    edge = {key for key, count in edge_pages.items() if key and count >= threshold}
+    body = {key for key, count in body_pages.items() if key and count >= threshold}
+    return edge, body
+
+
+def clean_document(document, boilerplate):
+    # 產生清理後的文字與位移對照：每頁以頁碼標記開頭，保留的每一行依 normalize_with_segments 的行內對照
+    # 記錄 (清理後位移, 原始位移)
+    edge, body = boilerplate
+    output = []
+    clean_offsets = []
+    original_offsets = []
+    size = 0
+    stripped = 0
+
+    def emit(line, offset, segments):
+        nonlocal size
+        for clean, original in segments:
+            clean_offsets.append(size + clean)
+            original_offsets.append(offset + original)
+        encoded = line + '\n'
+        output.append(encoded)
+        size += len(encoded.encode('utf-8'))
+
+    for page, lines in page_lines(document):
+        marker = PAGE_MARKER.format(page=page)
+        output.append(marker)
+        size += len(marker.encode('utf-8'))
+        edges = edge_indexes(lines)
+        # 連續的空白行只保留一行，且只在後面還有內容時輸出，頁首與頁尾不留空白行
+        blank = None
+        has_content = False
+        for index, (offset, text) in enumerate(lines):
+            key = line_key(text)
+            # 只有頁首頁尾的單獨數字才是頁碼；正文中只有數字的行多半是表格的儲存格
+            at_edge = index in edges
+            if (at_edge and (key in edge or PAGE_NUMBER_RE.match(text))) or key in body:
+                stripped += 1
+                continue
+            line, segments = normalize_with_segments(text)
+            if not line:
+                if blank is None and has_content:
+                    blank = offset
+                continue
+            if blank is not None:
+                emit('', blank, [(0, 0)])
+                blank = None
+            emit(line, offset, segments)
+            has_content = True
+    return ''.join(output), {'clean': clean_offsets, 'original': original_offsets, 'stripped_lines': stripped}
+
+
+def original_offset(offset_map, clean_offset):
+    # 將清理後文件中的位移換回原始文件中的位移（以行內對照的段落為單位，段落內位移依位元組差距推算）
+    index = bisect.bisect_right(offset_map['clean'], clean_offset) - 1
+    if index < 0:
+        return offset_map['original'][0] if offset_map['original'] else 0
+    return offset_map['original'][index] + clean_offset - offset_map['clean'][index]
@@ -0,0 +1,207 @@
+# dataprocessor/chunker.py
+
+import os
+import re
+import hashlib
+import logging
+from collections import Counter
+from dataprocessor.segmenter import segment_document, page_index, page_of
+
+# 將分段後的會議紀錄切成有 token 上限、彼此重疊的 chunk。chunk 不跨越會議紀錄，並盡量在發言者切換處斷開；
+# 單一發言超過上限時才以句子切開。會議紀錄之外的文字（目錄、第一份紀錄之前的前言）也一併切成 chunk，
+# 找不到任何會議紀錄的文件則整份切成 chunk。每個 chunk 以標準化後的內容雜湊識別，已經處理過的 chunk 在嵌入或上傳前略過。
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TOKENS = 512
+DEFAULT_OVERLAP_TOKENS = 64
+
+# 發言行：行首為 2 到 12 個漢字（中間可能有全形空白，例如「主　　席」），接著全形冒號
+SPEAKER_RE = re.compile(r'^[ 　]*[一-鿿][一-鿿　]{1,11}：', re.MULTILINE)
+SENTENCE_RE = re.compile(r'[^。！？]*[。！？]+[」』）]*|[^。！？]+', re.DOTALL)
+HASH_STRIP_RE = re.compile(r'[\s　]+')
+CJK_RE = re.compile(r'[一-鿿]')
+
+
+def approximate_tokens(text):
+    # 無法載入 tiktoken 的編碼檔（例如離線）時的估計：漢字約一個 token，其他字元約四個一個 token
+    cjk = len(CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def token_counter(encoding_name='cl100k_base'):
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.warning(f'Cannot load tiktoken encoding {encoding_name} ({e}); falling back to an approximate count')
+        return approximate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def chunk_hash(text):
+    # 忽略空白與換行位置的差異，讓轉換器斷行不同的相同內容得到同樣的雜湊
+    return hashlib.sha256(HASH_STRIP_RE.sub('', text).encode('utf-8')).hexdigest()
+
+
+def record_pieces(text, base_offset, count_tokens, max_tokens):
+    # 將一份會議紀錄切成 (發言編號, 開始位移, 結束位移, token 數) 的片段；位移為文件中的位元組位移。
+    # 開頭到第一位發言者之前（標頭）是第 0 段發言
+    starts = [0] + [match.start() for match in SPEAKER_RE.finditer(text) if match.start() > 0]
+    starts.append(len(text))
+    offset = base_offset
+    for turn, (start, end) in enumerate(zip(starts, starts[1:])):
+        turn_text = text[start:end]
+        turn_bytes = len(turn_text.encode('utf-8'))
+        tokens = count_tokens(turn_text)
+        if tokens <= max_tokens:
+            yield turn, offset, offset + turn_bytes, tokens
+            offset += turn_bytes
+            continue
+        for sentence in SENTENCE_RE.findall(turn_text):
+            for piece in split_long(sentence, count_tokens, max_tokens):
+                piece_bytes = len(piece.encode('utf-8'))
+                yield turn, offset, offset + piece_bytes, count_tokens(piece)
+                offset += piece_bytes
+
+
+def split_long(text, count_tokens, max_tokens):
+    # 超過上限的單一句子（或沒有句號的標頭）先依行合併到上限以內，單一行仍超過上限時依字數平均切開
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    pieces = []
+    current = ''
+    for line in text.splitlines(keepends=True):
+        if current and count_tokens(current + line) > max_tokens:
+            pieces.append(current)
+            current = ''
+        current += line
+    if current:
+        pieces.append(current)
+
+    result = []
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if tokens <= max_tokens:
+            result.append(piece)
+            continue
+        width = max(1, int(len(piece) * max_tokens / tokens * 0.9))
+        result.extend(piece[i:i + width] for i in range(0, len(piece), width))
+    return result
+
+
+def pack(pieces, max_tokens, overlap_tokens):
+    # 依序組成 chunk：整段發言放得下就整段放入，否則在句子處斷開；新 chunk 以前一個 chunk 結尾不超過
+    # overlap_tokens 的片段開頭。回傳每個 chunk 的片段清單
+    chunk = []
+    tokens = 0
+    fresh = False
+
+    def flush():
+        nonlocal chunk, tokens, fresh
+        emitted = chunk
+        overlap = []
+        overlap_total = 0
+        for piece in reversed(chunk):
+            if overlap_total + piece[3] > overlap_tokens:
+                break
+            overlap.insert(0, piece)
+            overlap_total += piece[3]
+        chunk, tokens, fresh = overlap, overlap_total, False
+        return emitted
+
+    turns = []
+    for piece in pieces:
+        if turns and turns[-1][0][0] == piece[0]:
+            turns[-1].append(piece)
+        else:
+            turns.append([piece])
+
+    for turn in turns:
+        turn_tokens = sum(piece[3] for piece in turn)
+        units = [turn] if turn_tokens <= max_tokens else [[piece] for piece in turn]
+        for unit in units:
+            unit_tokens = sum(piece[3] for piece in unit)
+            if tokens + unit_tokens > max_tokens:
+                if fresh:
+                    yield flush()
+                if tokens + unit_tokens > max_tokens:
+                    # 重疊的部分放不下新的片段時捨棄重疊
+                    chunk, tokens = [], 0
+            chunk.extend(unit)
+            tokens += unit_tokens
+            fresh = True
+    if fresh:
+        yield chunk
+
+
+def document_spans(document):
+    # 依序產生文件中的每份會議紀錄，並以 record 為 None 的片段補上紀錄之間與前後未涵蓋的文字
+    page_starts, pages = page_index(document)
+    size = len(document.mm)
+
+    def uncovered(start, end):
+        return {'record': None, 'title': '', 'start': start, 'end': end,
+                'start_page': page_of(page_starts, pages, start)}
+
+    position = 0
+    for record in segment_document(document):
+        if record['start'] > position:
+            yield uncovered(position, record['start'])
+        yield record
+        position = record['end']
+    if position < size:
+        yield uncovered(position, size)
+
+
+def chunk_document(document, count_tokens, max_tokens=DEFAULT_MAX_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    # 對 corpus.Document 產生 chunk：{'id', 'record', 'title', 'start', 'end', 'start_page', 'tokens', 'text'}；
+    # 不屬於任何會議紀錄的文字 record 為 None
+    for record in document_spans(document):
+        view = document.slice(record['start'], record['end'])
+        text = bytes(view).decode('utf-8', errors='replace')
+        view.release()
+        pieces = list(record_pieces(text, record['start'], count_tokens, max_tokens))
+        for chunk in pack(pieces, max_tokens, overlap_tokens):
+            start, end = chunk[0][1], chunk[-1][2]
+            chunk_view = document.slice(start, end)
+            chunk_text = bytes(chunk_view).decode('utf-8', errors='replace')
+            chunk_view.release()
+            yield {'id': chunk_hash(chunk_text), 'record': record['record'], 'title': record['title'],
+                   'start': start, 'end': end, 'start_page': record['start_page'],
+                   'tokens': sum(piece[3] for piece in chunk), 'text': chunk_text}
+
+
+class ChunkLedger:
+    # 已處理過的 chunk 雜湊，每行一個，附加寫入
+    def __init__(self, path):
+        self.path = path
+        self.seen = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='ascii') as f:
+                self.seen.update(line.strip() for line in f if line.strip())
+        self.pending = []
+        self.stats = Counter()
+
+    def filter(self, chunks):
+        # 只交出沒看過的 chunk，並統計略過的位元組與 token 數
+        for chunk in chunks:
+            size = chunk['end'] - chunk['start']
+            self.stats['chunks'] += 1
+            self.stats['bytes'] += size
+            self.stats['tokens'] += chunk['tokens']
+            if chunk['id'] in self.seen:
+                self.stats['duplicate_chunks'] += 1
+                self.stats['saved_bytes'] += size
+                self.stats['saved_tokens'] += chunk['tokens']
+                continue
+            self.seen.add(chunk['id'])
+            self.pending.append(chunk['id'])
+            yield chunk
+
+    def save(self):
+        # 在新 chunk 嵌入或上傳完成後呼叫，讓中斷的執行下次重新處理這些 chunk
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='ascii') as f:
+            f.writelines(digest + '\n' for digest in self.pending)
+        self.pending.clear()
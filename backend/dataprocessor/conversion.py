@@ -0,0 +1,367 @@
+# dataprocessor/conversion.py
+
+import io
+import os
+import json
+import time
+import shutil
+import hashlib
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import Counter
+from pdfminer.converter import TextConverter, PDFPageAggregator
+from pdfminer.layout import LAParams, LTTextBox, LTTextLine, LTFigure, LTImage, LTRect, LTLine, LTCurve
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+
+# 分段轉換後接回時插入的頁碼標記，在 TXT 與 Markdown 中都不影響閱讀
+PAGE_MARKER = '<!-- page {page} -->\n'
+
+# 常駐 marker 工作行程載入的模型與載入耗時，每個行程只載入一次
+_marker_models = None
+_marker_load_seconds = None
+
+
+def count_pages(pdf_path):
+    with open(pdf_path, 'rb') as fp:
+        return sum(1 for _ in PDFPage.get_pages(fp))
+
+
+def page_ranges(page_count, shard_pages):
+    # 以 0 起算、不含結尾的 (start, end) 頁碼範圍
+    return [(start, min(start + shard_pages, page_count)) for start in range(0, page_count, shard_pages)]
+
+
+def pdfminer_pages(pdf_path, page_numbers=None):
+    # 逐頁產生 (頁碼, 文字)，輸出與 pdfminer 的 extract_text 相同，但每頁處理完就交出去；
+    # 關閉物件快取，讓記憶體用量只取決於單一頁面
+    resource_manager = PDFResourceManager(caching=False)
+    output = io.StringIO()
+    with open(pdf_path, 'rb') as fp:
+        device = TextConverter(resource_manager, output, laparams=LAParams())
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        last_page = max(page_numbers) if page_numbers else None
+        for page_index, page in enumerate(PDFPage.get_pages(fp, caching=False)):
+            if page_numbers is not None and page_index not in page_numbers:
+                if page_index > last_page:
+                    break
+                continue
+            interpreter.process_page(page)
+            yield page_index, output.getvalue()
+            output.seek(0)
+            output.truncate()
+        device.close()
+
+
+def pdfminer_layout_pages(pdf_path):
+    # 逐頁產生 (頁碼, 文字, 版面統計)；文字與 TextConverter 的輸出相同，版面統計供混合轉換器判斷頁面品質
+    resource_manager = PDFResourceManager(caching=False)
+    device = PDFPageAggregator(resource_manager, laparams=LAParams())
+    interpreter = PDFPageInterpreter(resource_manager, device)
+    with open(pdf_path, 'rb') as fp:
+        for page_index, page in enumerate(PDFPage.get_pages(fp, caching=False)):
+            interpreter.process_page(page)
+            layout = device.get_result()
+            parts = []
+            lines = []
+            graphics = 0
+            images = 0
+            for element in layout:
+                if isinstance(element, LTTextBox):
+                    parts.append(element.get_text() + '\n')
+                    lines.extend((line.x0, len(line.get_text().strip()))
+                                 for line in element if isinstance(line, LTTextLine))
+                elif isinstance(element, (LTRect, LTLine, LTCurve)):
+                    graphics += 1
+                elif isinstance(element, (LTFigure, LTImage)):
+                    images += 1
+            parts.append('\f')
+            stats = {'lines': lines, 'graphics': graphics, 'images': images}
+            yield page_index, ''.join(parts), stats
+
+
+def is_cjk(char):
+    return '\u4e00' <= char <= '\u9fff'
+
+
+def is_garbled(char):
+    # 缺字對照、私用區與相容/擴充區漢字在公報正文中幾乎不會出現，大量出現代表字型對照表解析錯誤
+    return (char == '\ufffd' or '\ue000' <= char <= '\uf8ff' or '\uf900' <= char <= '\ufaff'
+            or '\u3400' <= char <= '\u4dbf')
+
+
+def score_page(text, stats, min_chars=100, garbled_ratio=0.2, table_columns=3):
+    # 以低成本的規則判斷 pdfminer 的結果是否可信，回傳需要改用 marker 的原因列表（空列表代表不需要）
+    reasons = []
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < min_chars and stats['images']:
+        reasons.append('low_text_density')
+
+    garbled = sum(1 for c in chars if is_garbled(c)) + 5 * text.count('(cid:')
+    han = sum(1 for c in chars if is_cjk(c))
+    if garbled and garbled / max(han + garbled, 1) >= garbled_ratio:
+        reasons.append('garbled_cjk')
+
+    # 表格：多條框線，或許多短文字行對齊在數個固定欄位上
+    columns = Counter(round(x0 / 10) for x0, length in stats['lines'] if length <= 12)
+    short_lines = sum(1 for _, length in stats['lines'] if length <= 12)
+    aligned_columns = sum(1 for count in columns.values() if count >= 4)
+    if stats['graphics'] >= 10 or (aligned_columns >= table_columns and short_lines >= len(stats['lines']) / 2):
+        reasons.append('table_like')
+    return reasons
+
+
+def convert_page_marker(pdf_path, page_index):
+    # 在（已載入模型的）工作行程中以 marker 轉換單一頁
+    return marker_convert(pdf_path, start_page=page_index, max_pages=1)
+
+
+def marker_available():
+    return importlib.util.find_spec('marker') is not None
+
+
+def load_all_marker_models():
+    from marker.models import load_all_models
+    return load_all_models()
+
+
+def load_marker_models():
+    # 作為行程池的 initializer，讓每個工作行程在處理第一份文件前就把模型載入好
+    global _marker_models, _marker_load_seconds
+    if _marker_models is None:
+        started = time.monotonic()
+        _marker_models = load_all_marker_models()
+        _marker_load_seconds = time.monotonic() - started
+    return _marker_models
+
+
+def marker_convert(pdf_path, **kwargs):
+    import marker
+
+    # 已載入模型的行程直接重用模型，否則沿用原本每次呼叫都重新初始化的方式
+    if _marker_models is None:
+        result = marker.convert_single_pdf(pdf_path, **kwargs)
+    else:
+        result = marker.convert_single_pdf(pdf_path, _marker_models, **kwargs)
+    return result[0] if isinstance(result, tuple) else result
+
+
+def marker_pages(pdf_path, page_numbers):
+    # marker 沒有逐頁輸出的介面，改為每次只轉換一頁；模型只在第一頁之前載入一次，
+    # 否則未載入模型的行程每一頁都會重新初始化模型
+    load_marker_models()
+    for page_index in sorted(page_numbers):
+        yield page_index, marker_convert(pdf_path, start_page=page_index, max_pages=1)
+
+
+def convert_batch_marker(batch):
+    # 在常駐工作行程中依序轉換一批文件，回傳 (模型載入秒數, [(pdf_path, txt_path, 耗時, 錯誤訊息), ...])，
+    # 模型載入秒數只在該行程的第一批回報一次
+    global _marker_load_seconds
+    load_marker_models()
+    load_seconds, _marker_load_seconds = _marker_load_seconds, None
+    results = []
+    for pdf_path, txt_path in batch:
+        started = time.monotonic()
+        try:
+            write_atomic(txt_path, marker_convert(pdf_path))
+            results.append((pdf_path, txt_path, time.monotonic() - started, None))
+        except Exception as e:
+            results.append((pdf_path, txt_path, time.monotonic() - started, str(e)))
+    return load_seconds, results
+
+
+def convert_files_warm(jobs, workers, batch_size):
+    # 常駐工作行程各自載入一次模型後持續消化文件佇列，依完成順序產生 (模型載入秒數, 結果列表)
+    batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_marker_models) as executor:
+        futures = [executor.submit(convert_batch_marker, batch) for batch in batches]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def write_pages_atomic(path, pages, with_markers=False):
+    # 每一頁產生後立即寫入暫存檔，全部完成才改名；回傳寫入的頁數
+    tmp_path = path + '.tmp'
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for page_index, text in pages:
+            if with_markers:
+                f.write(PAGE_MARKER.format(page=page_index + 1))
+            f.write(text)
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def convert_shard_pdfminer(pdf_path, start, end, shard_path):
+    # 在子行程中執行，將這一段的每一頁連同頁碼標記寫入 shard_path，回傳 (起始頁, shard_path)
+    write_pages_atomic(shard_path, pdfminer_pages(pdf_path, set(range(start, end))), with_markers=True)
+    return start, shard_path
+
+
+def convert_shard_marker(pdf_path, start, end, shard_path):
+    # marker 整段轉換，以起始頁的標記作為這一段的開頭
+    text = marker_convert(pdf_path, start_page=start, max_pages=end - start)
+    write_pages_atomic(shard_path, [(start, text)], with_markers=True)
+    return start, shard_path
+
+
+def stitch_shards(output_path, shard_paths):
+    # 依頁碼順序以串流方式把各段的暫存檔接成最終輸出，不需要把整份文件讀進記憶體
+    # 接到一半失敗時刪除暫存檔，保留原本的輸出
+    tmp_path = output_path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as output:
+            for shard_path in shard_paths:
+                with open(shard_path, 'rb') as shard:
+                    shutil.copyfileobj(shard, output, 1024 * 1024)
+    except Exception:
+        remove_files([tmp_path])
+        raise
+    os.replace(tmp_path, output_path)
+
+
+def remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def convert_files_sharded(jobs, convert_shard, shard_pages, workers, initializer=None):
+    # 將每個 PDF 依頁數切成多段，所有文件的每一段都丟進同一個行程池，
+    # 某個文件的所有段落完成後立即接回並寫出，依完成順序產生 ((pdf_path, 頁數, 錯誤訊息), txt_path)
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer) as executor:
+        futures = {}
+        files = {}
+        for pdf_path, txt_path in jobs:
+            try:
+                page_count = count_pages(pdf_path)
+            except Exception as e:
+                yield (pdf_path, 0, str(e)), txt_path
+                continue
+            ranges = page_ranges(page_count, shard_pages)
+            files[pdf_path] = {'txt_path': txt_path, 'pages': page_count, 'remaining': len(ranges),
+                               'shards': [], 'error': None}
+            for start, end in ranges:
+                shard_path = f'{txt_path}.{start:06d}.shard'
+                files[pdf_path]['shards'].append(shard_path)
+                futures[executor.submit(convert_shard, pdf_path, start, end, shard_path)] = pdf_path
+            if not ranges:
+                write_atomic(txt_path, '')
+                yield (pdf_path, 0, None), txt_path
+
+        for future in as_completed(futures):
+            pdf_path = futures[future]
+            state = files[pdf_path]
+            try:
+                future.result()
+            except Exception as e:
+                state['error'] = state['error'] or str(e)
+            state['remaining'] -= 1
+            if state['remaining']:
+                continue
+
+            if state['error'] is None:
+                try:
+                    stitch_shards(state['txt_path'], state['shards'])
+                except Exception as e:
+                    state['error'] = str(e)
+            remove_files(state['shards'])
+            pages = state['pages'] if state['error'] is None else 0
+            del files[pdf_path]
+            yield (pdf_path, pages, state['error']), state['txt_path']
+
+
+def write_atomic(path, text):
+    # 先寫入暫存檔再改名，中斷時不會留下不完整的輸出
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+NO_CACHE_ENTRY = 'no cache entry'
+
+
+class ConversionCache:
+    # 以 PDF 的 sha256、轉換器名稱與版本以及轉換選項判斷輸出是否需要重新轉換，
+    # 並記錄輸出文件的大小與 sha256，以找出崩潰時留下的不完整輸出。
+    # 快照檔建立之前就存在的輸出沒有紀錄，預設會全部重新轉換；可用 adopt 將它們記錄為目前設定的結果
+    def __init__(self, path, converter, version, options):
+        self.path = path
+        self.converter = converter
+        self.version = version
+        self.options = options
+        self.entries = {}
+        self.pdf_hashes = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def key(self, output_path):
+        return os.path.relpath(output_path, os.path.dirname(self.path))
+
+    def pdf_sha256(self, pdf_path, entry):
+        # PDF 的大小與修改時間都沒變時沿用上次算出的雜湊，避免每次執行都讀完整個語料
+        stat = os.stat(pdf_path)
+        if entry.get('pdf_size') == stat.st_size and entry.get('pdf_mtime_ns') == stat.st_mtime_ns:
+            digest = entry['pdf_sha256']
+        else:
+            digest = file_sha256(pdf_path)
+        self.pdf_hashes[pdf_path] = (digest, stat.st_size, stat.st_mtime_ns)
+        return digest
+
+    def stale_reason(self, pdf_path, output_path):
+        entry = self.entries.get(self.key(output_path), {})
+        pdf_sha256 = self.pdf_sha256(pdf_path, entry)
+        if not os.path.exists(output_path):
+            return 'output missing'
+        if not entry:
+            return NO_CACHE_ENTRY
+        if entry['pdf_sha256'] != pdf_sha256:
+            return 'PDF changed'
+        if (entry['converter'], entry['version']) != (self.converter, self.version):
+            return f"converted by {entry['converter']} {entry['version']}"
+        if entry['options'] != self.options:
+            return 'options changed'
+        if os.path.getsize(output_path) != entry['output_size'] or file_sha256(output_path) != entry['output_sha256']:
+            return 'output incomplete or modified'
+        return None
+
+    def adopt(self, pdf_path, output_path):
+        # 將沒有紀錄的既有輸出視為以目前的轉換器與選項產生；空白的輸出仍需重新轉換。回傳是否已記錄
+        if self.key(output_path) in self.entries or not os.path.exists(output_path):
+            return False
+        if os.path.getsize(output_path) == 0:
+            return False
+        self.record(pdf_path, output_path, save=False)
+        return True
+
+    def record(self, pdf_path, output_path, save=True):
+        if pdf_path not in self.pdf_hashes:
+            self.pdf_sha256(pdf_path, {})
+        pdf_sha256, pdf_size, pdf_mtime_ns = self.pdf_hashes[pdf_path]
+        self.entries[self.key(output_path)] = {
+            'pdf_sha256': pdf_sha256,
+            'pdf_size': pdf_size,
+            'pdf_mtime_ns': pdf_mtime_ns,
+            'converter': self.converter,
+            'version': self.version,
+            'options': self.options,
+            'output_size': os.path.getsize(output_path),
+            'output_sha256': file_sha256(output_path),
+        }
+        if save:
+            self.save()
+
+    def save(self):
+        write_atomic(self.path, json.dumps(self.entries, ensure_ascii=False, indent=2))
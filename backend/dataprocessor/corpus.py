@@ -0,0 +1,181 @@
+# dataprocessor/corpus.py
+
+import os
+import re
+import json
+import mmap
+
+# 不依賴 Django 設定，讓 openai_test.py 這類獨立腳本也能直接使用
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# 分段轉換（convert_pdf_to_txt* --shard-pages、hybrid）插入的頁碼標記，以及 pdfminer 的換頁字元
+PAGE_MARKER_RE = re.compile(rb'<!-- page (\d+) -->\n')
+FORM_FEED = b'\x0c'
+ISSUE_RE = re.compile(r'第(\d+)期')
+
+
+class Document:
+    # 以 mmap 開啟單一 TXT 或合併後的 MD，依預先計算的頁碼與章節位置回傳不複製資料的 memoryview。
+    # 呼叫 close() 之前必須先釋放（release 或不再引用）所有回傳的 memoryview，否則 mmap 會拒絕關閉。
+    def __init__(self, path, fragments=None):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.view = memoryview(self.mm)
+        self.sections = {}
+        for fragment in fragments or []:
+            self.sections[fragment['pages']] = (fragment['offset'], fragment['offset'] + fragment['length'])
+        self.page_spans = self.load_page_index(fragments or [])
+
+    def load_page_index(self, fragments):
+        # 頁碼索引存成旁邊的 .pages.json，文件大小或修改時間改變時才重新掃描
+        index_path = self.path + '.pages.json'
+        stat = os.stat(self.path)
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('size') == stat.st_size and index.get('mtime_ns') == stat.st_mtime_ns:
+                return {int(page): tuple(span) for page, span in index['pages'].items()}
+
+        page_spans = self.scan_pages(fragments)
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                       'pages': {str(page): span for page, span in page_spans.items()}}, f)
+        os.replace(tmp_path, index_path)
+        return page_spans
+
+    def scan_pages(self, fragments):
+        size = len(self.view)
+        markers = [(int(match.group(1)), match.end(), match.start()) for match in PAGE_MARKER_RE.finditer(self.mm)]
+        if markers:
+            # 有頁碼標記時，每一頁從標記之後開始，到下一個標記為止
+            return {page: (start, markers[i + 1][2] if i + 1 < len(markers) else size)
+                    for i, (page, start, _) in enumerate(markers)}
+
+        if fragments:
+            # 合併後的 MD 只知道每個片段涵蓋的頁碼範圍，範圍內的每一頁都對應到整個片段
+            spans = {}
+            for fragment in fragments:
+                span = (fragment['offset'], fragment['offset'] + fragment['length'])
+                for page in range(fragment['start_page'], fragment['end_page'] + 1):
+                    spans.setdefault(page, span)
+            return spans
+
+        # pdfminer 的輸出以換頁字元分隔每一頁
+        spans = {}
+        start = 0
+        page = 1
+        while start < size:
+            end = self.mm.find(FORM_FEED, start)
+            if end == -1:
+                end = size
+            spans[page] = (start, end)
+            start = end + 1
+            page += 1
+        return spans
+
+    @property
+    def page_count(self):
+        return max(self.page_spans) if self.page_spans else 0
+
+    def pages(self, first, last=None):
+        last = first if last is None else last
+        spans = [self.page_spans[page] for page in range(first, last + 1) if page in self.page_spans]
+        if not spans:
+            raise KeyError(f'{self.path} 沒有第 {first}-{last} 頁')
+        return self.view[min(start for start, _ in spans):max(end for _, end in spans)]
+
+    def section(self, section_id):
+        start, end = self.sections[section_id]
+        return self.view[start:end]
+
+    def slice(self, start, end):
+        return self.view[start:end]
+
+    def close(self):
+        self.view.release()
+        if self.mm:
+            self.mm.close()
+        self.file.close()
+
+
+class GazetteCorpus:
+    # data/txt 與 data/merged_md 的存取層，只在需要時開啟文件並重複使用已開啟的 mmap
+    def __init__(self, base_dir=None, txt_dirname='txt'):
+        # txt_dirname 可改為 clean_txt，讀取去除頁首頁尾後的文字
+        base_dir = base_dir or DATA_DIR
+        self.txt_dir = os.path.join(base_dir, txt_dirname)
+        self.merged_md_dir = os.path.join(base_dir, 'merged_md')
+        self.documents = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def issues(self):
+        issues = set()
+        for directory in (self.txt_dir, self.merged_md_dir):
+            if os.path.isdir(directory):
+                for name in os.listdir(directory):
+                    match = ISSUE_RE.search(name)
+                    if match:
+                        issues.add(int(match.group(1)))
+        return sorted(issues)
+
+    def txt_files(self, issue):
+        issue_dir = os.path.join(self.txt_dir, f'第{issue:02d}期')
+        if not os.path.isdir(issue_dir):
+            return []
+        return [os.path.join(issue_dir, name) for name in sorted(os.listdir(issue_dir)) if name.endswith('.txt')]
+
+    def open(self, path, fragments=None):
+        if path not in self.documents:
+            self.documents[path] = Document(path, fragments)
+        return self.documents[path]
+
+    def txt(self, issue, name=None):
+        # 一期可能有多個 TXT；未指定名稱時取第一個
+        files = self.txt_files(issue)
+        if name is not None:
+            files = [path for path in files if os.path.basename(path) in (name, f'{name}.txt')]
+        if not files:
+            raise KeyError(f'找不到第{issue:02d}期的 TXT 文件 {name or ""}'.strip())
+        return self.open(files[0])
+
+    def merged_md(self, issue):
+        path = os.path.join(self.merged_md_dir, f'第{issue:02d}期公報.md')
+        if path in self.documents:
+            return self.documents[path]
+        index_path = os.path.join(self.merged_md_dir, f'第{issue:02d}期公報.index.json')
+        fragments = []
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                fragments = json.load(f).get('fragments', [])
+        return self.open(path, fragments)
+
+    def pages(self, issue, first, last=None, source='merged_md'):
+        document = self.merged_md(issue) if source == 'merged_md' else self.txt(issue)
+        return document.pages(first, last)
+
+    def section(self, issue, section_id):
+        # 章節可以是合併 MD 中的 p<start>-p<end> 片段，或是該期某個 TXT 文件的檔名
+        md_path = os.path.join(self.merged_md_dir, f'第{issue:02d}期公報.md')
+        if os.path.exists(md_path):
+            document = self.merged_md(issue)
+            if section_id in document.sections:
+                return document.section(section_id)
+        document = self.txt(issue, section_id)
+        return document.view[:]
+
+    def close(self):
+        for document in self.documents.values():
+            document.close()
+        self.documents = {}
+
+
+def as_text(view):
+    return bytes(view).decode('utf-8', errors='replace')
@@ -0,0 +1,167 @@
+# dataprocessor/management/commands/benchmark_converters.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import sys
+import argparse
+import json
+import time
+import shutil
+import logging
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from dataprocessor.synthetic_gazette import write_synthetic_gazette
+from dataprocessor.conversion import marker_available
+
+MODES = ['pdfminer', 'pdfminer_parallel', 'pdfminer_sharded', 'marker', 'marker_batch', 'marker_sharded', 'hybrid']
+# 沒有安裝 marker 時略過的模式；hybrid 仍會執行，被標記的頁面保留 pdfminer 的結果並在報告中列為略過
+MARKER_MODES = {'marker', 'marker_batch', 'marker_sharded'}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the PDF converters on a synthetic gazette corpus and report the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=str, default='20,100', help='Comma-separated page counts of the synthetic PDFs')
+        parser.add_argument('--modes', type=str, default=','.join(MODES), help='Comma-separated converter modes to run')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Workers used by parallel modes')
+        parser.add_argument('--shard-pages', type=int, default=25, help='Pages per shard used by sharded modes')
+        parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+        parser.add_argument('--corpus-dir', type=str, default=None, help='Keep the synthetic corpus in this directory')
+        # 以下參數供每個模式在獨立子行程中執行時使用，讓峰值 RSS 互不影響
+        parser.add_argument('--run-mode', type=str, default=None, help=argparse.SUPPRESS)
+        parser.add_argument('--input-dir', type=str, default=None, help=argparse.SUPPRESS)
+        parser.add_argument('--output-dir', type=str, default=None, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['run_mode']:
+            self.run_mode(options)
+            return
+
+        modes = [mode for mode in options['modes'].split(',') if mode]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+
+        corpus_dir = options['corpus_dir'] or tempfile.mkdtemp(prefix='gazette-benchmark-')
+        os.makedirs(corpus_dir, exist_ok=True)
+        page_counts = [int(pages) for pages in options['pages'].split(',') if pages]
+        started = time.monotonic()
+        for issue, pages in enumerate(page_counts, start=1):
+            write_synthetic_gazette(os.path.join(corpus_dir, f'第{issue:02d}期公報.pdf'), pages, issue=issue, seed=issue)
+        generation_seconds = time.monotonic() - started
+
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'commit': self.git_commit(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'corpus': {'files': len(page_counts), 'pages': sum(page_counts), 'page_counts': page_counts,
+                       'generation_seconds': round(generation_seconds, 3)},
+            'workers': options['workers'],
+            'shard_pages': options['shard_pages'],
+            'results': {},
+        }
+        try:
+            for mode in modes:
+                if mode in MARKER_MODES and not marker_available():
+                    report['results'][mode] = {'skipped': 'marker is not installed'}
+                    continue
+                report['results'][mode] = self.run_in_subprocess(mode, corpus_dir, options)
+        finally:
+            if not options['corpus_dir']:
+                shutil.rmtree(corpus_dir, ignore_errors=True)
+
+        for result in report['results'].values():
+            if 'wall_seconds' in result:
+                result['pages_per_second'] = round(sum(page_counts) / max(result['wall_seconds'], 1e-6), 2)
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def run_in_subprocess(self, mode, corpus_dir, options):
+        output_dir = tempfile.mkdtemp(prefix=f'gazette-benchmark-{mode}-')
+        command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_converters',
+                   '--run-mode', mode, '--input-dir', corpus_dir, '--output-dir', output_dir,
+                   '--workers', str(options['workers']), '--shard-pages', str(options['shard_pages'])]
+        try:
+            completed = subprocess.run(command, capture_output=True, text=True)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        if completed.returncode != 0:
+            return {'error': completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'failed'}
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def run_mode(self, options):
+        # 在子行程中執行單一模式，最後一行輸出 JSON 結果
+        logging.basicConfig(level=logging.WARNING)
+        logger = logging.getLogger(__name__)
+        mode = options['run_mode']
+        input_dir, output_dir = options['input_dir'], options['output_dir']
+        workers, shard_pages = options['workers'], options['shard_pages']
+
+        started = time.monotonic()
+        if mode.startswith('pdfminer'):
+            from dataprocessor.management.commands.convert_pdf_to_txt_easy import Command as Converter
+            kwargs = {
+                'pdfminer': {'workers': 1},
+                'pdfminer_parallel': {'workers': workers},
+                'pdfminer_sharded': {'workers': workers, 'shard_pages': shard_pages},
+            }[mode]
+        elif mode.startswith('marker'):
+            from dataprocessor.management.commands.convert_pdf_to_txt import Command as Converter
+            kwargs = {
+                'marker': {},
+                'marker_batch': {'workers': workers, 'batch': True},
+                'marker_sharded': {'workers': workers, 'shard_pages': shard_pages, 'batch': True},
+            }[mode]
+        else:
+            from dataprocessor.management.commands.convert_pdf_to_txt_hybrid import Command as Converter
+            kwargs = {'workers': workers}
+        summary = Converter().process_directory(input_dir, output_dir, logger, **kwargs)
+        wall_seconds = time.monotonic() - started
+
+        output_bytes = sum(os.path.getsize(os.path.join(root, name))
+                           for root, _, files in os.walk(output_dir) for name in files if name.endswith('.txt'))
+        result = {
+            'wall_seconds': round(wall_seconds, 3),
+            'cpu_seconds': round(self.cpu_seconds(), 3),
+            'peak_rss_mb': round(self.peak_rss_mb(), 1),
+            'output_bytes': output_bytes,
+        }
+        if mode == 'hybrid' and summary:
+            # 交給 marker 但沒有轉換成功的頁面（marker 未安裝或轉換失敗）保留 pdfminer 的結果
+            result['marker_pages'] = {
+                'routed': summary['marker_routed'],
+                'converted': summary['marker_converted'],
+                'skipped': summary['marker_routed'] - summary['marker_converted'],
+            }
+            if not marker_available():
+                result['marker_pages']['skipped_reason'] = 'marker is not installed'
+        self.stdout.write(json.dumps(result))
+
+    def cpu_seconds(self):
+        usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+        return sum(u.ru_utime + u.ru_stime for u in usage)
+
+    def peak_rss_mb(self):
+        # ru_maxrss 在 Linux 以 KB、在 macOS 以 bytes 為單位；取本行程與工作行程中較大者
+        peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR).stdout.strip() or None
+        except OSError:
+            return None
+
+# 使用方法：python manage.py benchmark_converters [--pages 20,100,500] [--modes pdfminer,hybrid] [--workers N] [--output bench.json]
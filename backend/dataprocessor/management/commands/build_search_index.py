@@ -0,0 +1,33 @@
+# dataprocessor/management/commands/build_search_index.py
+
+import os
+import time
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from dataprocessor.corpus import GazetteCorpus
+from dataprocessor.search_index import SearchIndex
+
+
+class Command(BaseCommand):
+    help = '建立或增量更新 data/txt 與 data/merged_md 的本地全文索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['txt', 'merged_md'], action='append', help='索引的來源，可重複指定；預設兩者皆索引')
+        parser.add_argument('--index-dir', type=str, default=None, help='索引目錄，預設為 data/index')
+        parser.add_argument('--clean', action='store_true', help='使用 strip_boilerplate 輸出的 data/clean_txt 取代 data/txt')
+        parser.add_argument('--force', action='store_true', help='忽略檔案大小與修改時間，重建所有文件的索引')
+
+    def handle(self, *args, **options):
+        data_dir = os.path.join(settings.BASE_DIR, 'data')
+        index = SearchIndex(options['index_dir'] or os.path.join(data_dir, 'index'))
+        sources = options['source'] or ['txt', 'merged_md']
+
+        started = time.monotonic()
+        with GazetteCorpus(data_dir, 'clean_txt' if options['clean'] else 'txt') as corpus:
+            counts = index.update(corpus, data_dir, sources, options['force'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"索引完成：新增 {counts['added']}、更新 {counts['updated']}、移除 {counts['removed']}、"
+            f"未變動 {counts['unchanged']} 份文件（{time.monotonic() - started:.2f} 秒）"))
+
+# 使用方法：python manage.py build_search_index [--source txt] [--force]
@@ -0,0 +1,96 @@
+# dataprocessor/management/commands/chunk_gazette.py
+
+import os
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from dataprocessor.corpus import GazetteCorpus
+from dataprocessor.chunker import (chunk_document, token_counter, ChunkLedger,
+                                   DEFAULT_MAX_TOKENS, DEFAULT_OVERLAP_TOKENS)
+from dataprocessor.vector_store import LocalVectorStore, HashingEmbedding, OpenAIEmbedding
+
+
+class Command(BaseCommand):
+    help = '將會議紀錄切成有 token 上限的 chunk，略過已處理過的內容，並可寫入本地向量庫'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--issue', type=int, action='append', help='只處理指定期數，可重複指定')
+        parser.add_argument('--source', choices=['txt', 'merged_md'], default='txt', help='切分的來源文件')
+        parser.add_argument('--max-tokens', type=int, default=DEFAULT_MAX_TOKENS, help='每個 chunk 的 token 上限')
+        parser.add_argument('--overlap-tokens', type=int, default=DEFAULT_OVERLAP_TOKENS, help='相鄰 chunk 重疊的 token 上限')
+        parser.add_argument('--encoding', type=str, default='cl100k_base', help='計算 token 數使用的 tiktoken 編碼')
+        parser.add_argument('--clean', action='store_true', help='使用 strip_boilerplate 輸出的 data/clean_txt 取代 data/txt')
+        parser.add_argument('--embed', action='store_true', help='將新的 chunk 寫入 data/vector_store')
+        parser.add_argument('--embedding', choices=['hashing', 'openai'], default='hashing', help='嵌入函式')
+
+    def handle(self, *args, **options):
+        data_dir = os.path.join(settings.BASE_DIR, 'data')
+        output_dir = os.path.join(data_dir, 'chunks', options['source'])
+        # 每個輸出各自記錄處理過的 chunk：只寫 JSONL 的執行不會讓之後 --embed 的執行略過這些 chunk
+        ledger = ChunkLedger(os.path.join(output_dir, 'seen.txt'))
+        count_tokens = token_counter(options['encoding'])
+        store = self.vector_store(data_dir, options['embedding']) if options['embed'] else None
+        store_ledger = ChunkLedger(os.path.join(store.directory, 'seen.txt')) if store is not None else None
+
+        started = time.monotonic()
+        with GazetteCorpus(data_dir, 'clean_txt' if options['clean'] else 'txt') as corpus:
+            issues = options['issue'] or corpus.issues()
+            if not issues:
+                raise CommandError('找不到任何公報文件')
+            os.makedirs(output_dir, exist_ok=True)
+            for issue in issues:
+                chunks = self.chunk_issue(corpus, issue, options, data_dir, count_tokens)
+                new_chunks = list(ledger.filter(chunks))
+                self.write_chunks(os.path.join(output_dir, f'第{issue:02d}期.jsonl'), new_chunks)
+                # 新 chunk 寫出後才記錄為已處理
+                ledger.save()
+                message = f'第{issue:02d}期：新增 {len(new_chunks)} 個 chunk'
+                if store is not None:
+                    embed_chunks = list(store_ledger.filter(chunks))
+                    if embed_chunks:
+                        store.add_texts([chunk['text'] for chunk in embed_chunks],
+                                        [{key: value for key, value in chunk.items() if key != 'text'}
+                                         for chunk in embed_chunks])
+                    store_ledger.save()
+                    message += f'，嵌入 {len(embed_chunks)} 個 chunk'
+                self.stdout.write(message)
+
+        stats = ledger.stats
+        self.stdout.write(self.style.SUCCESS(
+            f"共 {stats['chunks']} 個 chunk，略過 {stats['duplicate_chunks']} 個重複的 chunk，"
+            f"節省 {stats['saved_bytes']} / {stats['bytes']} 位元組、{stats['saved_tokens']} / {stats['tokens']} tokens"
+            f"（{time.monotonic() - started:.2f} 秒）"))
+        if store_ledger is not None:
+            self.stdout.write(self.style.SUCCESS(
+                f"向量庫略過 {store_ledger.stats['duplicate_chunks']} 個已嵌入的 chunk，"
+                f"節省 {store_ledger.stats['saved_tokens']} / {store_ledger.stats['tokens']} tokens"))
+
+    def chunk_issue(self, corpus, issue, options, data_dir, count_tokens):
+        if options['source'] == 'merged_md':
+            md_path = os.path.join(corpus.merged_md_dir, f'第{issue:02d}期公報.md')
+            documents = [corpus.merged_md(issue)] if os.path.exists(md_path) else []
+        else:
+            documents = [corpus.open(path) for path in corpus.txt_files(issue)]
+
+        chunks = []
+        for document in documents:
+            relative_path = os.path.relpath(document.path, data_dir)
+            chunks.extend({'issue': issue, 'source': relative_path, **chunk} for chunk in
+                          chunk_document(document, count_tokens, options['max_tokens'], options['overlap_tokens']))
+        return chunks
+
+    def write_chunks(self, path, chunks):
+        with open(path, 'a', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False) + '\n')
+
+    def vector_store(self, data_dir, embedding_name):
+        if embedding_name == 'openai':
+            from openai import OpenAI
+            embedding = OpenAIEmbedding(OpenAI())
+        else:
+            embedding = HashingEmbedding()
+        return LocalVectorStore(os.path.join(data_dir, 'vector_store', embedding.name), embedding=embedding)
+
+# 使用方法：python manage.py chunk_gazette [--issue 1] [--max-tokens 512] [--embed --embedding openai]
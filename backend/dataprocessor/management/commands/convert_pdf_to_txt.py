@@ -1,26 +1,62 @@
 # dataprocessor/management/commands/convert_pdf_to_txt.py
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 import os
-import marker
 import logging
+import time
+from importlib import metadata
+from dataprocessor.conversion import (convert_shard_marker, convert_files_sharded, write_atomic, write_pages_atomic,
+                                      marker_pages, count_pages, convert_files_warm, load_marker_models,
+                                      ConversionCache, NO_CACHE_ENTRY)
 
 class Command(BaseCommand):
     help = 'Convert PDF files to TXT in the data/pdf folder and its subfolders'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes used with --shard-pages or --batch')
+        parser.add_argument('--batch', action='store_true',
+                            help='Convert with long-lived workers that load the marker models once')
+        parser.add_argument('--batch-size', type=int, default=4, help='Number of PDFs handed to a worker at a time')
+        parser.add_argument('--shard-pages', type=int, default=0,
+                            help='Split each PDF into ranges of this many pages and convert them in parallel')
+        parser.add_argument('--stream', action='store_true',
+                            help='Convert one page at a time and write each page as soon as it is produced '
+                                 '(cannot be combined with --batch or --shard-pages)')
+        parser.add_argument('--dry-run', action='store_true', help='List the outputs that would be reconverted and exit')
+        parser.add_argument('--adopt-existing', action='store_true',
+                            help='Record existing TXT files without a cache entry as up to date instead of '
+                                 'reconverting them (run once on a corpus converted before the cache existed)')
+
     def handle(self, *args, **options):
         input_dir = settings.MEDIA_ROOT
         output_base_dir = os.path.join(settings.BASE_DIR, 'backend', 'data', 'txt')
 
+        if options['stream'] and (options['batch'] or options['shard_pages'] > 0):
+            # 批次與切段模式以整份文件或頁面範圍為單位轉換，不會逐頁寫出
+            raise CommandError('--stream cannot be combined with --batch or --shard-pages')
+
         logging.basicConfig(level=logging.INFO)
         logger = logging.getLogger(__name__)
 
-        self.process_directory(input_dir, output_base_dir, logger)
+        self.process_directory(input_dir, output_base_dir, logger, options['workers'], options['shard_pages'],
+                               options['dry_run'], options['stream'], options['batch'], options['batch_size'],
+                               options['adopt_existing'])
 
         self.stdout.write(self.style.SUCCESS('PDF to TXT conversion completed'))
 
-    def process_directory(self, input_dir, output_base_dir, logger):
+    def process_directory(self, input_dir, output_base_dir, logger, workers=1, shard_pages=0, dry_run=False,
+                          stream=False, batch=False, batch_size=4, adopt_existing=False):
+        if not os.path.exists(output_base_dir):
+            os.makedirs(output_base_dir)
+        cache_options = {'shard_pages': shard_pages, 'stream': stream}
+        if stream:
+            # 逐頁輸出加上頁碼標記之前的串流結果沒有標記，需要重新轉換
+            cache_options['page_markers'] = True
+        cache = ConversionCache(os.path.join(output_base_dir, '.conversion_cache.json'), 'marker',
+                                self.marker_version(), cache_options)
+        jobs = []
         for root, dirs, files in os.walk(input_dir):
             # 創建對應的輸出目錄
             relative_path = os.path.relpath(root, input_dir)
@@ -33,22 +69,96 @@ class Command(BaseCommand):
                     pdf_path = os.path.join(root, file)
                     txt_path = os.path.join(output_dir, file[:-4] + '.txt')
 
-                    if os.path.exists(txt_path):
-                        logger.info(f"Skipping {file}: TXT file already exists")
+                    reason = cache.stale_reason(pdf_path, txt_path)
+                    if reason is None:
+                        logger.info(f"Skipping {file}: TXT file is up to date")
+                        continue
+                    if reason == NO_CACHE_ENTRY and adopt_existing:
+                        if dry_run:
+                            self.stdout.write(f"Would adopt {txt_path}")
+                            continue
+                        if cache.adopt(pdf_path, txt_path):
+                            logger.info(f"Adopted existing {txt_path}")
+                            continue
+                    if dry_run:
+                        self.stdout.write(f"Would convert {pdf_path}: {reason}")
+                        continue
+
+                    if shard_pages > 0 or batch:
+                        jobs.append((pdf_path, txt_path))
                         continue
 
                     try:
-                        # 使用 Marker 的 Python 接口進行 PDF 到 TXT 的轉換
-                        text = self.convert_pdf_to_txt(pdf_path)
-                        with open(txt_path, 'w', encoding='utf-8') as txt_file:
-                            txt_file.write(text)
+                        if stream:
+                            # 逐頁轉換並立即寫出，記憶體用量只取決於單一頁面；各頁以頁碼標記分開，與切段模式的輸出一致
+                            write_pages_atomic(txt_path, marker_pages(pdf_path, range(count_pages(pdf_path))),
+                                               with_markers=True)
+                        else:
+                            # 使用 Marker 的 Python 接口進行 PDF 到 TXT 的轉換
+                            text = self.convert_pdf_to_txt(pdf_path)
+                            write_atomic(txt_path, text)
+                        cache.record(pdf_path, txt_path)
                         logger.info(f"Converted {pdf_path} to {txt_path}")
                     except Exception as e:
                         logger.error(f"Error converting {pdf_path}: {str(e)}")
 
+        if adopt_existing and not dry_run:
+            # adopt 不會逐筆寫入快照檔，走訪完成後一次寫入
+            cache.save()
+
+        if jobs and shard_pages > 0:
+            # 單一大型公報依頁數切段，交給多個行程以 marker 轉換後依頁碼順序接回；
+            # 批次模式下這些行程也只載入一次模型
+            initializer = load_marker_models if batch else None
+            for (pdf_path, pages, error), txt_path in convert_files_sharded(jobs, convert_shard_marker,
+                                                                            shard_pages, workers, initializer):
+                if error:
+                    logger.error(f"Error converting {pdf_path}: {error}")
+                else:
+                    cache.record(pdf_path, txt_path)
+                    logger.info(f"Converted {pdf_path} to {txt_path} ({pages} pages)")
+
+        elif jobs:
+            self.convert_in_batches(jobs, workers, batch_size, cache, logger)
+
+    def convert_in_batches(self, jobs, workers, batch_size, cache, logger):
+        started = time.monotonic()
+        load_times = []
+        latencies = []
+        for load_seconds, results in convert_files_warm(jobs, workers, batch_size):
+            if load_seconds is not None:
+                load_times.append(load_seconds)
+            for pdf_path, txt_path, latency, error in results:
+                if error:
+                    logger.error(f"Error converting {pdf_path}: {error}")
+                    continue
+                cache.record(pdf_path, txt_path)
+                latencies.append(latency)
+                logger.info(f"Converted {pdf_path} to {txt_path} in {latency:.1f}s")
+
+        if not latencies:
+            return
+        # 原本的冷啟動路徑每份文件都要重新載入模型；這裡沒有實際以冷啟動轉換，
+        # 而是以實測的模型載入時間加上常駐行程的轉換時間估算，輸出時標明為估計值
+        warm = sum(latencies) / len(latencies)
+        load = sum(load_times) / len(load_times) if load_times else 0.0
+        logger.info(f"Batch conversion: {len(latencies)} documents in {time.monotonic() - started:.1f}s "
+                    f"with {workers} workers; model load {load:.1f}s per worker")
+        logger.info(f"Per-document latency: warm {warm:.1f}s (measured) vs cold path {warm + load:.1f}s "
+                    f"(estimated as warm + model load, {(warm + load) / max(warm, 1e-6):.1f}x)")
+
+    def marker_version(self):
+        try:
+            return metadata.version('marker-pdf')
+        except metadata.PackageNotFoundError:
+            import marker
+            return getattr(marker, '__version__', 'unknown')
+
     def convert_pdf_to_txt(self, pdf_path):
+        import marker
+
         # 使用 marker 進行 PDF 到 Markdown 的轉換
         markdown_text = marker.convert_single_pdf(pdf_path)
         return markdown_text
 
-# 使用方法：python manage.py convert_pdf_to_txt
\ No newline at end of file
+# 使用方法：python manage.py convert_pdf_to_txt [--batch --workers N --batch-size M] [--shard-pages PAGES] [--stream] [--dry-run] [--adopt-existing]
\ No newline at end of file
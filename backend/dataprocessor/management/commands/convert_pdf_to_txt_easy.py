@@ -3,12 +3,36 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
 import os
-from pdfminer.high_level import extract_text
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pdfminer
+from dataprocessor.conversion import (pdfminer_pages, convert_shard_pdfminer, convert_files_sharded,
+                                      write_pages_atomic, ConversionCache, NO_CACHE_ENTRY)
 import logging
 
+
+def convert_file(pdf_path, txt_path):
+    # 在子行程中執行，因此放在模組層級以便 pickle；回傳 (pdf_path, 頁數, 錯誤訊息)
+    try:
+        # 逐頁寫出，記憶體用量只取決於單一頁面
+        pages = write_pages_atomic(txt_path, pdfminer_pages(pdf_path))
+        return pdf_path, pages, None
+    except Exception as e:
+        return pdf_path, 0, str(e)
+
+
 class Command(BaseCommand):
     help = 'Convert PDF files to TXT in the backend/data/pdf folder and its subfolders'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes used for conversion')
+        parser.add_argument('--shard-pages', type=int, default=0,
+                            help='Split each PDF into ranges of this many pages and convert them in parallel')
+        parser.add_argument('--dry-run', action='store_true', help='List the outputs that would be reconverted and exit')
+        parser.add_argument('--adopt-existing', action='store_true',
+                            help='Record existing TXT files without a cache entry as up to date instead of '
+                                 'reconverting them (run once on a corpus converted before the cache existed)')
+
     def handle(self, *args, **options):
         input_dir = os.path.join(settings.BASE_DIR, 'data', 'pdf')
         output_base_dir = os.path.join(settings.BASE_DIR, 'data', 'txt')
@@ -16,11 +40,18 @@ class Command(BaseCommand):
         logging.basicConfig(level=logging.INFO)
         logger = logging.getLogger(__name__)
 
-        self.process_directory(input_dir, output_base_dir, logger)
+        self.process_directory(input_dir, output_base_dir, logger, options['workers'], options['shard_pages'],
+                               options['dry_run'], options['adopt_existing'])
 
         self.stdout.write(self.style.SUCCESS('PDF to TXT conversion completed'))
 
-    def process_directory(self, input_dir, output_base_dir, logger):
+    def process_directory(self, input_dir, output_base_dir, logger, workers=1, shard_pages=0, dry_run=False,
+                          adopt_existing=False):
+        if not os.path.exists(output_base_dir):
+            os.makedirs(output_base_dir)
+        cache = ConversionCache(os.path.join(output_base_dir, '.conversion_cache.json'), 'pdfminer',
+                                pdfminer.__version__, {'shard_pages': shard_pages})
+        jobs = []
         for root, dirs, files in os.walk(input_dir):
             # 創建對應的輸出目錄
             relative_path = os.path.relpath(root, input_dir)
@@ -33,16 +64,68 @@ class Command(BaseCommand):
                     pdf_path = os.path.join(root, file)
                     txt_path = os.path.join(output_dir, file[:-4] + '.txt')
 
-                    if os.path.exists(txt_path):
-                        logger.info(f"Skipping {file}: TXT file already exists")
+                    reason = cache.stale_reason(pdf_path, txt_path)
+                    if reason is None:
+                        logger.info(f"Skipping {file}: TXT file is up to date")
+                        continue
+                    if reason == NO_CACHE_ENTRY and adopt_existing:
+                        if dry_run:
+                            self.stdout.write(f"Would adopt {txt_path}")
+                            continue
+                        if cache.adopt(pdf_path, txt_path):
+                            logger.info(f"Adopted existing {txt_path}")
+                            continue
+                    if dry_run:
+                        self.stdout.write(f"Would convert {pdf_path}: {reason}")
                         continue
 
-                    try:
-                        text = extract_text(pdf_path)
-                        with open(txt_path, 'w', encoding='utf-8') as txt_file:
-                            txt_file.write(text)
-                        logger.info(f"Converted {pdf_path} to {txt_path}")
-                    except Exception as e:
-                        logger.error(f"Error converting {pdf_path}: {str(e)}")
+                    jobs.append((pdf_path, txt_path))
+
+        if adopt_existing and not dry_run:
+            # adopt 不會逐筆寫入快照檔，走訪完成後一次寫入
+            cache.save()
+
+        if dry_run:
+            return
+
+        started = time.monotonic()
+        if shard_pages > 0:
+            # 單一大型公報也能分散到多個核心，依頁碼順序接回並加上頁碼標記
+            results = []
+            for result, txt_path in convert_files_sharded(jobs, convert_shard_pdfminer, shard_pages, workers):
+                self.record_result(result, txt_path, logger, cache)
+                results.append((result, txt_path))
+        elif workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(convert_file, pdf_path, txt_path): txt_path for pdf_path, txt_path in jobs}
+                results = []
+                for future in as_completed(futures):
+                    self.record_result(future.result(), futures[future], logger, cache)
+                    results.append((future.result(), futures[future]))
+        else:
+            results = []
+            for pdf_path, txt_path in jobs:
+                result = convert_file(pdf_path, txt_path)
+                self.record_result(result, txt_path, logger, cache)
+                results.append((result, txt_path))
+
+        self.log_summary([result for result, _ in results], time.monotonic() - started, logger)
+
+    def record_result(self, result, txt_path, logger, cache):
+        pdf_path, pages, error = result
+        if error:
+            logger.error(f"Error converting {pdf_path}: {error}")
+        else:
+            cache.record(pdf_path, txt_path)
+            logger.info(f"Converted {pdf_path} to {txt_path} ({pages} pages)")
+
+    def log_summary(self, results, elapsed, logger):
+        pages = sum(result[1] for result in results)
+        failures = [result[0] for result in results if result[2]]
+        elapsed = max(elapsed, 1e-6)
+        logger.info(f"Converted {len(results) - len(failures)} files, {pages} pages in {elapsed:.1f}s "
+                    f"({pages / elapsed:.2f} pages/sec), {len(failures)} failures")
+        for pdf_path in failures:
+            logger.info(f"Failed: {pdf_path}")
 
-# 使用方法：python manage.py convert_pdf_to_txt_easy
\ No newline at end of file
+# 使用方法：python manage.py convert_pdf_to_txt_easy [--workers N] [--shard-pages PAGES] [--dry-run] [--adopt-existing]
@@ -0,0 +1,179 @@
+# dataprocessor/management/commands/convert_pdf_to_txt_hybrid.py
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import os
+import time
+import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pdfminer
+from dataprocessor.conversion import (PAGE_MARKER, pdfminer_layout_pages, score_page, convert_page_marker,
+                                      load_marker_models, marker_available, ConversionCache, NO_CACHE_ENTRY)
+
+
+class Command(BaseCommand):
+    help = 'Convert PDF files to TXT with pdfminer, routing only low-quality pages to marker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of warm marker worker processes')
+        parser.add_argument('--min-chars', type=int, default=100,
+                            help='Pages with images and fewer characters than this are sent to marker')
+        parser.add_argument('--garbled-ratio', type=float, default=0.2,
+                            help='Pages whose garbled CJK ratio reaches this value are sent to marker')
+        parser.add_argument('--table-columns', type=int, default=3,
+                            help='Pages with this many aligned columns of short lines are treated as tables')
+        parser.add_argument('--dry-run', action='store_true', help='List the outputs that would be reconverted and exit')
+        parser.add_argument('--adopt-existing', action='store_true',
+                            help='Record existing TXT files without a cache entry as up to date instead of '
+                                 'reconverting them (run once on a corpus converted before the cache existed)')
+
+    def handle(self, *args, **options):
+        input_dir = os.path.join(settings.BASE_DIR, 'data', 'pdf')
+        output_base_dir = os.path.join(settings.BASE_DIR, 'data', 'txt')
+
+        logging.basicConfig(level=logging.INFO)
+        logger = logging.getLogger(__name__)
+
+        thresholds = {
+            'min_chars': options['min_chars'],
+            'garbled_ratio': options['garbled_ratio'],
+            'table_columns': options['table_columns'],
+        }
+        self.process_directory(input_dir, output_base_dir, logger, options['workers'], thresholds, options['dry_run'],
+                               options['adopt_existing'])
+
+        self.stdout.write(self.style.SUCCESS('PDF to TXT conversion completed'))
+
+    def process_directory(self, input_dir, output_base_dir, logger, workers=1, thresholds=None, dry_run=False,
+                          adopt_existing=False):
+        # 回傳 {'pages', 'marker_routed', 'marker_converted'}；沒有需要轉換的文件時回傳 None
+        thresholds = thresholds or {}
+        if not os.path.exists(output_base_dir):
+            os.makedirs(output_base_dir)
+        cache = ConversionCache(os.path.join(output_base_dir, '.conversion_cache.json'), 'hybrid',
+                                f'pdfminer-{pdfminer.__version__}+marker', thresholds)
+        jobs = []
+        for root, dirs, files in os.walk(input_dir):
+            # 創建對應的輸出目錄
+            relative_path = os.path.relpath(root, input_dir)
+            output_dir = os.path.join(output_base_dir, relative_path)
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+
+            for file in files:
+                if file.endswith('.pdf'):
+                    pdf_path = os.path.join(root, file)
+                    txt_path = os.path.join(output_dir, file[:-4] + '.txt')
+
+                    reason = cache.stale_reason(pdf_path, txt_path)
+                    if reason is None:
+                        logger.info(f"Skipping {file}: TXT file is up to date")
+                        continue
+                    if reason == NO_CACHE_ENTRY and adopt_existing:
+                        if dry_run:
+                            self.stdout.write(f"Would adopt {txt_path}")
+                            continue
+                        if cache.adopt(pdf_path, txt_path):
+                            logger.info(f"Adopted existing {txt_path}")
+                            continue
+                    if dry_run:
+                        self.stdout.write(f"Would convert {pdf_path}: {reason}")
+                        continue
+                    jobs.append((pdf_path, txt_path))
+
+        if adopt_existing and not dry_run:
+            # adopt 不會逐筆寫入快照檔，走訪完成後一次寫入
+            cache.save()
+
+        if dry_run or not jobs:
+            return
+
+        started = time.monotonic()
+        # 第一輪：pdfminer 逐頁轉換並評分，文字先寫入暫存檔，只記錄每頁的位置
+        spools = {}
+        flagged = []
+        reasons = Counter()
+        total_pages = 0
+        for pdf_path, txt_path in jobs:
+            try:
+                spools[pdf_path] = self.spool_pdfminer_pages(pdf_path, txt_path, thresholds)
+            except Exception as e:
+                logger.error(f"Error converting {pdf_path}: {str(e)}")
+                continue
+            for page_index, (_, _, page_reasons) in enumerate(spools[pdf_path]['pages']):
+                total_pages += 1
+                if page_reasons:
+                    flagged.append((pdf_path, page_index))
+                    reasons.update(page_reasons)
+
+        # 第二輪：只把被標記的頁面交給常駐的 marker 工作行程
+        marker_started = time.monotonic()
+        marker_texts = self.convert_flagged_pages(flagged, workers, logger)
+        marker_elapsed = time.monotonic() - marker_started
+
+        for pdf_path, txt_path in jobs:
+            if pdf_path not in spools:
+                continue
+            try:
+                self.merge_pages(spools[pdf_path], txt_path, marker_texts.get(pdf_path, {}))
+                cache.record(pdf_path, txt_path)
+                logger.info(f"Converted {pdf_path} to {txt_path} "
+                            f"({len(marker_texts.get(pdf_path, {}))}/{len(spools[pdf_path]['pages'])} pages via marker)")
+            except Exception as e:
+                logger.error(f"Error converting {pdf_path}: {str(e)}")
+            finally:
+                os.remove(spools[pdf_path]['path'])
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        logger.info(f"Hybrid conversion: {total_pages} pages in {elapsed:.1f}s ({total_pages / elapsed:.2f} pages/sec), "
+                    f"{len(flagged)} pages sent to marker in {marker_elapsed:.1f}s")
+        for reason, count in reasons.most_common():
+            logger.info(f"  {reason}: {count} pages")
+        return {'pages': total_pages, 'marker_routed': len(flagged),
+                'marker_converted': sum(len(texts) for texts in marker_texts.values())}
+
+    def spool_pdfminer_pages(self, pdf_path, txt_path, thresholds):
+        spool_path = txt_path + '.pdfminer'
+        pages = []
+        with open(spool_path, 'wb') as spool:
+            for page_index, text, stats in pdfminer_layout_pages(pdf_path):
+                data = text.encode('utf-8')
+                pages.append((spool.tell(), len(data), score_page(text, stats, **thresholds)))
+                spool.write(data)
+        return {'path': spool_path, 'pages': pages}
+
+    def convert_flagged_pages(self, flagged, workers, logger):
+        marker_texts = {}
+        if not flagged:
+            return marker_texts
+        if not marker_available():
+            # 沒有安裝 marker 時，被標記的頁面保留 pdfminer 的結果
+            logger.warning(f"marker is not installed; keeping pdfminer text for {len(flagged)} flagged pages")
+            return marker_texts
+        with ProcessPoolExecutor(max_workers=workers, initializer=load_marker_models) as executor:
+            futures = {executor.submit(convert_page_marker, pdf_path, page_index): (pdf_path, page_index)
+                       for pdf_path, page_index in flagged}
+            for future in as_completed(futures):
+                pdf_path, page_index = futures[future]
+                try:
+                    marker_texts.setdefault(pdf_path, {})[page_index] = future.result()
+                except Exception as e:
+                    # marker 失敗時保留 pdfminer 的結果
+                    logger.error(f"Error converting page {page_index + 1} of {pdf_path} with marker: {str(e)}")
+        return marker_texts
+
+    def merge_pages(self, spool, txt_path, marker_texts):
+        # 依頁碼順序合併成單一文件，每頁取 marker 或 pdfminer 的結果並加上頁碼標記
+        tmp_path = txt_path + '.tmp'
+        with open(spool['path'], 'rb') as source, open(tmp_path, 'wb') as output:
+            for page_index, (offset, length, _) in enumerate(spool['pages']):
+                output.write(PAGE_MARKER.format(page=page_index + 1).encode('utf-8'))
+                if page_index in marker_texts:
+                    output.write(marker_texts[page_index].encode('utf-8'))
+                else:
+                    source.seek(offset)
+                    output.write(source.read(length))
+        os.replace(tmp_path, txt_path)
+
+# 使用方法：python manage.py convert_pdf_to_txt_hybrid [--workers N] [--min-chars 100] [--garbled-ratio 0.2] [--dry-run] [--adopt-existing]
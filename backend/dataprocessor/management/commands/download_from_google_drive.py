@@ -6,6 +6,12 @@ from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 import io
 import json
+import time
+import hashlib
+import shutil
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -14,6 +20,11 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 class Command(BaseCommand):
     help = '從 Google Drive 下載立法院公報 MD 文件'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='同時下載的文件數')
+        parser.add_argument('--incremental', action='store_true', help='使用 Drive Changes API，只同步上次同步後有變動的文件')
+        parser.add_argument('--state', type=str, default=None, help='增量同步狀態檔路徑，預設為 data/drive_sync.json')
+
     def handle(self, *args, **options):
         creds = self.get_google_drive_creds()
         if not creds or not creds.valid:
@@ -35,6 +46,8 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR('無法獲取 Google Drive 憑證，下載功能將被禁用。'))
             return
 
+        self.creds = creds
+        self._thread_local = threading.local()
         drive_service = build('drive', 'v3', credentials=creds)
         self.stdout.write(self.style.SUCCESS('成功獲取 Google Drive 憑證並建立服務。'))
 
@@ -44,7 +57,11 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR('無法找到目標文件夾，下載功能將被禁用。'))
             return
 
-        self.download_files(drive_service, folder_id, '')
+        if options['incremental']:
+            state_path = options['state'] or os.path.join(settings.BASE_DIR, 'data', 'drive_sync.json')
+            self.sync_incremental(drive_service, folder_id, options['workers'], state_path)
+        else:
+            self.download_files(drive_service, folder_id, '', options['workers'])
 
     def get_google_drive_creds(self):
         token_file = 'token.json'
@@ -59,12 +76,8 @@ class Command(BaseCommand):
 
     def get_target_folder_id(self, drive_service):
         try:
-            results = drive_service.files().list(
-                q="mimeType='application/vnd.google-apps.folder'",
-                spaces='drive',
-                fields='nextPageToken, files(id, name)'
-            ).execute()
-            items = results.get('files', [])
+            items = list(self.list_files(drive_service, "mimeType='application/vnd.google-apps.folder'",
+                                         'id, name'))
 
             if not items:
                 self.stdout.write(self.style.WARNING('未找到任何文件夾。'))
@@ -81,12 +94,10 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.SUCCESS(f"找到目標文件夾 '立法院公報'，ID: {target_folder_id}"))
                 
                 # 在 '立法院公報' 文件夾中查找 'md' 子文件夾
-                sub_results = drive_service.files().list(
-                    q=f"'{target_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and name='md'",
-                    spaces='drive',
-                    fields='files(id, name)'
-                ).execute()
-                sub_items = sub_results.get('files', [])
+                sub_items = list(self.list_files(
+                    drive_service,
+                    f"'{target_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and name='md'",
+                    'id, name'))
                 
                 if sub_items:
                     md_folder_id = sub_items[0]['id']
@@ -103,52 +114,318 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f'獲取文件夾列表時發生錯誤：{str(e)}'))
             return None
 
-    def download_files(self, drive_service, folder_id, current_path):
-        try:
+    def list_folder(self, drive_service, folder_id):
+        return self.list_files(drive_service, f"'{folder_id}' in parents and trashed=false",
+                               'id, name, mimeType, md5Checksum, modifiedTime, size')
+
+    def list_files(self, drive_service, q, fields):
+        # 依 nextPageToken 讀完查詢結果的每一頁
+        page_token = None
+        while True:
             results = drive_service.files().list(
-                q=f"'{folder_id}' in parents",
+                q=q,
                 spaces='drive',
-                fields="nextPageToken, files(id, name, mimeType)"
+                fields=f"nextPageToken, files({fields})",
+                pageSize=1000,
+                pageToken=page_token
             ).execute()
-            items = results.get('files', [])
+            yield from results.get('files', [])
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
 
-            if not items:
-                self.stdout.write(self.style.WARNING(f'文件夾 {current_path} 中未找到文件。'))
-                return
+    def collect_files(self, drive_service, folder_id, current_path, folders=None):
+        # 先走訪整個文件夾樹（每一頁都要讀完），收集要下載的文件，再交給執行緒池平行下載
+        files = []
+        if folders is not None:
+            folders[folder_id] = current_path
+        items = list(self.list_folder(drive_service, folder_id))
+        if not items:
+            self.stdout.write(self.style.WARNING(f'文件夾 {current_path} 中未找到文件。'))
+            return files
 
-            for item in items:
-                file_id = item['id']
-                file_name = item['name']
-                mime_type = item['mimeType']
-                
-                new_path = os.path.join(current_path, file_name)
-                
-                if mime_type == 'application/vnd.google-apps.folder':
-                    self.stdout.write(f"處理子文件夾: {new_path}")
-                    new_folder_path = os.path.join(settings.BASE_DIR, 'data', 'md', new_path)
-                    if not os.path.exists(new_folder_path):
-                        os.makedirs(new_folder_path)
-                    self.download_files(drive_service, file_id, new_path)
-                else:
-                    self.download_file(drive_service, file_id, file_name, new_path)
+        for item in items:
+            new_path = os.path.join(current_path, item['name'])
+            if item['mimeType'] == 'application/vnd.google-apps.folder':
+                self.stdout.write(f"處理子文件夾: {new_path}")
+                new_folder_path = os.path.join(settings.BASE_DIR, 'data', 'md', new_path)
+                if not os.path.exists(new_folder_path):
+                    os.makedirs(new_folder_path)
+                files.extend(self.collect_files(drive_service, item['id'], new_path, folders))
+            else:
+                files.append((item, new_path))
+        return files
 
+    def download_files(self, drive_service, folder_id, current_path, workers=4, folders=None):
+        # 回傳 (走訪到的文件, 下載失敗的文件)；走訪失敗時回傳 (None, None)
+        try:
+            files = self.collect_files(drive_service, folder_id, current_path, folders)
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'下載文件時發生錯誤：{str(e)}'))
+            return None, None
+
+        failed = self.download_items(drive_service, files, workers)
+        return files, failed
+
+    def download_items(self, drive_service, files, workers):
+        # 回傳下載失敗的 (item, file_path)，讓增量同步在下次執行時重試
+        started = time.monotonic()
+        progress = {'done': 0, 'skipped': 0, 'failed': 0, 'bytes': 0, 'total': len(files),
+                    'started': started, 'last_report': started}
+        lock = threading.Lock()
+
+        def process(item, file_path):
+            local_path = os.path.join(settings.BASE_DIR, 'data', 'md', file_path)
+            if self.is_up_to_date(item, local_path):
+                return 'skipped', 0
+            if self.download_file(self.thread_drive_service(drive_service), item['id'], item['name'], file_path,
+                                  item.get('modifiedTime')):
+                return 'done', os.path.getsize(local_path)
+            return 'failed', 0
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(process, item, file_path): (item, file_path) for item, file_path in files}
+            for future in as_completed(futures):
+                result, size = future.result()
+                with lock:
+                    progress[result] += 1
+                    progress['bytes'] += size
+                    if result == 'failed':
+                        failed.append(futures[future])
+                    self.report_progress(progress)
+
+        self.report_progress(progress, final=True)
+        return failed
+
+    def sync_incremental(self, drive_service, folder_id, workers, state_path):
+        state = self.load_sync_state(state_path)
+        if state.get('folder_id') != folder_id:
+            # 第一次同步：先取得 startPageToken 再完整走訪，確保同步期間的變動不會遺漏
+            start_page_token = drive_service.changes().getStartPageToken().execute()['startPageToken']
+            folders = {}
+            files, failed = self.download_files(drive_service, folder_id, '', workers, folders)
+            if files is None:
+                return
+            # files 記錄 Drive 上文件對應的本地路徑（供之後處理搬移與刪除）；下載失敗的文件另外記在 pending，下次重試
+            state = {
+                'folder_id': folder_id,
+                'start_page_token': start_page_token,
+                'folders': folders,
+                'files': {item['id']: file_path for item, file_path in files},
+                'pending': {item['id']: item for item, _ in failed},
+            }
+            self.save_sync_state(state_path, state)
+            self.stdout.write(self.style.SUCCESS(f'已完成完整同步，共 {len(files)} 個文件，之後可使用增量同步'))
+            self.report_pending(state)
+            return
+
+        page_token = state['start_page_token']
+        # 上次下載失敗的文件先排入下載，之後的變動會覆蓋它們
+        to_download = list(state.get('pending', {}).values())
+        removed = 0
+        changes = []
+        while page_token:
+            response = drive_service.changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                includeRemoved=True,
+                pageSize=1000,
+                fields='nextPageToken, newStartPageToken, '
+                       'changes(fileId, removed, file(id, name, mimeType, parents, trashed, md5Checksum, modifiedTime))'
+            ).execute()
+            changes.extend(response.get('changes', []))
+            if 'newStartPageToken' in response:
+                state['start_page_token'] = response['newStartPageToken']
+            page_token = response.get('nextPageToken')
+
+        for item in self.apply_changes(state, changes):
+            if item == 'removed':
+                removed += 1
+            elif item is not None:
+                to_download.append(item[0])
 
-    def download_file(self, drive_service, file_id, file_name, file_path):
+        # 同一個文件在多個變動中出現時只下載最後的版本；路徑以套用所有變動後的結果為準（文件夾可能被搬移），
+        # 已經被刪除或移出文件夾的文件不再下載
+        latest = {item['id']: item for item in to_download}
+        files = [(item, state['files'][file_id]) for file_id, item in latest.items() if file_id in state['files']]
+        failed = self.download_items(drive_service, files, workers)
+        state['pending'] = {item['id']: item for item, _ in failed}
+        self.save_sync_state(state_path, state)
+        self.stdout.write(self.style.SUCCESS(
+            f'增量同步完成：處理 {len(changes)} 個變動，更新 {len(files)} 個文件，刪除 {removed} 個文件'))
+        self.report_pending(state)
+
+    def report_pending(self, state):
+        if state['pending']:
+            self.stdout.write(self.style.WARNING(f"{len(state['pending'])} 個文件下載失敗，下次增量同步時重試"))
+
+    def apply_changes(self, state, changes):
+        # 同一份變動清單中，文件的新上層文件夾可能排在文件之後才出現（新建或搬入的文件夾）。
+        # 每個 fileId 只套用最後一次變動；上層文件夾尚未出現的變動延後到其他變動套用之後重試，
+        # 直到沒有進展為止，剩下的才視為已移出同步的文件夾
+        latest = {}
+        for change in changes:
+            latest.pop(change['fileId'], None)
+            latest[change['fileId']] = change
+        remaining = list(latest.values())
+        results = []
+        while True:
+            deferred = []
+            for change in remaining:
+                if self.waiting_for_parent(state, change):
+                    deferred.append(change)
+                else:
+                    results.append(self.apply_change(state, change))
+            if len(deferred) in (0, len(remaining)):
+                break
+            remaining = deferred
+        results.extend(self.apply_change(state, change) for change in deferred)
+        return results
+
+    def waiting_for_parent(self, state, change):
+        item = change.get('file') or {}
+        if change.get('removed') or item.get('trashed'):
+            return False
+        return not any(parent in state['folders'] for parent in item.get('parents') or [])
+
+    def apply_change(self, state, change):
+        file_id = change['fileId']
+        item = change.get('file') or {}
+        parents = item.get('parents') or []
+        parent_path = next((state['folders'][p] for p in parents if p in state['folders']), None)
+        gone = change.get('removed') or item.get('trashed') or parent_path is None
+
+        if item.get('mimeType') == 'application/vnd.google-apps.folder' or file_id in state['folders']:
+            if gone:
+                if file_id in state['folders'] and file_id != state['folder_id']:
+                    self.remove_folder(state, file_id)
+                    return 'removed'
+                return None
+            new_path = os.path.join(parent_path, item['name'])
+            old_path = state['folders'].get(file_id)
+            if old_path is not None and old_path != new_path:
+                self.move_folder(state, old_path, new_path)
+            os.makedirs(self.local_path(new_path), exist_ok=True)
+            state['folders'][file_id] = new_path
+            return None
+
+        old_path = state['files'].get(file_id)
+        if gone:
+            if old_path is None:
+                return None
+            self.remove_local_file(old_path)
+            del state['files'][file_id]
+            return 'removed'
+
+        new_path = os.path.join(parent_path, item['name'])
+        if old_path is not None and old_path != new_path:
+            self.remove_local_file(old_path)
+        state['files'][file_id] = new_path
+        return item, new_path
+
+    def remove_folder(self, state, folder_id):
+        folder_path = state['folders'].pop(folder_id)
+        prefix = folder_path + os.sep
+        state['folders'] = {k: v for k, v in state['folders'].items() if not v.startswith(prefix)}
+        state['files'] = {k: v for k, v in state['files'].items() if not v.startswith(prefix)}
+        shutil.rmtree(self.local_path(folder_path), ignore_errors=True)
+
+    def move_folder(self, state, old_path, new_path):
+        if os.path.exists(self.local_path(old_path)):
+            os.makedirs(os.path.dirname(self.local_path(new_path)), exist_ok=True)
+            os.replace(self.local_path(old_path), self.local_path(new_path))
+        prefix = old_path + os.sep
+        for mapping in (state['folders'], state['files']):
+            for key, value in mapping.items():
+                if value.startswith(prefix):
+                    mapping[key] = new_path + value[len(old_path):]
+
+    def remove_local_file(self, file_path):
+        local_path = self.local_path(file_path)
+        if os.path.exists(local_path):
+            os.remove(local_path)
+
+    def local_path(self, file_path):
+        return os.path.join(settings.BASE_DIR, 'data', 'md', file_path)
+
+    def load_sync_state(self, state_path):
+        if not os.path.exists(state_path):
+            return {}
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_sync_state(self, state_path, state):
+        os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, state_path)
+
+    def report_progress(self, progress, final=False):
+        # 以單行彙總進度與吞吐量，取代每個區塊都輸出一次的進度訊息
+        now = time.monotonic()
+        if not final and now - progress['last_report'] < 2:
+            return
+        progress['last_report'] = now
+        elapsed = max(now - progress['started'], 1e-6)
+        finished = progress['done'] + progress['skipped'] + progress['failed']
+        megabytes = progress['bytes'] / (1024 * 1024)
+        line = (f"進度 {finished}/{progress['total']}：下載 {progress['done']}，略過 {progress['skipped']}，"
+                f"失敗 {progress['failed']}，{megabytes:.1f} MB，{megabytes / elapsed:.2f} MB/s")
+        if final:
+            self.stdout.write(self.style.SUCCESS(line))
+        else:
+            self.stdout.write(line)
+
+    def is_up_to_date(self, item, local_path):
+        # 本地文件的修改時間或 md5 與 Drive 相符時視為已是最新版本
+        if not os.path.exists(local_path):
+            return False
+        modified_time = self.parse_modified_time(item.get('modifiedTime'))
+        if modified_time is not None and int(os.path.getmtime(local_path)) == int(modified_time):
+            return True
+        if item.get('md5Checksum'):
+            digest = hashlib.md5()
+            with open(local_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            return digest.hexdigest() == item['md5Checksum']
+        return False
+
+    def parse_modified_time(self, modified_time):
+        if not modified_time:
+            return None
+        return datetime.fromisoformat(modified_time.replace('Z', '+00:00')).timestamp()
+
+    def thread_drive_service(self, drive_service):
+        # googleapiclient 的 service 物件不是執行緒安全的，每個工作執行緒各自建立一個
+        if not hasattr(self, 'creds'):
+            return drive_service
+        if not hasattr(self._thread_local, 'drive_service'):
+            self._thread_local.drive_service = build('drive', 'v3', credentials=self.creds)
+        return self._thread_local.drive_service
+
+    def download_file(self, drive_service, file_id, file_name, file_path, modified_time=None):
         try:
             request = drive_service.files().get_media(fileId=file_id)
             file_path = os.path.join(settings.BASE_DIR, 'data', 'md', file_path)
-            
-            with io.FileIO(file_path, 'wb') as fh:
+            tmp_path = file_path + '.part'
+
+            with io.FileIO(tmp_path, 'wb') as fh:
                 downloader = MediaIoBaseDownload(fh, request)
                 done = False
                 while done is False:
                     status, done = downloader.next_chunk()
-                    self.stdout.write(f'下載 {file_name} {int(status.progress() * 100)}%.')
-            
-            self.stdout.write(self.style.SUCCESS(f'文件 {file_name} 已下載到 {file_path}'))
+            os.replace(tmp_path, file_path)
+
+            # 將本地修改時間設為 Drive 上的 modifiedTime，下次執行時不必重新計算 md5 即可略過
+            timestamp = self.parse_modified_time(modified_time)
+            if timestamp is not None:
+                os.utime(file_path, (timestamp, timestamp))
+            return True
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'下載文件 {file_name} 時發生錯誤：{str(e)}'))
+            return False
 
-# 使用方法：python manage.py download_from_google_drive
\ No newline at end of file
+# 使用方法：python manage.py download_from_google_drive [--workers N] [--incremental]
\ No newline at end of file
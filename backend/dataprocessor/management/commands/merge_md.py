@@ -1,11 +1,19 @@
 import os
 import re
+import json
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from django.core.management.base import BaseCommand
 from django.conf import settings
 
 class Command(BaseCommand):
     help = '合併立法院公報 MD 文件'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='同時合併的期數')
+        parser.add_argument('--force', action='store_true', help='忽略索引，重新合併所有期數')
+
     def handle(self, *args, **options):
         md_dir = os.path.join(settings.BASE_DIR, 'data', 'md')
         output_dir = os.path.join(settings.BASE_DIR, 'data', 'merged_md')
@@ -13,13 +21,22 @@ class Command(BaseCommand):
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        for folder_name in os.listdir(md_dir):
+        folders = []
+        for folder_name in sorted(os.listdir(md_dir)):
             if folder_name.startswith('第') and '期公報' in folder_name:
                 folder_path = os.path.join(md_dir, folder_name)
                 if os.path.isdir(folder_path):
-                    self.merge_md_files(folder_path, folder_name, output_dir)
+                    folders.append((folder_path, folder_name))
+
+        # 各期之間互不相關，以執行緒池平行合併；結果依期數順序輸出
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(
+                lambda folder: self.merge_md_files(folder[0], folder[1], output_dir, options['force']), folders))
 
-    def merge_md_files(self, folder_path, folder_name, output_dir):
+        for level, message in results:
+            self.stdout.write(getattr(self.style, level)(message) if level else message)
+
+    def merge_md_files(self, folder_path, folder_name, output_dir, force=False):
         md_files = []
         for subfolder_name in os.listdir(folder_path):
             subfolder_path = os.path.join(folder_path, subfolder_name)
@@ -30,19 +47,56 @@ class Command(BaseCommand):
                         md_files.append((page_range, os.path.join(subfolder_path, file_name)))
 
         if not md_files:
-            self.stdout.write(self.style.WARNING(f'文件夾 {folder_name} 中沒有找到 MD 文件'))
-            return
+            return 'WARNING', f'文件夾 {folder_name} 中沒有找到 MD 文件'
 
-        md_files.sort(key=lambda x: x[0][0])  # 按起始頁碼排序
+        md_files.sort(key=lambda x: (x[0][0], x[1]))  # 按起始頁碼排序
 
         output_file = os.path.join(output_dir, f'{folder_name}.md')
-        with open(output_file, 'w', encoding='utf-8') as outfile:
-            for _, file_path in md_files:
-                with open(file_path, 'r', encoding='utf-8') as infile:
-                    outfile.write(infile.read())
-                    outfile.write('\n\n')  # 在每個文件之間添加空行
+        index_file = os.path.join(output_dir, f'{folder_name}.index.json')
+        signature = self.inputs_signature(folder_path, md_files)
+        if not force and os.path.exists(output_file) and self.load_index(index_file).get('inputs_signature') == signature:
+            return None, f'{folder_name} 的 MD 文件沒有變動，略過合併'
+
+        # 以緩衝區串流複製每個片段，並記錄每個 p<start>-p<end> 片段在合併文件中的位元組位置
+        fragments = []
+        tmp_file = output_file + '.tmp'
+        with open(tmp_file, 'wb') as outfile:
+            for (start_page, end_page), file_path in md_files:
+                offset = outfile.tell()
+                with open(file_path, 'rb') as infile:
+                    shutil.copyfileobj(infile, outfile, 1024 * 1024)
+                fragments.append({
+                    'pages': f'p{start_page}-p{end_page}',
+                    'start_page': start_page,
+                    'end_page': end_page,
+                    'source': os.path.relpath(file_path, folder_path),
+                    'offset': offset,
+                    'length': outfile.tell() - offset,
+                })
+                outfile.write(b'\n\n')  # 在每個文件之間添加空行
+        os.replace(tmp_file, output_file)
+
+        index = {'issue': folder_name, 'inputs_signature': signature, 'fragments': fragments}
+        tmp_index = index_file + '.tmp'
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_index, index_file)
+
+        return 'SUCCESS', f'成功合併 {folder_name} 中的 {len(md_files)} 個 MD 文件'
+
+    def inputs_signature(self, folder_path, md_files):
+        # 以每個片段的路徑、大小與修改時間判斷這一期的輸入是否有變動
+        digest = hashlib.sha256()
+        for _, file_path in md_files:
+            stat = os.stat(file_path)
+            digest.update(f'{os.path.relpath(file_path, folder_path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8'))
+        return digest.hexdigest()
 
-        self.stdout.write(self.style.SUCCESS(f'成功合併 {folder_name} 中的 {len(md_files)} 個 MD 文件'))
+    def load_index(self, index_file):
+        if not os.path.exists(index_file):
+            return {}
+        with open(index_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
 
     def extract_page_range(self, folder_name):
         match = re.search(r'p(\d+)-p(\d+)', folder_name)
@@ -50,4 +104,4 @@ class Command(BaseCommand):
             return int(match.group(1)), int(match.group(2))
         return 0, 0  # 如果無法提取頁碼範圍，則返回 (0, 0)
 
-# 使用方法：python manage.py merge_md_files
\ No newline at end of file
+# 使用方法：python manage.py merge_md [--workers N] [--force]
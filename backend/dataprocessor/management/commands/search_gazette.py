@@ -0,0 +1,46 @@
+# dataprocessor/management/commands/search_gazette.py
+
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from dataprocessor.corpus import GazetteCorpus, as_text
+from dataprocessor.search_index import SearchIndex
+
+
+class Command(BaseCommand):
+    help = '以本地全文索引搜尋公報，支援片語（"..."）、AND、OR 與排除（-詞 或 NOT 詞）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('query', type=str, help='查詢字串')
+        parser.add_argument('--source', choices=['txt', 'merged_md'], action='append', help='只搜尋指定來源')
+        parser.add_argument('--limit', type=int, default=20, help='最多列出的頁數')
+        parser.add_argument('--context', type=int, default=30, help='每筆結果前後顯示的位元組數')
+        parser.add_argument('--index-dir', type=str, default=None, help='索引目錄，預設為 data/index')
+
+    def handle(self, *args, **options):
+        data_dir = os.path.join(settings.BASE_DIR, 'data')
+        index = SearchIndex(options['index_dir'] or os.path.join(data_dir, 'index'))
+        if not index.documents:
+            raise CommandError('索引是空的，請先執行 python manage.py build_search_index')
+
+        index.load()
+        started = time.monotonic()
+        hits = index.search(options['query'], options['source'], options['limit'])
+        elapsed = time.monotonic() - started
+
+        with GazetteCorpus(data_dir) as corpus:
+            for hit in hits:
+                if hit['source'] == 'merged_md':
+                    document = corpus.merged_md(hit['issue'])
+                else:
+                    document = corpus.open(os.path.join(data_dir, hit['path']))
+                offset = hit['offsets'][0]
+                snippet = document.slice(max(offset - options['context'], 0), offset + options['context'])
+                text = as_text(snippet).replace('\n', ' ')
+                snippet.release()
+                self.stdout.write(f"第{hit['issue']:02d}期 {hit['path']} 第 {hit['page']} 頁（{len(hit['offsets'])} 處）：{text}")
+
+        self.stdout.write(self.style.SUCCESS(f'共 {len(hits)} 頁符合（{elapsed * 1000:.1f} 毫秒）'))
+
+# 使用方法：python manage.py search_gazette '"國土安全" 預算 -國防'
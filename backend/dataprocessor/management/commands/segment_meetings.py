@@ -0,0 +1,58 @@
+# dataprocessor/management/commands/segment_meetings.py
+
+import os
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from dataprocessor.corpus import GazetteCorpus
+from dataprocessor.segmenter import segment_document
+
+
+class Command(BaseCommand):
+    help = '依會議紀錄標頭將每一期公報切分成個別會議紀錄，輸出 JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--issue', type=int, action='append', help='只處理指定期數，可重複指定')
+        parser.add_argument('--source', choices=['txt', 'merged_md'], default='txt', help='切分的來源文件')
+        parser.add_argument('--output-dir', type=str, default=None, help='JSONL 輸出目錄，預設為 data/segments/<source>')
+
+    def handle(self, *args, **options):
+        data_dir = os.path.join(settings.BASE_DIR, 'data')
+        output_dir = options['output_dir'] or os.path.join(data_dir, 'segments', options['source'])
+
+        with GazetteCorpus(data_dir) as corpus:
+            issues = options['issue'] or corpus.issues()
+            if not issues:
+                raise CommandError('找不到任何公報文件')
+            os.makedirs(output_dir, exist_ok=True)
+            total = 0
+            for issue in issues:
+                started = time.monotonic()
+                count = self.segment_issue(corpus, issue, options['source'], data_dir, output_dir)
+                total += count
+                self.stdout.write(f'第{issue:02d}期共有 {count} 份會議紀錄（{time.monotonic() - started:.3f} 秒）')
+
+        self.stdout.write(self.style.SUCCESS(f'完成切分，共 {total} 份會議紀錄'))
+
+    def segment_issue(self, corpus, issue, source, data_dir, output_dir):
+        if source == 'merged_md':
+            md_path = os.path.join(corpus.merged_md_dir, f'第{issue:02d}期公報.md')
+            documents = [corpus.merged_md(issue)] if os.path.exists(md_path) else []
+        else:
+            documents = [corpus.open(path) for path in corpus.txt_files(issue)]
+
+        # 每行一份紀錄；位移相對於 source 指向的文件，可直接交給 corpus 取出該份紀錄
+        output_file = os.path.join(output_dir, f'第{issue:02d}期.jsonl')
+        tmp_file = output_file + '.tmp'
+        count = 0
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for document in documents:
+                relative_path = os.path.relpath(document.path, data_dir)
+                for record in segment_document(document):
+                    count += 1
+                    f.write(json.dumps({'issue': issue, 'source': relative_path, **record}, ensure_ascii=False) + '\n')
+        os.replace(tmp_file, output_file)
+        return count
+
+# 使用方法：python manage.py segment_meetings [--issue 1] [--source txt|merged_md]
@@ -0,0 +1,73 @@
+# dataprocessor/management/commands/strip_boilerplate.py
+
+import os
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from dataprocessor.corpus import GazetteCorpus
+from dataprocessor.chunker import token_counter
+from dataprocessor.boilerplate import (learn_boilerplate, clean_document, DEFAULT_MIN_PAGE_RATIO, DEFAULT_MIN_PAGES,
+                                       DEFAULT_MIN_BODY_LENGTH)
+
+
+class Command(BaseCommand):
+    help = '移除 data/txt 中每一期重複的頁首、頁碼與程序性文字，輸出到 data/clean_txt 並保留位移對照'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--issue', type=int, action='append', help='只處理指定期數，可重複指定')
+        parser.add_argument('--min-page-ratio', type=float, default=DEFAULT_MIN_PAGE_RATIO,
+                            help='出現在這個比例以上的頁面才視為重複內容')
+        parser.add_argument('--min-pages', type=int, default=DEFAULT_MIN_PAGES, help='至少出現在幾頁才視為重複內容')
+        parser.add_argument('--min-body-length', type=int, default=DEFAULT_MIN_BODY_LENGTH,
+                            help='頁首頁尾以外的重複行至少要有的字數')
+        parser.add_argument('--encoding', type=str, default='cl100k_base', help='計算 token 數使用的 tiktoken 編碼')
+
+    def handle(self, *args, **options):
+        data_dir = os.path.join(settings.BASE_DIR, 'data')
+        output_base_dir = os.path.join(data_dir, 'clean_txt')
+        count_tokens = token_counter(options['encoding'])
+
+        totals = {'bytes': 0, 'clean_bytes': 0, 'tokens': 0, 'clean_tokens': 0}
+        started = time.monotonic()
+        with GazetteCorpus(data_dir) as corpus:
+            issues = options['issue'] or corpus.issues()
+            if not issues:
+                raise CommandError('找不到任何公報文件')
+            for issue in issues:
+                documents = [corpus.open(path) for path in corpus.txt_files(issue)]
+                if not documents:
+                    continue
+                # 以同一期的所有文件學習重複內容
+                boilerplate = learn_boilerplate(documents, options['min_page_ratio'], options['min_pages'],
+                                                options['min_body_length'])
+                output_dir = os.path.join(output_base_dir, f'第{issue:02d}期')
+                os.makedirs(output_dir, exist_ok=True)
+                for document in documents:
+                    self.clean_file(document, boilerplate, output_dir, data_dir, count_tokens, totals)
+                self.stdout.write(f'第{issue:02d}期：學到 {len(boilerplate[0])} 種頁首頁尾、{len(boilerplate[1])} 種重複段落')
+
+        saved = 1 - totals['clean_bytes'] / totals['bytes'] if totals['bytes'] else 0
+        saved_tokens = 1 - totals['clean_tokens'] / totals['tokens'] if totals['tokens'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"完成清理：{totals['bytes']} → {totals['clean_bytes']} 位元組（減少 {saved:.1%}），"
+            f"{totals['tokens']} → {totals['clean_tokens']} tokens（減少 {saved_tokens:.1%}，"
+            f"{time.monotonic() - started:.2f} 秒）"))
+
+    def clean_file(self, document, boilerplate, output_dir, data_dir, count_tokens, totals):
+        text, offset_map = clean_document(document, boilerplate)
+        output_file = os.path.join(output_dir, os.path.basename(document.path))
+        # 位移對照記錄清理後每一行（標準化改變長度處再細分）在原始文件中的位置，讓引用可以回到 data/txt 的原文與頁碼
+        offset_map = {'source': os.path.relpath(document.path, data_dir), **offset_map}
+        for path, content in ((output_file, text), (output_file + '.offsets.json', json.dumps(offset_map))):
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+
+        original = bytes(document.view).decode('utf-8', errors='replace')
+        totals['bytes'] += len(document.view)
+        totals['clean_bytes'] += len(text.encode('utf-8'))
+        totals['tokens'] += count_tokens(original)
+        totals['clean_tokens'] += count_tokens(text)
+
+# 使用方法：python manage.py strip_boilerplate [--issue 1] [--min-page-ratio 0.3]
@@ -0,0 +1,126 @@
+# dataprocessor/meeting_info.py
+
+import re
+from dataprocessor.segmenter import normalize_line, line_text
+
+# 會議紀錄開頭的固定格式欄位，在本地直接解析，取代每份紀錄一次的 OpenAI function call。
+# 各欄位的權重加總為 1，缺少欄位或格式不符時降低信心分數，由呼叫端決定是否交給 LLM 補齊。
+FIELD_WEIGHTS = {
+    'meeting_time': 0.3,
+    'meeting_location': 0.2,
+    'attendees': 0.3,
+    'meeting_type': 0.2,
+}
+
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+# 會議類型依序比對標題，第一個符合的規則決定類型
+MEETING_TYPE_RULES = (
+    (re.compile(r'公聽會'), '公聽會'),
+    (re.compile(r'聯席會議'), '委員會聯席會議'),
+    (re.compile(r'全體委員會議'), '委員會全體委員會議'),
+    (re.compile(r'協商'), '黨團協商'),
+    (re.compile(r'臨時會.*第\d+次會議'), '臨時會院會'),
+    (re.compile(r'會期第\d+次會議'), '院會'),
+)
+
+DATE_RE = re.compile(r'中華民國\d+年\d+月\d+日')
+ATTENDEE_COUNT_RE = re.compile(r'^委員出席\d+人$')
+# 原住民族委員的姓名常在漢字之後附上族語拼音，例如「伍麗華Saidhai‧Tahovecahe」、「鄭天財 Sra Kacaw」
+NAME_RE = re.compile(r"^[一-鿿]{2,4}(?: ?[A-Za-z][A-Za-z'’‧·.\- ]*)?$")
+ROMANIZED_RE = re.compile(r"^[A-Za-z][A-Za-z'’‧·.\-]*$")
+SEPARATOR_RE = re.compile(r'[\s　、，,]+')
+LABEL_CHARS_RE = re.compile(r'[\s　#*_>|\-\x0c]')
+
+LABELS = {
+    'meeting_time': '時間',
+    'meeting_location': '地點',
+    'attendees': '出席委員',
+}
+# 出現這些欄位代表出席委員名單已經結束
+STOP_LABELS = ('列席', '主席', '時間', '地點', '專門委員', '主任秘書', '記錄', '紀錄', '報告事項', '討論事項')
+
+
+def split_label(line, label):
+    # 若該行以欄位名稱開頭（欄位名稱中可能夾雜全形空白或 Markdown 符號），回傳欄位值，否則回傳 None
+    if not normalize_line(line).startswith(label):
+        return None
+    consumed = 0
+    for index, char in enumerate(line):
+        if LABEL_CHARS_RE.match(char):
+            continue
+        consumed += 1
+        if consumed == len(label):
+            return line[index + 1:].lstrip(' 　：:*').strip()
+    return ''
+
+
+def meeting_type(title):
+    for pattern, name in MEETING_TYPE_RULES:
+        if pattern.search(title):
+            return name
+    return None
+
+
+def split_names(value):
+    # 以空白或頓號分開；只有拼音的片段是前一位委員姓名的族語拼音，併回前一個名字
+    names = []
+    for token in SEPARATOR_RE.split(value.strip(' 　*-')):
+        if not token or ATTENDEE_COUNT_RE.match(token):
+            continue
+        if names and ROMANIZED_RE.match(token):
+            names[-1] = f'{names[-1]} {token}'
+        else:
+            names.append(token)
+    return names
+
+
+def extract_meeting_info(text, title=None, max_lines=30):
+    # text 為一份會議紀錄的開頭（至少涵蓋標頭）；回傳 extract_basic_information 的各欄位與信心分數。
+    # 只看前 max_lines 行，避免正文中的「時間」、「地點」被當成標頭欄位
+    lines = text.splitlines()[:max_lines]
+    if title is None and lines:
+        title = normalize_line(lines[0])
+    info = {'meeting_time': None, 'meeting_location': None, 'attendees': [],
+            'meeting_type': meeting_type(title or '')}
+
+    attendees_open = False
+    for line in lines:
+        if attendees_open:
+            # 出席委員名單可能跨越多行，直到下一個欄位或發言為止
+            compact = line_text(line)
+            if not compact:
+                continue
+            names = split_names(line)
+            if compact.startswith(STOP_LABELS) or '：' in line or not all(
+                    NAME_RE.match(name) for name in names):
+                break
+            info['attendees'].extend(names)
+            continue
+
+        for field in ('meeting_time', 'meeting_location', 'attendees'):
+            if info[field]:
+                continue
+            value = split_label(line, LABELS[field])
+            if value is None:
+                continue
+            if field == 'attendees':
+                info['attendees'] = split_names(value)
+                attendees_open = True
+            elif value:
+                info[field] = value
+            break
+
+    score = 0.0
+    missing = []
+    for field, weight in FIELD_WEIGHTS.items():
+        if not info[field]:
+            missing.append(field)
+        elif field == 'meeting_time' and not DATE_RE.search(info[field]):
+            # 沒有完整日期的時間欄位只給一半的分數
+            score += weight / 2
+        else:
+            score += weight
+    info['confidence'] = round(score, 2)
+    info['missing'] = missing
+    return info
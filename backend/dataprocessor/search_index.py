@@ -0,0 +1,286 @@
+# dataprocessor/search_index.py
+
+import os
+import re
+import json
+import hashlib
+from array import array
+import numpy as np
+
+# 中文以相鄰兩字（bigram）為詞元，英數字以整個單字為詞元。
+# 每個詞元記錄兩種位置：序位（第幾個字／單字，用來判斷片語是否相鄰）與位元組位移（用來回到原文與頁碼）。
+# 轉換器換行造成的斷句（只隔著空白與換行）視為相鄰，其他標點或空白則中斷相鄰關係。
+
+# UTF-8 中 U+3400–U+9FFF 與 U+F900–U+FAFF 的漢字都是三個位元組
+CJK_RUN_PATTERN = rb'(?:\xe3[\x90-\xbf][\x80-\xbf]|[\xe4-\xe9][\x80-\xbf]{2}|\xef[\xa4-\xab][\x80-\xbf])+'
+UNIT_RE = re.compile(CJK_RUN_PATTERN + rb'|[A-Za-z0-9]+')
+WHITESPACE_RE = re.compile(rb'\s*')
+QUERY_TERM_RE = re.compile(r'-?"[^"]*"|\S+')
+
+INDEX_VERSION = 1
+
+
+def tokenize(buffer, join_whitespace=False):
+    # 產生 (詞元, 序位, 位元組位移)；單獨出現的漢字另外產生單字詞元
+    ordinal = 0
+    previous_end = None
+    previous_char = None
+    for match in UNIT_RE.finditer(buffer):
+        start = match.start()
+        if previous_end is not None:
+            separator = buffer[previous_end:start]
+            continuous = not separator or (WHITESPACE_RE.fullmatch(separator) is not None
+                                           and (join_whitespace or b'\n' in separator))
+            if not continuous:
+                ordinal += 1
+                previous_char = None
+        previous_end = match.end()
+
+        text = match.group()
+        if text[0] < 0x80:
+            yield text.lower().decode('ascii'), ordinal, start
+            ordinal += 1
+            previous_char = None
+            continue
+
+        chars = text.decode('utf-8')
+        if previous_char is not None:
+            yield previous_char[0] + chars[0], ordinal - 1, previous_char[1]
+        elif len(chars) == 1:
+            yield chars, ordinal, start
+        for i in range(len(chars) - 1):
+            yield chars[i:i + 2], ordinal + i, start + 3 * i
+        ordinal += len(chars)
+        previous_char = (chars[-1], previous_end - 3)
+
+
+def build_postings(buffer):
+    postings = {}
+    for token, ordinal, offset in tokenize(buffer):
+        entry = postings.get(token)
+        if entry is None:
+            entry = postings[token] = (array('I'), array('I'))
+        entry[0].append(ordinal)
+        entry[1].append(offset)
+    return postings
+
+
+def write_segment(prefix, postings):
+    # 每份文件一個分段：詞彙表（每行一個詞元）、詞元對照表（起點、筆數）與 uint32 的 postings，
+    # 每個詞元的 postings 依序存放序位與位元組位移
+    tokens = sorted(postings)
+    table = np.zeros((len(tokens), 2), dtype=np.uint32)
+    flat = array('I')
+    for index, token in enumerate(tokens):
+        ordinals, offsets = postings[token]
+        table[index] = (len(flat), len(ordinals))
+        flat.extend(ordinals)
+        flat.extend(offsets)
+
+    with open(prefix + '.vocab.tmp', 'w', encoding='utf-8') as f:
+        f.write('\n'.join(tokens))
+    with open(prefix + '.table.npy.tmp', 'wb') as f:
+        np.save(f, table)
+    with open(prefix + '.postings.npy.tmp', 'wb') as f:
+        np.save(f, np.frombuffer(flat, dtype=np.uint32) if flat else np.zeros(0, dtype=np.uint32))
+    for suffix in ('.vocab', '.table.npy', '.postings.npy'):
+        os.replace(prefix + suffix + '.tmp', prefix + suffix)
+
+
+def remove_segment(prefix):
+    for suffix in ('.vocab', '.table.npy', '.postings.npy'):
+        if os.path.exists(prefix + suffix):
+            os.remove(prefix + suffix)
+
+
+class Segment:
+    def __init__(self, prefix):
+        with open(prefix + '.vocab', 'r', encoding='utf-8') as f:
+            vocab = f.read()
+        self.tokens = {token: index for index, token in enumerate(vocab.split('\n'))} if vocab else {}
+        self.table = np.load(prefix + '.table.npy')
+        # 空的陣列無法 mmap
+        self.postings = np.load(prefix + '.postings.npy', mmap_mode='r' if self.tokens else None)
+
+    def lookup(self, token):
+        # 回傳 (序位, 位元組位移) 兩個唯讀陣列；序位遞增排序
+        index = self.tokens.get(token)
+        if index is None:
+            return None
+        start, count = (int(value) for value in self.table[index])
+        return self.postings[start:start + count], self.postings[start + count:start + 2 * count]
+
+
+def contains(sorted_values, values):
+    indexes = np.searchsorted(sorted_values, values)
+    found = indexes < len(sorted_values)
+    found[found] = sorted_values[indexes[found]] == values[found]
+    return found
+
+
+def match_phrase(segment, query_tokens):
+    # 回傳片語在文件中每次出現的開始位移；query_tokens 為 tokenize 對查詢字串的結果
+    entries = []
+    for token, ordinal, _ in query_tokens:
+        entry = segment.lookup(token)
+        if entry is None:
+            return np.zeros(0, dtype=np.int64)
+        entries.append((entry, ordinal))
+
+    # 從出現次數最少的詞元開始篩選候選位置
+    base_ordinal = query_tokens[0][1]
+    entries.sort(key=lambda item: len(item[0][0]))
+    (ordinals, _), ordinal = entries[0]
+    candidates = ordinals.astype(np.int64) - (ordinal - base_ordinal)
+    for (ordinals, _), ordinal in entries[1:]:
+        candidates = candidates[contains(ordinals, candidates + (ordinal - base_ordinal))]
+        if not len(candidates):
+            break
+
+    # 以第一個詞元的位移作為片語的開始位置
+    first_ordinals, first_offsets = segment.lookup(query_tokens[0][0])
+    return first_offsets[np.searchsorted(first_ordinals, candidates)].astype(np.int64)
+
+
+def parse_query(query):
+    # 以 OR 分隔子句；子句中的詞彼此為 AND，前面加上 - 或 NOT 的詞為排除。引號中的字串視為片語，
+    # 未加引號的中文詞同樣依相鄰 bigram 比對
+    clauses = [([], [])]
+    negate = False
+    for match in QUERY_TERM_RE.finditer(query):
+        word = match.group()
+        if word == 'OR':
+            clauses.append(([], []))
+            continue
+        if word == 'AND':
+            continue
+        if word == 'NOT':
+            negate = True
+            continue
+        if word.startswith('-') and len(word) > 1:
+            negate, word = True, word[1:]
+        tokens = list(tokenize(word.strip('"').encode('utf-8'), join_whitespace=True))
+        if tokens:
+            clauses[-1][1 if negate else 0].append(tokens)
+        negate = False
+    return [clause for clause in clauses if clause[0]]
+
+
+class SearchIndex:
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.segment_dir = os.path.join(index_dir, 'segments')
+        self.manifest_path = os.path.join(index_dir, 'manifest.json')
+        self.documents = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == INDEX_VERSION:
+                self.documents = manifest['documents']
+        self.segments = {}
+
+    def corpus_documents(self, corpus, sources):
+        paths = []
+        for issue in corpus.issues():
+            if 'txt' in sources:
+                paths.extend((issue, 'txt', path) for path in corpus.txt_files(issue))
+            md_path = os.path.join(corpus.merged_md_dir, f'第{issue:02d}期公報.md')
+            if 'merged_md' in sources and os.path.exists(md_path):
+                paths.append((issue, 'merged_md', md_path))
+        return paths
+
+    def update(self, corpus, data_dir, sources=('txt', 'merged_md'), force=False):
+        # 只重建新增或變動的文件，並移除已經不存在的文件；回傳各類文件數
+        os.makedirs(self.segment_dir, exist_ok=True)
+        counts = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        seen = set()
+        for issue, source, path in self.corpus_documents(corpus, sources):
+            relative_path = os.path.relpath(path, data_dir)
+            seen.add(relative_path)
+            stat = os.stat(path)
+            entry = self.documents.get(relative_path)
+            if not force and entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                counts['unchanged'] += 1
+                continue
+
+            document = corpus.open(path) if source == 'txt' else corpus.merged_md(issue)
+            key = hashlib.sha1(relative_path.encode('utf-8')).hexdigest()
+            write_segment(os.path.join(self.segment_dir, key), build_postings(document.mm))
+            first_pages = {}
+            for page, (start, _) in sorted(document.page_spans.items()):
+                first_pages.setdefault(start, page)
+            page_starts = sorted(first_pages)
+            self.documents[relative_path] = {
+                'key': key, 'issue': issue, 'source': source, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'page_starts': page_starts, 'pages': [first_pages[start] for start in page_starts],
+            }
+            self.segments.pop(relative_path, None)
+            counts['updated' if entry else 'added'] += 1
+
+        for relative_path in [path for path in self.documents
+                              if path not in seen and self.documents[path]['source'] in sources]:
+            remove_segment(os.path.join(self.segment_dir, self.documents.pop(relative_path)['key']))
+            self.segments.pop(relative_path, None)
+            counts['removed'] += 1
+
+        self.save()
+        return counts
+
+    def save(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'documents': self.documents}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def segment(self, relative_path):
+        if relative_path not in self.segments:
+            self.segments[relative_path] = Segment(os.path.join(self.segment_dir, self.documents[relative_path]['key']))
+        return self.segments[relative_path]
+
+    def load(self):
+        # 預先載入所有分段的詞彙表，之後的查詢只需查表與比對 postings
+        for relative_path in self.documents:
+            self.segment(relative_path)
+
+    def search(self, query, sources=None, limit=None):
+        # 以頁為單位評估布林條件；回傳 [{'path', 'issue', 'source', 'page', 'offsets'}]，依期數、文件與頁碼排序
+        clauses = parse_query(query)
+        hits = []
+        for relative_path, entry in sorted(self.documents.items(), key=lambda item: (item[1]['issue'], item[0])):
+            if sources and entry['source'] not in sources:
+                continue
+            segment = self.segment(relative_path)
+            page_starts = np.asarray(entry['page_starts'], dtype=np.int64)
+            pages = {}
+            for required, excluded in clauses:
+                clause_pages = None
+                clause_offsets = []
+                for tokens in required:
+                    offsets = match_phrase(segment, tokens)
+                    term_pages = self.pages_of(entry, page_starts, offsets)
+                    clause_pages = set(term_pages) if clause_pages is None else clause_pages & set(term_pages)
+                    clause_offsets.append((offsets, term_pages))
+                    if not clause_pages:
+                        break
+                for tokens in excluded:
+                    if not clause_pages:
+                        break
+                    clause_pages -= set(self.pages_of(entry, page_starts, match_phrase(segment, tokens)))
+                for offsets, term_pages in clause_offsets:
+                    for offset, page in zip(offsets.tolist(), term_pages):
+                        if page in clause_pages:
+                            pages.setdefault(page, set()).add(offset)
+            for page in sorted(pages):
+                hits.append({'path': relative_path, 'issue': entry['issue'], 'source': entry['source'],
+                             'page': page, 'offsets': sorted(pages[page])})
+                if limit and len(hits) >= limit:
+                    return hits
+        return hits
+
+    def pages_of(self, entry, page_starts, offsets):
+        if not entry['pages']:
+            return [None] * len(offsets)
+        indexes = np.searchsorted(page_starts, offsets, side='right') - 1
+        page_numbers = entry['pages']
+        return [page_numbers[max(index, 0)] for index in indexes.tolist()]
+
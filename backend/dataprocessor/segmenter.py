@@ -0,0 +1,170 @@
+# dataprocessor/segmenter.py
+
+import re
+import bisect
+from collections import namedtuple
+
+# 公報中每一份會議紀錄都以固定格式的標頭開始：
+#
+#   立法院第11屆第1會期內政委員會第1次全體委員會議紀錄
+#   時　　間　中華民國113年2月26日（星期一）9時至12時
+#   地　　點　群賢樓101會議室
+#   主　　席　陳委員秀寶
+#   出席委員　...
+#
+# 標題行之後必須依序出現 HEADER_RULES 中的必要欄位，才算是一份會議紀錄；
+# 目錄中的標題或正文中的「主席：」因為順序不符，不會被誤判為新的紀錄。
+HeaderRule = namedtuple('HeaderRule', ['name', 'labels', 'required'])
+
+HEADER_RULES = (
+    HeaderRule('time', ('時間',), True),
+    HeaderRule('location', ('地點',), True),
+    HeaderRule('chair', ('主席',), True),
+    HeaderRule('attendees', ('出席委員',), False),
+)
+
+TITLE_SUFFIXES = ('會議紀錄', '會議記錄')
+TITLE_RE = re.compile('|'.join(suffix for suffix in TITLE_SUFFIXES).encode('utf-8'))
+
+# 標題與各欄位之間最多允許的非空白行數（例如換頁後重複的頁首）
+MAX_HEADER_GAP = 8
+
+# 標準化時移除的空白（含全形空白、換頁字元）與 Markdown 符號
+STRIP_RE = re.compile(r'[\s　#*_>|-]+')
+PAGE_MARKER_PREFIX = '<!--'
+
+
+def normalize_line(line):
+    return STRIP_RE.sub('', line)
+
+
+def line_text(line):
+    # 頁碼標記 <!-- page N --> 視為空行；必須在標準化之前判斷，STRIP_RE 會移除標記中的「-」與空白
+    if line.lstrip().startswith(PAGE_MARKER_PREFIX):
+        return ''
+    return normalize_line(line)
+
+
+def iter_lines(buffer, start):
+    # 從 start 開始逐行產生 (開始位置, 結束位置, 標準化後的文字)；結束位置不含換行字元
+    size = len(buffer)
+    while start < size:
+        end = buffer.find(b'\n', start)
+        if end == -1:
+            end = size
+        yield start, end, line_text(buffer[start:end].decode('utf-8', errors='replace'))
+        start = end + 1
+
+
+def title_line(buffer, position):
+    # 找出包含 position 的行；若該行只有「會議紀錄」，代表標題被轉換器斷成兩行，併入上一行。
+    # 兩行之間若夾著換頁的頁碼標記，略過標記往前找
+    start = buffer.rfind(b'\n', 0, position) + 1
+    end = buffer.find(b'\n', position)
+    if end == -1:
+        end = len(buffer)
+    title = line_text(buffer[start:end].decode('utf-8', errors='replace'))
+    if not title.endswith(TITLE_SUFFIXES):
+        return None
+    previous_end = start - 1
+    while title in TITLE_SUFFIXES and previous_end >= 0:
+        previous_start = buffer.rfind(b'\n', 0, previous_end) + 1
+        raw = buffer[previous_start:previous_end].decode('utf-8', errors='replace')
+        if raw.lstrip().startswith(PAGE_MARKER_PREFIX):
+            previous_end = previous_start - 1
+            continue
+        previous = normalize_line(raw)
+        if previous:
+            return previous_start, end, previous + title
+        break
+    return start, end, title
+
+
+def match_header(text, rules, next_rule):
+    # 依序比對尚未出現的欄位；只能略過非必要欄位
+    for index in range(next_rule, len(rules)):
+        rule = rules[index]
+        if text.startswith(rule.labels):
+            return index
+        if rule.required:
+            return None
+    return None
+
+
+def parse_header(buffer, title_end, rules=HEADER_RULES, max_gap=MAX_HEADER_GAP):
+    # 回傳 (各欄位所在行的位置, 標頭結束位置)；必要欄位不齊全時回傳 None
+    headers = {}
+    header_end = title_end
+    next_rule = 0
+    gap = 0
+    for start, end, text in iter_lines(buffer, title_end + 1):
+        if not text:
+            continue
+        if text.endswith(TITLE_SUFFIXES):
+            break
+        index = match_header(text, rules, next_rule)
+        if index is None:
+            gap += 1
+            if gap > max_gap:
+                break
+            continue
+        headers[rules[index].name] = start
+        header_end = end
+        next_rule = index + 1
+        gap = 0
+        if next_rule == len(rules):
+            break
+
+    if any(rule.required and rule.name not in headers for rule in rules):
+        return None
+    return headers, header_end
+
+
+def segment(buffer, rules=HEADER_RULES, max_gap=MAX_HEADER_GAP):
+    # 在 bytes 或 mmap 上找出每一份會議紀錄，依出現順序產生
+    # {'title', 'start', 'end', 'header_end', 'headers'}；位置皆為位元組位移，end 為下一份紀錄的開始
+    records = []
+    position = 0
+    for match in TITLE_RE.finditer(buffer):
+        if match.start() < position:
+            continue
+        title = title_line(buffer, match.start())
+        if title is None:
+            continue
+        start, title_end, text = title
+        header = parse_header(buffer, title_end, rules, max_gap)
+        if header is None:
+            continue
+        headers, header_end = header
+        if records:
+            records[-1]['end'] = start
+            yield records.pop()
+        records.append({'title': text, 'start': start, 'end': len(buffer),
+                        'header_end': header_end, 'headers': headers})
+        position = header_end
+    yield from records
+
+
+def page_of(page_starts, pages, offset):
+    # 依頁碼索引找出位移所在的頁碼
+    index = bisect.bisect_right(page_starts, offset) - 1
+    return pages[max(index, 0)] if pages else None
+
+
+def page_index(document):
+    # 回傳 (各頁開始位置, 對應頁碼)，供 page_of 查詢
+    # 合併後的 MD 中同一片段的各頁共用同一個開始位置，取其中最小的頁碼
+    first_pages = {}
+    for page, (start, _) in sorted(document.page_spans.items()):
+        first_pages.setdefault(start, page)
+    page_starts = sorted(first_pages)
+    return page_starts, [first_pages[start] for start in page_starts]
+
+
+def segment_document(document, rules=HEADER_RULES, max_gap=MAX_HEADER_GAP):
+    # 對 corpus.Document 分段，並依頁碼索引附上每份紀錄的起訖頁碼
+    page_starts, pages = page_index(document)
+    for number, record in enumerate(segment(document.mm, rules, max_gap), start=1):
+        yield {'record': number, **record,
+               'start_page': page_of(page_starts, pages, record['start']),
+               'end_page': page_of(page_starts, pages, max(record['end'] - 1, record['start']))}
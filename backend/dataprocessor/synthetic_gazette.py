@@ -0,0 +1,139 @@
+# dataprocessor/synthetic_gazette.py
+
+import random
+import zlib
+
+# 不需要任何外部套件即可產生類似立法院公報的 PDF：繁體中文雙欄逐字紀錄，每隔幾頁穿插一張有框線的表格。
+# 字型使用不內嵌的 MSung-Light 並附上 ToUnicode 對照表，讓文字擷取工具能還原出正確的中文。
+
+SPEAKERS = ['主席', '王委員美惠', '李委員昆澤', '陳委員培瑜', '林委員思銘', '黃委員國昌', '行政院院長', '內政部部長']
+
+PHRASES = [
+    '現在開會，進行討論事項。', '請問部長對於本案有何說明？', '本席認為政府應該儘速提出具體的改善方案。',
+    '謝謝委員的指教，我們會再研議。', '針對預算編列的部分，請主計總處補充說明。', '這個問題已經討論很久了，',
+    '地方政府反映的意見我們都有收到。', '依照立法院職權行使法的規定，', '今天的會議到此結束，散會。',
+    '請各位委員踴躍發言，', '有關國土安全與災害防救的議題，', '相關法案已經送交委員會審查。',
+    '本案經協商後，照案通過。', '請秘書長宣讀提案內容。', '我們必須正視少子化與高齡化的挑戰，',
+]
+
+TABLE_HEADER = ['項目', '單位', '預算數', '執行數']
+TABLE_ITEMS = ['一般行政', '科技發展', '國防支出', '社會福利', '教育文化', '經濟發展', '交通建設', '環境保護']
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+FONT_SIZE = 10
+LINE_HEIGHT = 14
+COLUMN_CHARS = 24
+
+
+def wrap(text, width):
+    return [text[i:i + width] for i in range(0, len(text), width)]
+
+
+def transcript_lines(rng, count):
+    lines = []
+    while len(lines) < count:
+        speech = f'{rng.choice(SPEAKERS)}：' + ''.join(rng.choice(PHRASES) for _ in range(rng.randint(1, 4)))
+        lines.extend(wrap(speech, COLUMN_CHARS))
+    return lines[:count]
+
+
+def text_op(x, y, text, size=FONT_SIZE):
+    # 字碼直接使用 Unicode 碼位（Identity-H），由 ToUnicode 對照表還原
+    encoded = ''.join(f'{ord(char):04X}' for char in text)
+    return f'BT /F1 {size} Tf {x} {y} Td <{encoded}> Tj ET'
+
+
+def page_content(rng, issue, page_number, with_table):
+    ops = [text_op(50, 810, f'立法院公報　第113卷　第{issue:02d}期　委員會紀錄', 9)]
+    top = 780
+    if with_table:
+        rows = [TABLE_HEADER] + [[item, '千元', str(rng.randint(1000, 99999)), str(rng.randint(1000, 99999))]
+                                 for item in TABLE_ITEMS]
+        cell_width, cell_height = 120, 20
+        for row_index, row in enumerate(rows):
+            y = top - (row_index + 1) * cell_height
+            for column_index, cell in enumerate(row):
+                x = 60 + column_index * cell_width
+                ops.append(f'{x} {y} {cell_width} {cell_height} re S')
+                ops.append(text_op(x + 6, y + 6, cell))
+        top -= (len(rows) + 2) * cell_height
+
+    rows_per_column = int((top - 60) / LINE_HEIGHT)
+    for column_x in (50, 310):
+        for row, line in enumerate(transcript_lines(rng, rows_per_column)):
+            ops.append(text_op(column_x, top - row * LINE_HEIGHT, line))
+    ops.append(text_op(PAGE_WIDTH // 2 - 10, 30, str(page_number), 9))
+    return '\n'.join(ops)
+
+
+def to_unicode_cmap(chars):
+    entries = sorted(ord(char) for char in chars)
+    blocks = []
+    for i in range(0, len(entries), 100):
+        block = entries[i:i + 100]
+        blocks.append(f'{len(block)} beginbfchar\n'
+                      + '\n'.join(f'<{code:04X}> <{code:04X}>' for code in block)
+                      + '\nendbfchar')
+    return ('/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+            '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n'
+            '/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+            '1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+            + '\n'.join(blocks)
+            + '\nendcmap\nCMapName currentdict /CMap defineresource pop\nend\nend')
+
+
+def stream_object(data, compress=True):
+    if compress:
+        data = zlib.compress(data)
+        return f'<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n'.encode('ascii') + data + b'\nendstream'
+    return f'<< /Length {len(data)} >>\nstream\n'.encode('ascii') + data + b'\nendstream'
+
+
+def write_synthetic_gazette(path, pages, issue=1, seed=0, table_every=5):
+    rng = random.Random(seed)
+    contents = [page_content(rng, issue, page_number, table_every and page_number % table_every == 0)
+                for page_number in range(1, pages + 1)]
+    chars = {char for content in contents for char in content_chars(content)}
+
+    # 物件編號：1 目錄、2 頁面樹、3 字型、4 子字型、5 ToUnicode，之後每頁兩個物件（頁面與內容）
+    objects = {
+        1: b'<< /Type /Catalog /Pages 2 0 R >>',
+        3: b'<< /Type /Font /Subtype /Type0 /BaseFont /MSung-Light /Encoding /Identity-H '
+           b'/DescendantFonts [4 0 R] /ToUnicode 5 0 R >>',
+        4: b'<< /Type /Font /Subtype /CIDFontType0 /BaseFont /MSung-Light '
+           b'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+           b'/FontDescriptor << /Type /FontDescriptor /FontName /MSung-Light /Flags 6 '
+           b'/FontBBox [0 -200 1000 900] /ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 880 /StemV 93 >> '
+           b'/DW 1000 >>',
+        5: stream_object(to_unicode_cmap(chars).encode('ascii'), compress=False),
+    }
+    kids = []
+    for index, content in enumerate(contents):
+        page_id, content_id = 6 + index * 2, 7 + index * 2
+        kids.append(f'{page_id} 0 R')
+        objects[page_id] = (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+                            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>').encode('ascii')
+        objects[content_id] = stream_object(content.encode('ascii'))
+    objects[2] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'.encode('ascii')
+
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = {}
+        for object_id in sorted(objects):
+            offsets[object_id] = f.tell()
+            f.write(f'{object_id} 0 obj\n'.encode('ascii') + objects[object_id] + b'\nendobj\n')
+        xref_offset = f.tell()
+        f.write(f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('ascii'))
+        for object_id in sorted(objects):
+            f.write(f'{offsets[object_id]:010d} 00000 n \n'.encode('ascii'))
+        f.write(f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode('ascii'))
+    return pages
+
+
+def content_chars(content):
+    # 從內容串流中的十六進位字碼取回使用到的字元，用來產生 ToUnicode 對照表
+    for chunk in content.split('<')[1:]:
+        encoded = chunk.split('>', 1)[0]
+        for i in range(0, len(encoded), 4):
+            yield chr(int(encoded[i:i + 4], 16))
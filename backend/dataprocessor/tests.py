@@ -1,3 +1,1192 @@
-from django.test import TestCase
+import os
+import re
+import json
+import hashlib
+import shutil
+import tempfile
+import asyncio
+import contextlib
+import io
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from unittest import mock
+import httplib2
+import numpy as np
+from django.test import SimpleTestCase
+from django.core.management import call_command
+import pdfminer
+from dataprocessor.conversion import (PAGE_MARKER, ConversionCache, NO_CACHE_ENTRY, pdfminer_pages, write_pages_atomic,
+                                      convert_files_sharded, convert_shard_pdfminer, stitch_shards, score_page,
+                                      pdfminer_layout_pages)
+from dataprocessor.synthetic_gazette import write_synthetic_gazette
+from dataprocessor.corpus import GazetteCorpus, as_text
+from dataprocessor.segmenter import segment, segment_document
+from dataprocessor.meeting_info import extract_meeting_info
+from dataprocessor.search_index import SearchIndex
+from dataprocessor.vector_store import LocalVectorStore, HashingEmbedding
+from dataprocessor.chunker import chunk_document, approximate_tokens, ChunkLedger, SPEAKER_RE
+from dataprocessor.boilerplate import learn_boilerplate, clean_document, original_offset, normalize_line
+from dataprocessor.management.commands.download_from_google_drive import Command as DriveSyncCommand
+from dataprocessor.management.commands.convert_pdf_to_txt import Command as MarkerConvertCommand
+from dataprocessor.management.commands.convert_pdf_to_txt_hybrid import Command as HybridConvertCommand
+from assistant_api import AssistantAPI
 
-# Create your tests here.
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), 'testdata')
+
+
+class GazetteCorpusTests(SimpleTestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        self.corpus = GazetteCorpus(self.data_dir)
+        self.addCleanup(self.corpus.close)
+
+    def write(self, relative_path, text):
+        path = os.path.join(self.data_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_pages_split_on_form_feed(self):
+        self.write('txt/第01期/LCIDC01_1130101_00001.txt', '第一頁\n\x0c第二頁\n\x0c第三頁\n')
+
+        self.assertEqual(self.corpus.issues(), [1])
+        self.assertEqual(as_text(self.corpus.pages(1, 2, source='txt')), '第二頁\n')
+        self.assertEqual(as_text(self.corpus.pages(1, 1, 3, source='txt')), '第一頁\n\x0c第二頁\n\x0c第三頁\n')
+        self.assertEqual(self.corpus.txt(1).page_count, 3)
+
+    def test_pages_follow_page_markers(self):
+        text = ''.join(PAGE_MARKER.format(page=page) + f'內容{page}\n' for page in (1, 2, 3))
+        path = self.write('txt/第02期/LCIDC01_1130201_00001.txt', text)
+
+        self.assertEqual(as_text(self.corpus.pages(2, 2, 3, source='txt')),
+                         '內容2\n' + PAGE_MARKER.format(page=3) + '內容3\n')
+        # 頁碼索引存在旁邊的 .pages.json，下次開啟時直接沿用
+        self.assertTrue(os.path.exists(path + '.pages.json'))
+
+    def test_sections_from_merge_index(self):
+        fragments = ['# 院會紀錄\n', '# 委員會紀錄\n']
+        self.write('merged_md/第03期公報.md', '\n\n'.join(fragments) + '\n\n')
+        offset = len(fragments[0].encode('utf-8')) + 2
+        index = {'issue': '第03期公報', 'fragments': [
+            {'pages': 'p1-p10', 'start_page': 1, 'end_page': 10, 'source': 'a/a.md',
+             'offset': 0, 'length': len(fragments[0].encode('utf-8'))},
+            {'pages': 'p11-p20', 'start_page': 11, 'end_page': 20, 'source': 'b/b.md',
+             'offset': offset, 'length': len(fragments[1].encode('utf-8'))},
+        ]}
+        self.write('merged_md/第03期公報.index.json', json.dumps(index, ensure_ascii=False))
+
+        self.assertEqual(as_text(self.corpus.section(3, 'p11-p20')), '# 委員會紀錄\n')
+        self.assertEqual(as_text(self.corpus.pages(3, 12)), '# 委員會紀錄\n')
+        self.assertIsInstance(self.corpus.pages(3, 5), memoryview)
+
+
+class ConversionCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        self.pdf_path = os.path.join(self.base_dir, 'data', 'pdf', '第01期', 'LCIDC01_1130101.pdf')
+        self.txt_path = os.path.join(self.base_dir, 'data', 'txt', '第01期', 'LCIDC01_1130101.txt')
+        os.makedirs(os.path.dirname(self.pdf_path))
+        os.makedirs(os.path.dirname(self.txt_path))
+        write_synthetic_gazette(self.pdf_path, 3)
+        self.cache_path = os.path.join(self.base_dir, 'data', 'txt', '.conversion_cache.json')
+
+    def cache(self, version=pdfminer.__version__, options=None):
+        return ConversionCache(self.cache_path, 'pdfminer', version, options or {'shard_pages': 0})
+
+    def convert(self):
+        write_pages_atomic(self.txt_path, pdfminer_pages(self.pdf_path))
+        cache = self.cache()
+        cache.record(self.pdf_path, self.txt_path)
+        return cache
+
+    def test_stale_reasons(self):
+        self.assertEqual(self.cache().stale_reason(self.pdf_path, self.txt_path), 'output missing')
+        self.convert()
+        self.assertIsNone(self.cache().stale_reason(self.pdf_path, self.txt_path))
+
+        self.assertEqual(self.cache(version='0').stale_reason(self.pdf_path, self.txt_path),
+                         f'converted by pdfminer {pdfminer.__version__}')
+        self.assertEqual(self.cache(options={'shard_pages': 2}).stale_reason(self.pdf_path, self.txt_path),
+                         'options changed')
+
+        with open(self.txt_path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.txt_path) // 2)
+        self.assertEqual(self.cache().stale_reason(self.pdf_path, self.txt_path), 'output incomplete or modified')
+
+        self.convert()
+        write_synthetic_gazette(self.pdf_path, 3, seed=1)
+        self.assertEqual(self.cache().stale_reason(self.pdf_path, self.txt_path), 'PDF changed')
+
+    def test_adopt_existing_outputs(self):
+        # 快照檔建立之前轉換好的 TXT 以 --adopt-existing 記錄，不重新轉換
+        write_pages_atomic(self.txt_path, pdfminer_pages(self.pdf_path))
+        mtime_ns = os.stat(self.txt_path).st_mtime_ns
+        self.assertEqual(self.cache().stale_reason(self.pdf_path, self.txt_path), NO_CACHE_ENTRY)
+
+        with self.settings(BASE_DIR=self.base_dir):
+            stdout = io.StringIO()
+            call_command('convert_pdf_to_txt_easy', '--dry-run', '--adopt-existing', stdout=stdout)
+            self.assertIn(f'Would adopt {self.txt_path}', stdout.getvalue())
+            self.assertFalse(os.path.exists(self.cache_path))
+
+            call_command('convert_pdf_to_txt_easy', '--adopt-existing', stdout=io.StringIO())
+
+        self.assertEqual(os.stat(self.txt_path).st_mtime_ns, mtime_ns)
+        self.assertIsNone(self.cache().stale_reason(self.pdf_path, self.txt_path))
+
+
+def convert_shard_failing_after_first(pdf_path, start, end, shard_path):
+    # 第一段正常轉換，之後的段落都失敗
+    if start > 0:
+        raise ValueError(f'shard {start} failed')
+    return convert_shard_pdfminer(pdf_path, start, end, shard_path)
+
+
+class ShardedConversionTests(SimpleTestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        self.pdf_path = os.path.join(self.base_dir, 'LCIDC01_1130101.pdf')
+        self.txt_path = os.path.join(self.base_dir, 'LCIDC01_1130101.txt')
+        write_synthetic_gazette(self.pdf_path, 5)
+
+    def read(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def test_shards_are_stitched_in_page_order(self):
+        expected_path = os.path.join(self.base_dir, 'expected.txt')
+        write_pages_atomic(expected_path, pdfminer_pages(self.pdf_path), with_markers=True)
+
+        results = list(convert_files_sharded([(self.pdf_path, self.txt_path)], convert_shard_pdfminer, 2, 3))
+
+        self.assertEqual(results, [((self.pdf_path, 5, None), self.txt_path)])
+        # 不論各段完成的順序，接回的結果與逐頁轉換整份文件相同，且暫存的段落檔都已刪除
+        self.assertEqual(self.read(self.txt_path), self.read(expected_path))
+        self.assertEqual(sorted(os.listdir(self.base_dir)), ['LCIDC01_1130101.pdf', 'LCIDC01_1130101.txt',
+                                                             'expected.txt'])
+
+    def test_failed_shard_keeps_previous_output(self):
+        with open(self.txt_path, 'w', encoding='utf-8') as f:
+            f.write('previous')
+
+        results = list(convert_files_sharded([(self.pdf_path, self.txt_path)], convert_shard_failing_after_first,
+                                             2, 2))
+
+        (pdf_path, pages, error), _ = results[0]
+        self.assertEqual((pdf_path, pages), (self.pdf_path, 0))
+        self.assertRegex(error, r'shard [24] failed')
+        self.assertEqual(self.read(self.txt_path), 'previous')
+        self.assertEqual(sorted(os.listdir(self.base_dir)), ['LCIDC01_1130101.pdf', 'LCIDC01_1130101.txt'])
+
+    def test_stitch_failure_removes_partial_output(self):
+        with open(self.txt_path, 'w', encoding='utf-8') as f:
+            f.write('previous')
+        shard_paths = [os.path.join(self.base_dir, f'{index}.shard') for index in range(3)]
+        for index, shard_path in enumerate(shard_paths[:2]):
+            with open(shard_path, 'w', encoding='utf-8') as f:
+                f.write(PAGE_MARKER.format(page=index + 1))
+
+        stitch_shards(self.txt_path, [shard_paths[1], shard_paths[0]])
+        self.assertEqual(self.read(self.txt_path), PAGE_MARKER.format(page=2) + PAGE_MARKER.format(page=1))
+
+        with self.assertRaises(FileNotFoundError):
+            stitch_shards(self.txt_path, shard_paths)
+        self.assertEqual(self.read(self.txt_path), PAGE_MARKER.format(page=2) + PAGE_MARKER.format(page=1))
+        self.assertFalse(os.path.exists(self.txt_path + '.tmp'))
+
+
+def stub_marker_convert(pdf_path, start_page=0, max_pages=None):
+    # 不載入 marker 模型，以頁碼範圍產生可辨識的輸出
+    if max_pages is None:
+        return f'marker {os.path.basename(pdf_path)}\n'
+    return ''.join(f'marker page {page + 1}\n' for page in range(start_page, start_page + max_pages))
+
+
+class MarkerConversionTests(SimpleTestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        self.pdf_dir = os.path.join(self.base_dir, 'pdf')
+        self.txt_dir = os.path.join(self.base_dir, 'txt')
+        os.makedirs(self.pdf_dir)
+        write_synthetic_gazette(os.path.join(self.pdf_dir, 'LCIDC01_1130101.pdf'), 3)
+        # 工作行程以 fork 建立，會沿用這裡替換的函式
+        for target, stub in (('dataprocessor.conversion.marker_convert', stub_marker_convert),
+                             ('dataprocessor.conversion.load_marker_models', lambda: None),
+                             (f'{HybridConvertCommand.__module__}.load_marker_models', lambda: None),
+                             (f'{HybridConvertCommand.__module__}.marker_available', lambda: True)):
+            patcher = mock.patch(target, side_effect=stub)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.command = MarkerConvertCommand(stdout=io.StringIO())
+        self.command.marker_version = lambda: 'test'
+        self.logger = logging.getLogger('dataprocessor.tests')
+
+    def test_stream_writes_page_markers(self):
+        with self.assertLogs(self.logger, level='INFO'):
+            self.command.process_directory(self.pdf_dir, self.txt_dir, self.logger, stream=True)
+
+        with open(os.path.join(self.txt_dir, 'LCIDC01_1130101.txt'), 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), ''.join(PAGE_MARKER.format(page=page) + f'marker page {page}\n'
+                                               for page in (1, 2, 3)))
+
+    def test_score_page_reasons(self):
+        stats = {'lines': [(72, 40)] * 20, 'graphics': 0, 'images': 0}
+        self.assertEqual(score_page('立法院' * 50, stats), [])
+        self.assertEqual(score_page('立法院', {**stats, 'images': 1}), ['low_text_density'])
+        self.assertEqual(score_page('立法院' * 50 + '(cid:12)' * 40, stats), ['garbled_cjk'])
+        self.assertEqual(score_page('立法院' * 50, {**stats, 'graphics': 12}), ['table_like'])
+        table = {'lines': [(x, 6) for x in (72, 172, 272) for _ in range(6)], 'graphics': 0, 'images': 0}
+        self.assertEqual(score_page('立法院' * 50, table), ['table_like'])
+
+    def test_hybrid_routes_flagged_pages_to_marker(self):
+        pdf_path = os.path.join(self.pdf_dir, 'LCIDC01_1130101.pdf')
+        write_synthetic_gazette(pdf_path, 6)
+        pdfminer_texts = [text for _, text, _ in pdfminer_layout_pages(pdf_path)]
+        command = HybridConvertCommand(stdout=io.StringIO())
+
+        with self.assertLogs(self.logger, level='INFO') as logs:
+            summary = command.process_directory(self.pdf_dir, self.txt_dir, self.logger, workers=2)
+
+        # 合成公報的第 5 頁是表格，只有這一頁交給 marker，合併時仍依頁碼順序並保留其他頁的 pdfminer 結果
+        expected = ''.join(PAGE_MARKER.format(page=index + 1) + ('marker page 5\n' if index == 4 else text)
+                           for index, text in enumerate(pdfminer_texts))
+        with open(os.path.join(self.txt_dir, 'LCIDC01_1130101.txt'), 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), expected)
+        self.assertIn('(1/6 pages via marker)', '\n'.join(logs.output))
+        self.assertEqual(sorted(os.listdir(self.txt_dir)), ['.conversion_cache.json', 'LCIDC01_1130101.txt'])
+        self.assertEqual(summary, {'pages': 6, 'marker_routed': 1, 'marker_converted': 1})
+
+    def test_hybrid_without_marker_keeps_pdfminer_pages(self):
+        pdf_path = os.path.join(self.pdf_dir, 'LCIDC01_1130101.pdf')
+        write_synthetic_gazette(pdf_path, 6)
+        pdfminer_texts = [text for _, text, _ in pdfminer_layout_pages(pdf_path)]
+        command = HybridConvertCommand(stdout=io.StringIO())
+
+        with mock.patch(f'{HybridConvertCommand.__module__}.marker_available', return_value=False), \
+                self.assertLogs(self.logger, level='INFO') as logs:
+            summary = command.process_directory(self.pdf_dir, self.txt_dir, self.logger, workers=2)
+
+        with open(os.path.join(self.txt_dir, 'LCIDC01_1130101.txt'), 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), ''.join(PAGE_MARKER.format(page=index + 1) + text
+                                               for index, text in enumerate(pdfminer_texts)))
+        self.assertEqual(summary, {'pages': 6, 'marker_routed': 1, 'marker_converted': 0})
+        self.assertIn('marker is not installed; keeping pdfminer text for 1 flagged pages', '\n'.join(logs.output))
+
+
+class BatchConversionTests(SimpleTestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        self.jobs = []
+        for index in range(4):
+            pdf_path = os.path.join(self.base_dir, f'LCIDC01_11301{index:02d}.pdf')
+            write_synthetic_gazette(pdf_path, 1, seed=index)
+            self.jobs.append((pdf_path, pdf_path[:-4] + '.txt'))
+        self.load_log = os.path.join(self.base_dir, 'loads.log')
+
+        def load_all_marker_models():
+            # 在工作行程中記錄每次實際載入模型的行程
+            with open(self.load_log, 'a', encoding='ascii') as f:
+                f.write(f'{os.getpid()}\n')
+            return object()
+
+        for target, stub in (('load_all_marker_models', load_all_marker_models),
+                             ('marker_convert', stub_marker_convert)):
+            patcher = mock.patch(f'dataprocessor.conversion.{target}', side_effect=stub)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_models_load_once_per_worker(self):
+        cache = ConversionCache(os.path.join(self.base_dir, '.conversion_cache.json'), 'marker', 'test', {})
+        logger = logging.getLogger('dataprocessor.tests')
+        command = MarkerConvertCommand(stdout=io.StringIO())
+
+        with self.assertLogs(logger, level='INFO') as logs:
+            command.convert_in_batches(self.jobs, 2, 1, cache, logger)
+
+        with open(self.load_log, 'r', encoding='ascii') as f:
+            loads = f.read().split()
+        # 每個工作行程只載入一次模型，之後的每一批文件都重用
+        self.assertLessEqual(len(loads), 2)
+        self.assertEqual(len(loads), len(set(loads)))
+        for pdf_path, txt_path in self.jobs:
+            with open(txt_path, 'r', encoding='utf-8') as f:
+                self.assertEqual(f.read(), f'marker {os.path.basename(pdf_path)}\n')
+            self.assertIsNone(cache.stale_reason(pdf_path, txt_path))
+        output = '\n'.join(logs.output)
+        self.assertIn('Batch conversion: 4 documents', output)
+        self.assertIn('(estimated as warm + model load', output)
+
+
+class MergeMarkdownTests(SimpleTestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        self.issue_dir = os.path.join(self.base_dir, 'data', 'md', '第03期公報')
+        # 第 10 頁開始的片段排在第 2 頁之後，依頁碼數值而不是字串排序
+        self.fragments = {'LCIDC01_p10-p12': '# 委員會紀錄\n時　間：113年3月1日\n', 'LCIDC01_p2-p9': '# 院會紀錄\n'}
+        for subfolder, text in self.fragments.items():
+            os.makedirs(os.path.join(self.issue_dir, subfolder))
+            with open(os.path.join(self.issue_dir, subfolder, 'a.md'), 'w', encoding='utf-8') as f:
+                f.write(text)
+
+    def merge(self):
+        stdout = io.StringIO()
+        with self.settings(BASE_DIR=self.base_dir):
+            call_command('merge_md', stdout=stdout)
+        return stdout.getvalue()
+
+    def test_index_offsets_and_skip_unchanged(self):
+        self.assertIn('成功合併', self.merge())
+
+        merged_dir = os.path.join(self.base_dir, 'data', 'merged_md')
+        with open(os.path.join(merged_dir, '第03期公報.md'), 'rb') as f:
+            merged = f.read()
+        with open(os.path.join(merged_dir, '第03期公報.index.json'), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.assertEqual([fragment['pages'] for fragment in index['fragments']], ['p2-p9', 'p10-p12'])
+        for fragment in index['fragments']:
+            subfolder = os.path.dirname(fragment['source'])
+            data = merged[fragment['offset']:fragment['offset'] + fragment['length']]
+            self.assertEqual(data, self.fragments[subfolder].encode('utf-8'))
+
+        with GazetteCorpus(os.path.join(self.base_dir, 'data')) as corpus:
+            self.assertEqual(as_text(corpus.section(3, 'p10-p12')), self.fragments['LCIDC01_p10-p12'])
+
+        self.assertIn('沒有變動，略過合併', self.merge())
+
+        # 片段的修改時間改變後重新合併
+        fragment_path = os.path.join(self.issue_dir, 'LCIDC01_p2-p9', 'a.md')
+        stat = os.stat(fragment_path)
+        os.utime(fragment_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertIn('成功合併', self.merge())
+
+
+class SegmenterTests(SimpleTestCase):
+    # testdata/segmenter 中是依公報實際格式節錄的片段：pdfminer 輸出的 TXT 與 marker 輸出的 MD
+    def read(self, name):
+        with open(os.path.join(TESTDATA_DIR, 'segmenter', name), 'rb') as f:
+            return f.read()
+
+    def test_txt_records(self):
+        data = self.read('第13期_LCIDC01_1131301.txt')
+        records = list(segment(data))
+
+        # 目錄中的標題與正文中「上次會議紀錄」之後的「時間」都不應被當成新紀錄
+        self.assertEqual([record['title'] for record in records], [
+            '立法院第11屆第1會期內政委員會第1次全體委員會議紀錄',
+            '立法院第11屆第1會期經濟委員會第2次全體委員會議紀錄',
+        ])
+        self.assertEqual(set(records[0]['headers']), {'time', 'location', 'chair', 'attendees'})
+        self.assertEqual(records[0]['end'], records[1]['start'])
+        self.assertEqual(records[1]['end'], len(data))
+        self.assertTrue(data[records[1]['start']:].startswith('立法院第11屆第1會期經濟委員會'.encode('utf-8')))
+        chair = records[0]['headers']['chair']
+        self.assertTrue(data[chair:].startswith('主　　席　陳委員秀寶'.encode('utf-8')))
+
+    def test_markdown_records(self):
+        records = list(segment(self.read('第14期公報.md')))
+
+        self.assertEqual([record['title'] for record in records], [
+            '立法院第11屆第1會期第3次會議紀錄',
+            '立法院第11屆第1會期司法及法制委員會第3次全體委員會議紀錄',
+        ])
+        self.assertNotIn('attendees', records[0]['headers'])
+
+    def test_page_markers_inside_header(self):
+        # 換頁標記夾在斷成兩行的標題之間、以及標頭欄位之間
+        records = list(segment(self.read('第15期公報.md')))
+
+        self.assertEqual([record['title'] for record in records], [
+            '立法院第11屆第1會期交通委員會第4次全體委員會議紀錄',
+        ])
+        self.assertEqual(set(records[0]['headers']), {'time', 'location', 'chair', 'attendees'})
+        self.assertTrue(self.read('第15期公報.md')[records[0]['start']:].startswith('立法院第11屆'.encode('utf-8')))
+
+    def test_document_pages(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        os.makedirs(os.path.join(data_dir, 'txt', '第13期'))
+        shutil.copy(os.path.join(TESTDATA_DIR, 'segmenter', '第13期_LCIDC01_1131301.txt'),
+                    os.path.join(data_dir, 'txt', '第13期', 'LCIDC01_1131301.txt'))
+        corpus = GazetteCorpus(data_dir)
+        self.addCleanup(corpus.close)
+
+        records = list(segment_document(corpus.txt(13)))
+
+        self.assertEqual([(record['record'], record['start_page']) for record in records], [(1, 2), (2, 4)])
+
+
+class MeetingInfoTests(SimpleTestCase):
+    def records(self, name):
+        with open(os.path.join(TESTDATA_DIR, 'segmenter', name), 'rb') as f:
+            data = f.read()
+        return [(data[record['start']:record['end']].decode('utf-8'), record['title']) for record in segment(data)]
+
+    def test_committee_record(self):
+        text, title = self.records('第13期_LCIDC01_1131301.txt')[0]
+
+        info = extract_meeting_info(text, title)
+
+        self.assertEqual(info['meeting_time'], '中華民國113年2月26日（星期一）9時1分至12時41分')
+        self.assertEqual(info['meeting_location'], '群賢樓101會議室')
+        # 出席委員名單在「委員出席6人」與「列席委員」之前結束
+        self.assertEqual(info['attendees'], ['陳秀寶', '林思銘', '王美惠', '徐欣瑩', '牛煦庭', '黃國昌'])
+        self.assertEqual(info['meeting_type'], '委員會全體委員會議')
+        self.assertEqual((info['confidence'], info['missing']), (1.0, []))
+
+    def test_markdown_fields_and_missing_attendees(self):
+        (plenary, plenary_title), (committee, committee_title) = self.records('第14期公報.md')
+
+        info = extract_meeting_info(plenary, plenary_title)
+        self.assertEqual(info['meeting_location'], '本院議場')
+        self.assertEqual(info['meeting_type'], '院會')
+        self.assertEqual(info['missing'], ['attendees'])
+        self.assertLess(info['confidence'], 0.8)
+
+        self.assertEqual(extract_meeting_info(committee, committee_title)['attendees'], ['吳宗憲', '翁曉玲', '沈發惠'])
+
+    def test_attendees_across_page_marker_with_romanized_names(self):
+        text, title = self.records('第15期公報.md')[0]
+
+        info = extract_meeting_info(text, title)
+
+        # 名單在換頁標記之後繼續，原住民族委員的族語拼音保留在姓名中
+        self.assertEqual(info['attendees'], ['陳素月', '林俊憲', '伍麗華Saidhai‧Tahovecahe', '鄭天財Sra Kacaw',
+                                             '黃仁', '李昆澤'])
+        self.assertEqual(info['meeting_location'], '紅樓301會議室')
+        self.assertEqual((info['confidence'], info['missing']), (1.0, []))
+
+
+class SearchIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        self.index = SearchIndex(os.path.join(self.data_dir, 'index'))
+
+    def write(self, relative_path, text):
+        path = os.path.join(self.data_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def update(self):
+        with GazetteCorpus(self.data_dir) as corpus:
+            return self.index.update(corpus, self.data_dir)
+
+    def test_phrase_and_boolean_queries(self):
+        # 第二頁的「國土安全」被轉換器斷成兩行，仍應視為相鄰
+        self.write('txt/第01期/a.txt', '主席：討論國土安全預算。\x0c王委員：國土\n安全與災害防救。\x0c部長：國土，安全。\n')
+        self.update()
+
+        hits = self.index.search('國土安全')
+        self.assertEqual([(hit['page'], len(hit['offsets'])) for hit in hits], [(1, 1), (2, 1)])
+        with open(os.path.join(self.data_dir, 'txt', '第01期', 'a.txt'), 'rb') as f:
+            data = f.read()
+        self.assertTrue(data[hits[1]['offsets'][0]:].startswith('國土\n安全'.encode('utf-8')))
+
+        self.assertEqual([hit['page'] for hit in self.index.search('國土安全 預算')], [1])
+        self.assertEqual([hit['page'] for hit in self.index.search('國土安全 -預算')], [2])
+        self.assertEqual([hit['page'] for hit in self.index.search('預算 OR 災害防救')], [1, 2])
+        self.assertEqual(self.index.search('"安全預算的"'), [])
+
+    def test_incremental_update(self):
+        self.write('txt/第01期/a.txt', '第一期的內容')
+        self.assertEqual(self.update()['added'], 1)
+        self.assertEqual(self.update()['unchanged'], 1)
+
+        self.write('txt/第02期/b.txt', '第二期提到國土安全')
+        path = self.write('txt/第01期/a.txt', '第一期也提到國土安全')
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+        counts = self.update()
+        self.assertEqual((counts['added'], counts['updated']), (1, 1))
+        self.assertEqual([hit['issue'] for hit in self.index.search('國土安全')], [1, 2])
+
+        os.remove(path)
+        self.assertEqual(self.update()['removed'], 1)
+        self.assertEqual([hit['issue'] for hit in SearchIndex(self.index.index_dir).search('國土安全')], [2])
+
+
+class LocalVectorStoreTests(SimpleTestCase):
+    TEXTS = ['國土安全與災害防救', '少子化與高齡化的挑戰', '預算編列請主計總處說明']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_search_texts(self):
+        for quantized in (False, True):
+            path = os.path.join(self.directory, str(quantized))
+            store = LocalVectorStore(path, quantized=quantized, embedding=HashingEmbedding())
+            store.add_texts(self.TEXTS, [{'id': index} for index in range(len(self.TEXTS))], batch_size=2)
+
+            # 重新開啟後以 mmap 讀取同樣的結果
+            store = LocalVectorStore(path, embedding=HashingEmbedding())
+            results = store.search_texts(['高齡化社會的挑戰', '災害防救演習'], k=2)
+            self.assertEqual([[item['id'] for _, item in result] for result in results], [[1, 0], [0, 1]])
+            self.assertGreater(results[0][0][0], results[0][1][0])
+
+    def test_blocks_match_full_search(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((50, 16)).astype(np.float32)
+        store = LocalVectorStore(self.directory, dim=16)
+        store.add(vectors, [{'row': row} for row in range(50)])
+
+        queries = rng.standard_normal((3, 16))
+        self.assertEqual(store.search(queries, k=5, block_rows=7), store.search(queries, k=5))
+
+    def test_interrupted_append_is_ignored(self):
+        store = LocalVectorStore(self.directory, dim=4)
+        store.add(np.eye(4)[:2], [{'row': 0}, {'row': 1}])
+        # 模擬寫入向量與中繼資料後、更新 store.json 前中斷
+        with open(os.path.join(self.directory, 'vectors.f32'), 'ab') as f:
+            f.write(b'\x00' * 10)
+        with open(os.path.join(self.directory, 'metadata.jsonl'), 'a', encoding='utf-8') as f:
+            f.write('{"row": 99')
+
+        store = LocalVectorStore(self.directory)
+        self.assertEqual(len(store), 2)
+        store.add(np.eye(4)[2:3], [{'row': 2}])
+
+        store = LocalVectorStore(self.directory)
+        self.assertEqual(store.search(np.eye(4)[2], k=1)[0][0][1], {'row': 2})
+        self.assertEqual(len(store.load_metadata()), 3)
+
+    def test_embedding_mismatch(self):
+        LocalVectorStore(self.directory, embedding=HashingEmbedding(64))
+        with self.assertRaises(ValueError):
+            LocalVectorStore(self.directory, embedding=HashingEmbedding(128))
+
+
+class ChunkerTests(SimpleTestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        for issue in (13, 14):
+            os.makedirs(os.path.join(self.data_dir, 'txt', f'第{issue}期'))
+            shutil.copy(os.path.join(TESTDATA_DIR, 'segmenter', '第13期_LCIDC01_1131301.txt'),
+                        os.path.join(self.data_dir, 'txt', f'第{issue}期', 'a.txt'))
+        self.corpus = GazetteCorpus(self.data_dir)
+        self.addCleanup(self.corpus.close)
+
+    def chunks(self, issue, ledger=None, **kwargs):
+        chunks = chunk_document(self.corpus.txt(issue), approximate_tokens, **kwargs)
+        return list(ledger.filter(chunks) if ledger else chunks)
+
+    def test_chunks_follow_records_and_speakers(self):
+        chunks = self.chunks(13, max_tokens=60, overlap_tokens=20)
+        records = list(segment_document(self.corpus.txt(13)))
+
+        self.assertTrue(all(chunk['tokens'] <= 60 for chunk in chunks))
+        for chunk in chunks:
+            if chunk['record'] is None:
+                continue
+            record = records[chunk['record'] - 1]
+            self.assertTrue(record['start'] <= chunk['start'] < chunk['end'] <= record['end'])
+        # 相鄰的 chunk 以前一個 chunk 結尾的發言重疊
+        overlapping = [(a, b) for a, b in zip(chunks, chunks[1:]) if b['start'] < a['end']]
+        self.assertTrue(overlapping)
+        self.assertTrue(all(SPEAKER_RE.match(b['text']) for _, b in overlapping))
+
+    def test_text_outside_records_is_chunked(self):
+        chunks = self.chunks(13, max_tokens=60, overlap_tokens=0)
+        records = list(segment_document(self.corpus.txt(13)))
+
+        # 第一份紀錄之前的目錄也要切成 chunk，且所有 chunk 依序涵蓋整份文件
+        preamble = [chunk for chunk in chunks if chunk['record'] is None]
+        self.assertEqual(preamble[0]['start'], 0)
+        self.assertLessEqual(preamble[-1]['end'], records[0]['start'])
+        self.assertIn('目　　錄', preamble[0]['text'])
+        self.assertEqual(chunks[-1]['end'], len(self.corpus.txt(13).mm))
+        self.assertTrue(all(a['end'] == b['start'] for a, b in zip(chunks, chunks[1:])))
+
+    def test_document_without_records_is_chunked_whole(self):
+        path = os.path.join(self.data_dir, 'txt', '第13期', 'b.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('立法院公報　第113卷　第13期　院會紀錄\n\n王委員美惠：本院會議沒有委員會紀錄的標頭。\n')
+
+        chunks = list(chunk_document(self.corpus.txt(13, 'b.txt'), approximate_tokens))
+        self.assertEqual([(chunk['record'], chunk['start']) for chunk in chunks], [(None, 0)])
+        self.assertIn('沒有委員會紀錄的標頭', chunks[0]['text'])
+
+    def test_ledger_skips_seen_chunks(self):
+        ledger = ChunkLedger(os.path.join(self.data_dir, 'seen.txt'))
+        first = self.chunks(13, ledger)
+        ledger.save()
+        self.assertEqual(self.chunks(14, ledger), [])
+        self.assertEqual(ledger.stats['saved_bytes'], sum(chunk['end'] - chunk['start'] for chunk in first))
+
+        # 重新載入後仍記得已處理的 chunk
+        ledger = ChunkLedger(os.path.join(self.data_dir, 'seen.txt'))
+        self.assertEqual(self.chunks(13, ledger), [])
+        self.assertEqual(ledger.stats['duplicate_chunks'], len(first))
+
+    def test_embedding_has_its_own_ledger(self):
+        # 先只輸出 JSONL，之後加上 --embed 時仍要把所有 chunk 寫入向量庫
+        base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base_dir)
+        shutil.copytree(os.path.join(self.data_dir, 'txt'), os.path.join(base_dir, 'data', 'txt'))
+        with self.settings(BASE_DIR=base_dir):
+            call_command('chunk_gazette', '--issue', '13', stdout=io.StringIO())
+            call_command('chunk_gazette', '--issue', '13', '--embed', stdout=io.StringIO())
+            call_command('chunk_gazette', '--issue', '13', '--embed', stdout=io.StringIO())
+
+        chunks = self.chunks(13)
+        store = LocalVectorStore(os.path.join(base_dir, 'data', 'vector_store', HashingEmbedding().name))
+        self.assertEqual(len(store), len(chunks))
+        with open(os.path.join(base_dir, 'data', 'chunks', 'txt', '第13期.jsonl'), 'r', encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), len(chunks))
+
+
+class BoilerplateTests(SimpleTestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        pages = []
+        for page in range(1, 11):
+            lines = ['立法院公報　第113卷　第13期　委員會紀錄', f'王委員美惠：第{page}頁的發言內容。', '預算數',
+                     str(1000 + page), '', '主　　席：好。', '', '（本次會議發言紀錄依委員要求列入公報，不另宣讀。）',
+                     f'－{page}－']
+            if page == 3:
+                lines.insert(6, 'ＣＯＶＩＤ－１９　　疫苗　採購')
+            pages.append('\n'.join(lines) + '\n')
+        self.path = os.path.join(self.data_dir, 'txt', '第13期', 'a.txt')
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('\x0c'.join(pages))
+        self.corpus = GazetteCorpus(self.data_dir)
+        self.addCleanup(self.corpus.close)
+
+    def test_strips_repeated_lines_and_keeps_offsets(self):
+        document = self.corpus.txt(13)
+        text, offset_map = clean_document(document, learn_boilerplate([document]))
+
+        self.assertNotIn('立法院公報', text)
+        self.assertNotIn('不另宣讀', text)
+        self.assertNotIn('－3－', text)
+        # 重複的簡短發言不是樣板文字
+        self.assertEqual(text.count('主　席：好。'), 10)
+        self.assertIn('<!-- page 3 -->\n王委員美惠：第3頁的發言內容。\n', text)
+        # 正文中只有數字的行（表格儲存格）不是頁碼
+        self.assertIn('\n1003\n', text)
+
+        clean_offset = text.encode('utf-8').index('第3頁'.encode('utf-8'))
+        with open(self.path, 'rb') as f:
+            original = f.read()
+        self.assertTrue(original[original_offset(offset_map, clean_offset):].startswith('第3頁'.encode('utf-8')))
+
+    def test_offsets_inside_normalized_lines(self):
+        document = self.corpus.txt(13)
+        text, offset_map = clean_document(document, learn_boilerplate([document]))
+        with open(self.path, 'rb') as f:
+            original = f.read()
+
+        self.assertIn('\nCOVID－19　疫苗　採購\n', text)
+        clean = text.encode('utf-8')
+        # 全形英數字轉半形、連續全形空白合併後，行內每個位置仍對應到原始文件中的同一個字
+        for clean_text, original_text in (('19', '１９'), ('疫苗', '疫苗'), ('採購', '採購'), ('VID', 'ＶＩＤ')):
+            clean_offset = clean.index(clean_text.encode('utf-8'))
+            self.assertTrue(original[original_offset(offset_map, clean_offset):].startswith(
+                original_text.encode('utf-8')), clean_text)
+
+    def test_no_blank_lines_at_page_edges(self):
+        document = self.corpus.txt(13)
+        text, _ = clean_document(document, learn_boilerplate([document]))
+
+        # 頁尾被移除的行之前的空白行不輸出，文件與每一頁都不以空白行結尾
+        self.assertFalse(text.endswith('\n\n'))
+        self.assertNotIn('\n\n<!--', text)
+        # 頁中的空白行仍保留一行
+        self.assertIn('1003\n\n主　席：好。', text)
+
+    def test_normalize_line(self):
+        self.assertEqual(normalize_line('ＣＯＶＩＤ－１９　　疫苗\t 預算  '), 'COVID－19　疫苗 預算')
+
+
+class MockAssistantsServer(ThreadingHTTPServer):
+    # 本地的 Assistants API：run 依序經過 queued → requires_action → in_progress → completed，
+    # 訊息列表每頁最多 PAGE_SIZE 筆，並記錄同時進行中的 run 數，以及每個 run 的 file_search 可搜尋的向量庫
+    PAGE_SIZE = 2
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), MockAssistantsHandler)
+        self.lock = threading.Lock()
+        self.threads = {}
+        self.runs = {}
+        self.tool_outputs = {}
+        self.files = {}
+        self.vector_stores = {}
+        self.assistant_stores = {}
+        self.thread_stores = {}
+        self.run_stores = {}
+        self.completions = []
+        self.active_runs = 0
+        self.peak_runs = 0
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/v1'
+
+    def message(self, thread_id, role, text):
+        messages = self.threads[thread_id]
+        return {'id': f'msg_{thread_id}_{len(messages):03d}', 'object': 'thread.message', 'created_at': len(messages),
+                'thread_id': thread_id, 'role': role, 'status': 'completed', 'assistant_id': None, 'run_id': None,
+                'content': [{'type': 'text', 'text': {'value': text, 'annotations': []}}],
+                'attachments': [], 'metadata': {}}
+
+    def file_batch(self, store_id):
+        count = len(self.vector_stores[store_id])
+        return {'id': f'vsfb_{store_id}', 'object': 'vector_store.files_batch', 'created_at': 0,
+                'vector_store_id': store_id, 'status': 'completed',
+                'file_counts': {'in_progress': 0, 'completed': count, 'failed': 0, 'cancelled': 0, 'total': count}}
+
+    def completion(self, body):
+        # chat.completions 一律以 extract_basic_information 的 tool call 回覆
+        self.completions.append(body)
+        arguments = json.dumps({'meeting_time': '113年3月5日', 'meeting_type': '院會', 'meeting_location': '議場',
+                                'attendees': ['韓國瑜', '江啟臣']}, ensure_ascii=False)
+        return {'id': f'chatcmpl_{len(self.completions)}', 'object': 'chat.completion', 'created': 0,
+                'model': body['model'], 'choices': [{'index': 0, 'finish_reason': 'tool_calls', 'message': {
+                    'role': 'assistant', 'content': None, 'tool_calls': [{
+                        'id': f'call_{len(self.completions)}', 'type': 'function',
+                        'function': {'name': 'extract_basic_information', 'arguments': arguments}}]}}]}
+
+    def run(self, run_id):
+        run = self.runs[run_id]
+        required_action = None
+        if run['status'] == 'requires_action':
+            required_action = {'type': 'submit_tool_outputs', 'submit_tool_outputs': {'tool_calls': [{
+                'id': f'call_{run_id}', 'type': 'function', 'function': {
+                    'name': 'extract_basic_information',
+                    'arguments': json.dumps({'meeting_time': '113年2月26日', 'meeting_type': '委員會會議',
+                                             'meeting_location': '本院紅樓101會議室', 'attendees': ['王美惠']},
+                                            ensure_ascii=False)}}]}}
+        return {'id': run_id, 'object': 'thread.run', 'created_at': 0, 'thread_id': run['thread_id'],
+                'assistant_id': run['assistant_id'], 'status': run['status'], 'required_action': required_action,
+                'instructions': run['instructions'], 'model': 'gpt-4o', 'tools': [], 'metadata': {}}
+
+
+class MockAssistantsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Type', '').startswith('multipart/form-data'):
+            return {'filename': re.search(rb'filename="([^"]*)"', data).group(1).decode('utf-8')}
+        return json.loads(data) if data else {}
+
+    def do_POST(self):
+        server = self.server
+        body = self.read_body()
+        parts = urlparse(self.path).path.strip('/').split('/')[1:]
+        with server.lock:
+            if parts == ['chat', 'completions']:
+                return self.send_json(server.completion(body))
+            if parts == ['files']:
+                file_id = f'file_{len(server.files)}'
+                server.files[file_id] = body['filename']
+                return self.send_json({'id': file_id, 'object': 'file', 'bytes': 0, 'created_at': 0,
+                                       'filename': body['filename'], 'purpose': 'assistants', 'status': 'processed'})
+            if parts == ['vector_stores']:
+                store_id = f'vs_{len(server.vector_stores)}'
+                server.vector_stores[store_id] = []
+                return self.send_json({'id': store_id, 'object': 'vector_store', 'created_at': 0,
+                                       'name': body.get('name'), 'status': 'completed', 'usage_bytes': 0,
+                                       'file_counts': {'in_progress': 0, 'completed': 0, 'failed': 0,
+                                                       'cancelled': 0, 'total': 0}})
+            if len(parts) == 3 and parts[0] == 'vector_stores' and parts[2] == 'file_batches':
+                server.vector_stores[parts[1]].extend(body['file_ids'])
+                return self.send_json(server.file_batch(parts[1]))
+            if len(parts) == 2 and parts[0] == 'assistants':
+                server.assistant_stores[parts[1]] = body['tool_resources']['file_search']['vector_store_ids']
+                return self.send_json({'id': parts[1], 'object': 'assistant', 'created_at': 0, 'model': 'gpt-4o',
+                                       'tools': [], 'metadata': {}})
+            if parts == ['threads']:
+                thread_id = f'thread_{len(server.threads)}'
+                server.threads[thread_id] = []
+                tool_resources = body.get('tool_resources') or {}
+                server.thread_stores[thread_id] = tool_resources.get('file_search', {}).get('vector_store_ids', [])
+                for message in body.get('messages', []):
+                    server.threads[thread_id].append(server.message(thread_id, message['role'], message['content']))
+                return self.send_json({'id': thread_id, 'object': 'thread', 'created_at': 0, 'metadata': {},
+                                       'tool_resources': None})
+            if len(parts) == 3 and parts[2] == 'runs':
+                run_id = f'run_{len(server.runs)}'
+                server.runs[run_id] = {'thread_id': parts[1], 'assistant_id': body['assistant_id'],
+                                       'instructions': body.get('instructions'), 'status': 'queued'}
+                # file_search 同時搜尋 thread 與 assistant 上的向量庫
+                server.run_stores[run_id] = (server.thread_stores[parts[1]]
+                                             + server.assistant_stores.get(body['assistant_id'], []))
+                server.active_runs += 1
+                server.peak_runs = max(server.peak_runs, server.active_runs)
+                return self.send_json(server.run(run_id))
+            if len(parts) == 5 and parts[4] == 'submit_tool_outputs':
+                server.tool_outputs[parts[3]] = body['tool_outputs']
+                server.runs[parts[3]]['status'] = 'in_progress'
+                return self.send_json(server.run(parts[3]))
+        self.send_json({'error': {'message': 'not found'}}, 404)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip('/').split('/')[1:]
+        with server.lock:
+            if len(parts) == 4 and parts[0] == 'vector_stores' and parts[2] == 'file_batches':
+                return self.send_json(server.file_batch(parts[1]))
+            if len(parts) == 3 and parts[0] == 'vector_stores' and parts[2] == 'files':
+                files = [{'id': file_id, 'object': 'vector_store.file', 'created_at': 0, 'usage_bytes': 0,
+                          'vector_store_id': parts[1], 'status': 'completed', 'last_error': None}
+                         for file_id in server.vector_stores[parts[1]]]
+                if 'after' in query:
+                    ids = [file['id'] for file in files]
+                    files = files[ids.index(query['after'][0]) + 1:]
+                return self.send_json({'object': 'list', 'data': files, 'has_more': False,
+                                       'first_id': files[0]['id'] if files else None,
+                                       'last_id': files[-1]['id'] if files else None})
+            if len(parts) == 4 and parts[2] == 'runs':
+                run = server.runs[parts[3]]
+                if run['status'] == 'queued':
+                    run['status'] = 'requires_action'
+                elif run['status'] == 'in_progress':
+                    run['status'] = 'completed'
+                    server.active_runs -= 1
+                    server.threads[parts[1]].append(server.message(parts[1], 'assistant', f'{parts[3]} 完成'))
+                return self.send_json(server.run(parts[3]))
+            if len(parts) == 3 and parts[2] == 'messages':
+                messages = server.threads[parts[1]]
+                if query.get('order') == ['desc']:
+                    messages = messages[::-1]
+                if 'after' in query:
+                    ids = [message['id'] for message in messages]
+                    messages = messages[ids.index(query['after'][0]) + 1:]
+                limit = min(int(query.get('limit', ['20'])[0]), server.PAGE_SIZE)
+                page = messages[:limit]
+                return self.send_json({'object': 'list', 'data': page, 'has_more': len(messages) > limit,
+                                       'first_id': page[0]['id'] if page else None,
+                                       'last_id': page[-1]['id'] if page else None})
+        self.send_json({'error': {'message': 'not found'}}, 404)
+
+
+class AssistantAPITests(SimpleTestCase):
+    def setUp(self):
+        self.server = MockAssistantsServer()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        with mock.patch.dict(os.environ, {'OPENAI_API_KEY': 'sk-test'}):
+            self.api = AssistantAPI(base_url=self.server.base_url)
+
+    def test_run_threads_concurrently(self):
+        async def run():
+            threads = [await self.api.create_thread_async([{'role': 'user', 'content': f'第{index}期'},
+                                                           {'role': 'user', 'content': '請問總共有幾份會議紀錄？'}])
+                       for index in range(5)]
+            jobs = [(thread.id, 'asst_test', '請列出會議基本資料') for thread in threads]
+            return await self.api.run_threads(jobs, concurrency=2, poll_interval=0.01)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = asyncio.run(run())
+
+        self.assertEqual(self.server.peak_runs, 2)
+        self.assertEqual(self.server.active_runs, 0)
+        self.assertEqual(len(self.server.tool_outputs), 5)
+        self.assertIn('本院紅樓101會議室', self.server.tool_outputs['run_0'][0]['output'])
+        for index, (run_result, messages) in enumerate(results):
+            self.assertEqual(run_result.status, 'completed')
+            # 三筆訊息分兩頁取得，依時間先後排列
+            self.assertEqual([message['role'] for message in messages], ['user', 'user', 'assistant'])
+            self.assertEqual(messages[0]['content'], f'第{index}期')
+            self.assertEqual(messages[-1]['content'], f'{run_result.id} 完成')
+
+    def test_count_records_locally(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        os.makedirs(os.path.join(data_dir, 'txt', '第13期'))
+        shutil.copy(os.path.join(TESTDATA_DIR, 'segmenter', '第13期_LCIDC01_1131301.txt'),
+                    os.path.join(data_dir, 'txt', '第13期', 'LCIDC01_1131301.txt'))
+
+        self.assertEqual(self.api.count_records(13, data_dir), {'LCIDC01_1131301.txt': 2})
+        # 不需要呼叫 Assistants API
+        self.assertEqual(self.server.threads, {})
+
+    def test_basic_information_falls_back_to_llm(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        os.makedirs(os.path.join(data_dir, 'txt', '第14期'))
+        for source, name in (('第13期_LCIDC01_1131301.txt', 'a.txt'), ('第14期公報.md', 'b.txt')):
+            shutil.copy(os.path.join(TESTDATA_DIR, 'segmenter', source), os.path.join(data_dir, 'txt', '第14期', name))
+
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            results = self.api.edition_basic_information(14, data_dir)
+
+        # 只有缺少出席委員的院會紀錄交給 LLM，且本地已解析的欄位不被 LLM 的結果覆蓋
+        self.assertEqual([result['source'] for result in results], ['local', 'local', 'llm', 'local'])
+        self.assertEqual(dict(self.api.extraction_stats), {'local': 3, 'llm': 1})
+        self.assertIn('本地解析 3 份，LLM 補齊 1 份', stdout.getvalue())
+        plenary = results[2]
+        self.assertEqual(plenary['attendees'], ['韓國瑜', '江啟臣'])
+        self.assertEqual(plenary['meeting_location'], '本院議場')
+        self.assertEqual(plenary['missing'], ['attendees'])
+        self.assertEqual(len(self.server.completions), 1)
+        request = self.server.completions[0]
+        self.assertEqual(request['tool_choice']['function']['name'], 'extract_basic_information')
+        self.assertIn('第3次會議紀錄', request['messages'][-1]['content'])
+
+    def test_analyze_editions_keep_vector_stores_per_thread(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        for edition in (1, 2):
+            os.makedirs(os.path.join(data_dir, 'txt', f'第{edition:02d}期'))
+            with open(os.path.join(data_dir, 'txt', f'第{edition:02d}期', f'第{edition}期紀錄.txt'), 'w',
+                      encoding='utf-8') as f:
+                f.write(f'第{edition}期公報')
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = asyncio.run(self.api.analyze_editions([1, 2], '請列出會議基本資料', data_dir=data_dir,
+                                                            poll_interval=0.01))
+
+        # 共用的 assistant 沒有被修改，每個 run 只能搜尋到自己那一期的向量庫
+        self.assertEqual(self.server.assistant_stores, {})
+        for edition, (run_result, _) in zip((1, 2), results):
+            self.assertEqual(run_result.status, 'completed')
+            stores = self.server.run_stores[run_result.id]
+            self.assertEqual(len(stores), 1)
+            self.assertEqual([self.server.files[file_id] for file_id in self.server.vector_stores[stores[0]]],
+                             [f'第{edition}期紀錄.txt'])
+
+
+class FakeDriveRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeMediaHttp:
+    def __init__(self, drive, file_id):
+        self.drive = drive
+        self.file_id = file_id
+
+    def request(self, uri, method='GET', headers=None):
+        if self.file_id in self.drive.failing:
+            raise ConnectionError('connection reset')
+        content = self.drive.contents[self.file_id]
+        return httplib2.Response({'status': '200', 'content-length': str(len(content))}), content
+
+
+class FakeMediaRequest:
+    def __init__(self, drive, file_id):
+        self.uri = f'https://drive.test/{file_id}'
+        self.headers = {}
+        self.http = FakeMediaHttp(drive, file_id)
+
+
+class FakeDriveService:
+    # 文件夾樹存在 items（id → metadata），changes 為每次 changes().list 要回傳的變動；
+    # files().list 每頁最多 page_size 筆，以測試 nextPageToken 分頁
+    def __init__(self, page_size=1000):
+        self.items = {}
+        self.contents = {}
+        self.failing = set()
+        self.changes_list = []
+        self.token = 1
+        self.page_size = page_size
+        self.downloads = []
+
+    def add(self, item_id, name, parent, content=None):
+        item = {'id': item_id, 'name': name, 'parents': [parent], 'modifiedTime': '2024-03-01T00:00:00Z',
+                'mimeType': 'application/vnd.google-apps.folder' if content is None else 'text/markdown'}
+        if content is not None:
+            item['md5Checksum'] = hashlib.md5(content).hexdigest()
+            self.contents[item_id] = content
+        self.items[item_id] = item
+        return item
+
+    def query(self, q):
+        items = [item for item in self.items.values() if not item.get('trashed')]
+        parent = re.search(r"'([^']*)' in parents", q)
+        if parent:
+            items = [item for item in items if parent.group(1) in item['parents']]
+        for field in ('mimeType', 'name'):
+            value = re.search(rf"\b{field}='([^']*)'", q)
+            if value:
+                items = [item for item in items if item[field] == value.group(1)]
+        return items
+
+    def change(self, item_id, **fields):
+        item = self.items[item_id] = {**self.items[item_id], **fields, 'modifiedTime': '2024-04-01T00:00:00Z'}
+        self.changes_list.append({'fileId': item_id, 'removed': False, 'file': dict(item)})
+
+    def files(self):
+        return self
+
+    def changes(self):
+        return self
+
+    def list(self, q=None, spaces=None, fields=None, pageSize=None, pageToken=None, includeRemoved=None):
+        if q is not None:
+            items = self.query(q)
+            start = int(pageToken or 0)
+            page = {'files': items[start:start + self.page_size]}
+            if start + self.page_size < len(items):
+                page['nextPageToken'] = str(start + self.page_size)
+            return FakeDriveRequest(page)
+        changes, self.changes_list = self.changes_list, []
+        self.token += 1
+        return FakeDriveRequest({'changes': changes, 'newStartPageToken': str(self.token)})
+
+    def getStartPageToken(self):
+        return FakeDriveRequest({'startPageToken': str(self.token)})
+
+    def get_media(self, fileId):
+        self.downloads.append(fileId)
+        return FakeMediaRequest(self, fileId)
+
+
+class DriveIncrementalSyncTests(SimpleTestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        override = self.settings(BASE_DIR=self.base_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.state_path = os.path.join(self.base_dir, 'data', 'drive_sync.json')
+        self.drive = FakeDriveService()
+        self.drive.add('root', 'md', 'drive')
+        self.drive.add('issue', '第01期', 'root')
+        self.drive.add('other', '其他', 'drive')
+        self.drive.add('a', 'a.md', 'issue', b'a')
+        self.drive.add('b', 'b.md', 'issue', b'b')
+        self.drive.add('m', 'm.md', 'issue', b'm')
+
+    def sync(self):
+        command = DriveSyncCommand(stdout=io.StringIO())
+        command.sync_incremental(self.drive, 'root', 2, self.state_path)
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def local_files(self):
+        issue_dir = os.path.join(self.base_dir, 'data', 'md', '第01期')
+        return sorted(name for name in os.listdir(issue_dir) if not name.endswith('.part'))
+
+    def test_failed_downloads_are_retried(self):
+        self.drive.failing = {'b'}
+        state = self.sync()
+        self.assertEqual(self.local_files(), ['a.md', 'm.md'])
+        self.assertEqual(list(state['pending']), ['b'])
+
+        # 新增、丟到垃圾桶、移出文件夾，以及一個仍然失敗的新文件
+        self.drive.failing = {'c'}
+        self.drive.add('c', 'c.md', 'issue', b'c')
+        self.drive.changes_list.append({'fileId': 'c', 'removed': False, 'file': dict(self.drive.items['c'])})
+        self.drive.change('a', trashed=True)
+        self.drive.change('m', parents=['other'])
+        state = self.sync()
+        self.assertEqual(self.local_files(), ['b.md'])
+        self.assertEqual(list(state['pending']), ['c'])
+        self.assertEqual(sorted(state['files']), ['b', 'c'])
+
+        # 沒有新的變動時仍會重試上次失敗的文件
+        self.drive.failing = set()
+        state = self.sync()
+        self.assertEqual(self.local_files(), ['b.md', 'c.md'])
+        self.assertEqual(state['pending'], {})
+
+    def test_new_parent_folder_later_in_the_same_change_list(self):
+        self.sync()
+
+        # 文件搬進新的文件夾，新文件夾（以及它的上層文件夾）的變動排在文件之後
+        self.drive.add('issue2', '第02期', 'root')
+        self.drive.add('sub', '附錄', 'issue2')
+        self.drive.change('a', parents=['issue2'])
+        self.drive.change('b', parents=['sub'])
+        self.drive.changes_list.append({'fileId': 'sub', 'removed': False, 'file': dict(self.drive.items['sub'])})
+        self.drive.changes_list.append({'fileId': 'issue2', 'removed': False, 'file': dict(self.drive.items['issue2'])})
+        state = self.sync()
+
+        self.assertEqual(state['files'], {
+            'a': os.path.join('第02期', 'a.md'),
+            'b': os.path.join('第02期', '附錄', 'b.md'),
+            'm': os.path.join('第01期', 'm.md'),
+        })
+        self.assertEqual(self.local_files(), ['m.md'])
+        md_dir = os.path.join(self.base_dir, 'data', 'md')
+        self.assertTrue(os.path.exists(os.path.join(md_dir, '第02期', 'a.md')))
+        self.assertTrue(os.path.exists(os.path.join(md_dir, '第02期', '附錄', 'b.md')))
+
+
+class DriveDownloadTests(SimpleTestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        override = self.settings(BASE_DIR=self.base_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.base_dir, 'data', 'md'))
+        self.drive = FakeDriveService(page_size=2)
+        self.command = DriveSyncCommand(stdout=io.StringIO())
+
+    def test_target_folder_found_on_later_page(self):
+        for index in range(5):
+            self.drive.add(f'folder{index}', f'其他{index}', 'drive')
+        self.drive.add('gazette', '立法院公報', 'drive')
+        for index in range(3):
+            self.drive.add(f'sub{index}', f'附件{index}', 'gazette')
+        self.drive.add('md', 'md', 'gazette')
+
+        self.assertEqual(self.command.get_target_folder_id(self.drive), 'md')
+
+    def test_folder_listing_reads_every_page(self):
+        self.drive.add('root', 'md', 'drive')
+        for index in range(5):
+            self.drive.add(f'f{index}', f'{index}.md', 'root', f'{index}'.encode())
+
+        files, failed = self.command.download_files(self.drive, 'root', '', 2)
+
+        self.assertEqual(sorted(item['id'] for item, _ in files), ['f0', 'f1', 'f2', 'f3', 'f4'])
+        self.assertEqual(failed, [])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.base_dir, 'data', 'md'))),
+                         ['0.md', '1.md', '2.md', '3.md', '4.md'])
+
+    def test_skips_files_matching_modified_time_or_md5(self):
+        self.drive.add('root', 'md', 'drive')
+        self.drive.add('same_time', 'a.md', 'root', b'a')
+        self.drive.add('same_md5', 'b.md', 'root', b'b')
+        self.drive.add('changed', 'c.md', 'root', b'c')
+        self.command.download_files(self.drive, 'root', '', 2)
+        self.assertEqual(sorted(self.drive.downloads), ['changed', 'same_md5', 'same_time'])
+
+        # 下載時本地修改時間已設為 Drive 的 modifiedTime；b.md 的時間不同但內容相同，c.md 的內容已改變
+        md_dir = os.path.join(self.base_dir, 'data', 'md')
+        os.utime(os.path.join(md_dir, 'b.md'), (0, 0))
+        with open(os.path.join(md_dir, 'c.md'), 'wb') as f:
+            f.write(b'old')
+        os.utime(os.path.join(md_dir, 'c.md'), (0, 0))
+        self.drive.downloads = []
+        self.command.download_files(self.drive, 'root', '', 2)
+
+        self.assertEqual(self.drive.downloads, ['changed'])
+        with open(os.path.join(md_dir, 'c.md'), 'rb') as f:
+            self.assertEqual(f.read(), b'c')
+        self.assertIn('下載 1，略過 2', self.command.stdout.getvalue())
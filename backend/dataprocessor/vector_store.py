@@ -0,0 +1,206 @@
+# dataprocessor/vector_store.py
+
+import os
+import json
+import hashlib
+import numpy as np
+from dataprocessor.search_index import tokenize
+
+# 本地向量庫：向量以 float32（或 int8 加上每列的縮放係數）附加寫入檔案並以 mmap 讀取，
+# 每列的中繼資料存在 metadata.jsonl。store.json 中的 count 與 metadata_bytes 是已完成寫入的範圍，
+# 寫到一半中斷時多出的尾端資料會被忽略並在下次附加時覆寫。
+
+STORE_VERSION = 1
+SEARCH_BLOCK_ROWS = 65536
+
+
+class HashingEmbedding:
+    # 不需要網路的確定性嵌入：將中文 bigram 與英數單字以雜湊投影到固定維度，供測試與離線使用
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f'hashing-bigram-{dim}'
+
+    def __call__(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token, _, _ in tokenize(text.encode('utf-8'), join_whitespace=True):
+                digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+                value = int.from_bytes(digest, 'little')
+                vectors[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        return vectors
+
+
+class OpenAIEmbedding:
+    def __init__(self, client, model='text-embedding-3-small', dim=1536):
+        self.client = client
+        self.model = model
+        self.dim = dim
+        self.name = f'openai-{model}'
+
+    def __call__(self, texts):
+        response = self.client.embeddings.create(model=self.model, input=list(texts))
+        return np.asarray([item.embedding for item in response.data], dtype=np.float32)
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize(vectors):
+    # 每列對稱量化成 int8，回傳 (int8 向量, 每列縮放係數)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales = np.where(scales == 0, 1, scales).astype(np.float32)
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+
+class LocalVectorStore:
+    def __init__(self, directory, dim=None, quantized=False, embedding=None):
+        self.directory = directory
+        self.header_path = os.path.join(directory, 'store.json')
+        self.metadata_path = os.path.join(directory, 'metadata.jsonl')
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.header_path):
+            with open(self.header_path, 'r', encoding='utf-8') as f:
+                self.header = json.load(f)
+            if dim is not None and dim != self.header['dim']:
+                raise ValueError(f"向量維度 {dim} 與既有向量庫的 {self.header['dim']} 不符")
+            if embedding is not None and embedding.name != self.header['embedding']:
+                raise ValueError(f"嵌入模型 {embedding.name} 與既有向量庫的 {self.header['embedding']} 不符")
+        else:
+            dim = dim or (embedding.dim if embedding else None)
+            if dim is None:
+                raise ValueError('建立新的向量庫時必須指定維度或嵌入函式')
+            self.header = {'version': STORE_VERSION, 'dim': dim, 'count': 0, 'metadata_bytes': 0,
+                           'quantized': quantized, 'embedding': embedding.name if embedding else None}
+            self.save_header()
+        self.embedding = embedding
+        self.metadata = None
+
+    @property
+    def dim(self):
+        return self.header['dim']
+
+    @property
+    def quantized(self):
+        return self.header['quantized']
+
+    def __len__(self):
+        return self.header['count']
+
+    def data_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def save_header(self):
+        tmp_path = self.header_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.header, f)
+        os.replace(tmp_path, self.header_path)
+
+    def append_rows(self, name, data, row_bytes):
+        # 截掉上次中斷時留下、尚未計入 count 的尾端資料後再附加
+        path = self.data_path(name)
+        with open(path, 'ab') as f:
+            f.truncate(len(self) * row_bytes)
+            f.write(data.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, vectors, metadatas):
+        vectors = normalize(vectors)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f'向量維度必須是 {self.dim}')
+        if len(vectors) != len(metadatas):
+            raise ValueError('向量與中繼資料的筆數不同')
+        if not len(vectors):
+            return 0
+
+        if self.quantized:
+            codes, scales = quantize(vectors)
+            self.append_rows('vectors.i8', codes, self.dim)
+            self.append_rows('scales.f32', scales, 4)
+        else:
+            self.append_rows('vectors.f32', vectors, self.dim * 4)
+
+        metadata = self.load_metadata()
+        lines = ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in metadatas).encode('utf-8')
+        with open(self.metadata_path, 'ab') as f:
+            f.truncate(self.header['metadata_bytes'])
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        metadata.extend(metadatas)
+
+        # 向量與中繼資料都寫入後才更新 count，作為這次附加的完成點
+        self.header['metadata_bytes'] += len(lines)
+        self.header['count'] += len(vectors)
+        self.save_header()
+        return len(vectors)
+
+    def add_texts(self, texts, metadatas, batch_size=64):
+        if self.embedding is None:
+            raise ValueError('向量庫沒有設定嵌入函式')
+        added = 0
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            added += self.add(self.embedding(batch), metadatas[start:start + batch_size])
+        return added
+
+    def load_metadata(self):
+        # 只讀取已完成寫入的部分，忽略中斷時多寫的中繼資料
+        if self.metadata is None:
+            self.metadata = []
+            if os.path.exists(self.metadata_path):
+                with open(self.metadata_path, 'rb') as f:
+                    data = f.read(self.header['metadata_bytes'])
+                self.metadata = [json.loads(line) for line in data.decode('utf-8').splitlines()]
+        return self.metadata
+
+    def matrix(self):
+        # 以 mmap 讀取已完成寫入的向量，回傳 (向量, 每列縮放係數或 None)
+        if not len(self):
+            return np.zeros((0, self.dim), dtype=np.float32), None
+        if self.quantized:
+            codes = np.memmap(self.data_path('vectors.i8'), dtype=np.int8, mode='r', shape=(len(self), self.dim))
+            scales = np.memmap(self.data_path('scales.f32'), dtype=np.float32, mode='r', shape=(len(self),))
+            return codes, scales
+        return np.memmap(self.data_path('vectors.f32'), dtype=np.float32, mode='r', shape=(len(self), self.dim)), None
+
+    def search(self, queries, k=10, block_rows=SEARCH_BLOCK_ROWS):
+        # 批次 cosine 相似度搜尋；queries 為 (查詢數, 維度) 的向量，回傳每個查詢的 [(分數, 中繼資料)]
+        queries = normalize(np.atleast_2d(queries))
+        matrix, scales = self.matrix()
+        count = len(matrix)
+        k = min(k, count)
+        if not k:
+            return [[] for _ in queries]
+
+        # 逐區塊計算，記憶體用量只取決於區塊大小；每個區塊先取出前 k 名再與目前結果合併
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, count, block_rows):
+            block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+            scores = queries @ block.T
+            if scales is not None:
+                scores *= scales[start:start + block_rows]
+            block_k = min(k, scores.shape[1])
+            top = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        metadata = self.load_metadata()
+        return [[(float(score), metadata[row]) for score, row in zip(scores, rows)]
+                for scores, rows in zip(best_scores.tolist(), best_rows.tolist())]
+
+    def search_texts(self, texts, k=10):
+        if self.embedding is None:
+            raise ValueError('向量庫沒有設定嵌入函式')
+        return self.search(self.embedding(texts), k)
@@ -1,14 +1,17 @@
 from openai import OpenAI
 import os
 from dotenv import load_dotenv
+from dataprocessor.corpus import GazetteCorpus, as_text
 
 # 加載 .env 文件
 load_dotenv()
 
 client = OpenAI()
 
-# 讀取 /data/txt/第01期/LCIDC01_1130101_00001.txt
-meeting_transcript = open(os.path.join(os.path.dirname(__file__), 'data/txt/第01期/LCIDC01_1130101_00001.txt'), 'r').read()
+# 以 mmap 讀取 /data/txt/第01期/LCIDC01_1130101_00001.txt，只解碼這一份會議紀錄
+corpus = GazetteCorpus(os.path.join(os.path.dirname(__file__), 'data'))
+meeting_transcript = as_text(corpus.section(1, 'LCIDC01_1130101_00001'))
+corpus.close()
 
 print(meeting_transcript)
 print(len(meeting_transcript))
@@ -8,16 +8,53 @@ import os
 import logging
 import time
 import ssl
+import asyncio
+import threading
+from aiolimiter import AsyncLimiter
 from urllib3 import poolmanager
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
 from google.auth.transport.requests import Request
 from google.auth.exceptions import RefreshError
 import json
 from requests_oauthlib import OAuth2Session
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import urllib.parse
+import hashlib
+from collections import namedtuple
+
+# download_file 的回傳值，兩者皆為真值，下載失敗時回傳 False
+DOWNLOADED = 'downloaded'
+NOT_MODIFIED = 'not_modified'
+
+DEFAULT_YEAR = 113
+GAZETTE_URL = 'https://ppg.ly.gov.tw/ppg/PublicationBulletinDetail/download/communique1/final/pdf/{year}/{issue:02d}/LCIDC01_{year}{issue:02d}{volume:02d}.pdf'
+
+class GazetteIssue(namedtuple('GazetteIssue', ['year', 'issue', 'volume'])):
+    @property
+    def url(self):
+        return GAZETTE_URL.format(year=self.year, issue=self.issue, volume=self.volume)
+
+    @property
+    def label(self):
+        label = f'第{self.issue:02d}期'
+        if self.year != DEFAULT_YEAR:
+            label = f'第{self.year}卷{label}'
+        if self.volume != 1:
+            label = f'{label}第{self.volume}冊'
+        return label
+
+    @property
+    def file_name(self):
+        # 第 113 卷第 1 冊沿用原本的「第NN期公報.pdf」命名，與 data/txt、data/md 的資料夾名稱一致
+        return f'{self.label}公報.pdf'
+
+def parse_range(value):
+    # 接受 "113" 或 "112-113" 形式的範圍
+    first, _, last = str(value).partition('-')
+    return range(int(first), int(last or first) + 1)
 
 class TLSAdapter(requests.adapters.HTTPAdapter):
     def init_poolmanager(self, connections, maxsize, block=False):
@@ -25,7 +62,8 @@ class TLSAdapter(requests.adapters.HTTPAdapter):
         ctx.set_ciphers('DEFAULT@SECLEVEL=1')
         ctx.check_hostname = False
         ctx.verify_mode = ssl.CERT_NONE
-        ctx.options |= ssl.OP_LEGACY_SERVER_CONNECT
+        # ssl.OP_LEGACY_SERVER_CONNECT 在 Python 3.12 才加入，舊版直接使用 OpenSSL 的常數值
+        ctx.options |= getattr(ssl, 'OP_LEGACY_SERVER_CONNECT', 0x4)
         self.poolmanager = poolmanager.PoolManager(
             num_pools=connections,
             maxsize=maxsize,
@@ -33,11 +71,48 @@ class TLSAdapter(requests.adapters.HTTPAdapter):
             ssl_version=ssl.PROTOCOL_TLSv1_2,
             ssl_context=ctx)
 
+class DownloadManifest:
+    # 以 URL 為鍵記錄每期公報的 ETag、Last-Modified、大小與 sha256，重跑時據此發出條件式請求
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def get(self, url):
+        with self.lock:
+            return dict(self.entries.get(url, {}))
+
+    def update(self, url, **fields):
+        with self.lock:
+            self.entries.setdefault(url, {}).update(fields)
+            self.save()
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
 class Command(BaseCommand):
     help = '從指定網站爬取完整公報 PDF 並上傳到 Google Drive 的特定文件夾'
 
     def add_arguments(self, parser):
-        parser.add_argument('--start', type=int, default=1, help='起始期數')
+        parser.add_argument('--start', type=int, default=1, help='每一卷的起始期數')
+        parser.add_argument('--year', type=str, default=str(DEFAULT_YEAR), help='要爬取的卷（民國年），例如 113 或 111-113')
+        parser.add_argument('--volume', type=str, default='1', help='要爬取的冊別，例如 1 或 1-2')
+        parser.add_argument('--concurrency', type=int, default=1, help='同時處理的期數，大於 1 時啟用並行爬取')
+        parser.add_argument('--rate', type=float, default=2.0, help='並行爬取時每秒最多發出的下載請求數')
+        parser.add_argument('--pipeline', action='store_true', help='以佇列串接下載與上傳兩個階段，讓下載與上傳同時進行')
+        parser.add_argument('--download-workers', type=int, default=2, help='管線模式下的下載工作數')
+        parser.add_argument('--upload-workers', type=int, default=2, help='管線模式下的上傳工作數')
+        parser.add_argument('--queue-size', type=int, default=4, help='管線模式下等待上傳的文件數上限')
+        parser.add_argument('--stats-interval', type=float, default=10.0, help='管線模式下輸出佇列深度與吞吐量的間隔秒數')
+        parser.add_argument('--upload-chunk-size', type=int, default=8, help='可續傳上傳每個區塊的大小（MB）')
+        parser.add_argument('--manifest', type=str, default=None, help='下載紀錄檔路徑，預設為 PDF 資料夾中的 manifest.json')
+        parser.add_argument('--force', action='store_true', help='忽略下載紀錄，重新下載並上傳所有期數')
 
     def handle(self, *args, **options):
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -47,6 +122,8 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR('無法獲取 Google Drive 憑證，上傳功能將被禁用。'))
             return
 
+        self.creds = creds
+        self._thread_local = threading.local()
         drive_service = build('drive', 'v3', credentials=creds)
         self.stdout.write(self.style.SUCCESS('成功獲取 Google Drive 憑證並建立服務。'))
 
@@ -56,56 +133,432 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR('無法找到目標文件夾，上傳功能將被禁用。'))
             return
 
-        start = options['start']
-        issue = start
+        # 先列出目標文件夾一次，上傳時依名稱與 md5Checksum 判斷要略過、更新或新建
+        self.upload_chunk_size = options['upload_chunk_size'] * 1024 * 1024
+        self.index_drive_folder(drive_service, target_folder_id)
 
         pdf_folder = settings.MEDIA_ROOT
         if not os.path.exists(pdf_folder):
             os.makedirs(pdf_folder)
 
-        while True:
-            issue_str = f'{issue:02d}'
-            url = f'https://ppg.ly.gov.tw/ppg/PublicationBulletinDetail/download/communique1/final/pdf/113/{issue_str}/LCIDC01_113{issue_str}01.pdf'
-            file_name = f'第{issue_str}期公報.pdf'
-            file_path = os.path.join(pdf_folder, file_name)
+        manifest_path = options['manifest'] or os.path.join(pdf_folder, 'manifest.json')
+        self.manifest = DownloadManifest(manifest_path)
+        self.force = options['force']
 
-            logging.info(f'開始爬取第{issue_str}期公報： {url}')
+        # 整個爬取過程共用同一個 Session，連線池大小與並行數一致，讓 TLS 連線可以 keep-alive 重複使用
+        pool_size = options['download_workers'] if options['pipeline'] else options['concurrency']
+        self.session = self.create_session(pool_size)
 
-            if self.download_file(url, file_path):
-                self.upload_to_drive(drive_service, file_path, file_name, target_folder_id)
+        issues = self.discover_issues(parse_range(options['year']), parse_range(options['volume']), options['start'])
+        if not issues:
+            logging.info('沒有找到任何可爬取的公報。')
+        elif options['pipeline']:
+            asyncio.run(self.crawl_pipelined(issues, pdf_folder, target_folder_id, options['download_workers'],
+                                             options['upload_workers'], options['queue_size'], options['rate'],
+                                             options['stats_interval']))
+        elif options['concurrency'] > 1:
+            asyncio.run(self.crawl_concurrently(issues, pdf_folder, target_folder_id,
+                                                options['concurrency'], options['rate']))
+        else:
+            self.crawl_sequentially(issues, pdf_folder, drive_service, target_folder_id)
+
+        self.log_connection_stats()
+        self.session.close()
+
+    def discover_issues(self, years, volumes, start):
+        # 以 HEAD 請求先指數遞增、再二分搜尋，找出每一卷每一冊的最後一期，再交給下載流程
+        issues = []
+        for year in years:
+            for volume in volumes:
+                last = self.find_last_issue(year, volume, start)
+                if last is None:
+                    logging.info(f'第{year}卷第{volume}冊沒有找到第{start:02d}期之後的公報')
+                    continue
+                logging.info(f'第{year}卷第{volume}冊的最後一期為第{last:02d}期')
+                issues.extend(GazetteIssue(year, issue, volume) for issue in range(start, last + 1))
+        return issues
+
+    def find_last_issue(self, year, volume, start):
+        if not self.issue_exists(GazetteIssue(year, start, volume)):
+            return None
+
+        found, step = start, 1
+        while self.issue_exists(GazetteIssue(year, found + step, volume)):
+            found += step
+            step *= 2
+        missing = found + step
+
+        while missing - found > 1:
+            middle = (found + missing) // 2
+            if self.issue_exists(GazetteIssue(year, middle, volume)):
+                found = middle
             else:
-                logging.info(f'在第{issue_str}期之後沒有找到更多公報。爬取完成。')
-                break
+                missing = middle
+        return found
+
+    def issue_exists(self, gazette_issue, max_retries=3):
+        session = self.get_session()
+        for attempt in range(max_retries):
+            try:
+                response = session.head(gazette_issue.url, timeout=10, verify=False, allow_redirects=True)
+                if response.status_code in (405, 501):
+                    # 不支援 HEAD 時改用只取第一個 byte 的 GET
+                    with session.get(gazette_issue.url, headers={'Range': 'bytes=0-0'}, timeout=10,
+                                     verify=False, stream=True) as response:
+                        pass
+                return response.ok
+            except requests.RequestException as e:
+                logging.error(f'探測 {gazette_issue.url} 時發生錯誤：{str(e)}')
+                if attempt < max_retries - 1:
+                    time.sleep(3 ** attempt)
+        return False
 
-            issue += 1
+    def crawl_sequentially(self, issues, pdf_folder, drive_service, target_folder_id):
+        for gazette_issue in issues:
+            label = gazette_issue.label
+            file_path = os.path.join(pdf_folder, gazette_issue.file_name)
 
-    def download_file(self, file_url, file_path, max_retries=3):
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
+            logging.info(f'開始爬取{label}公報： {gazette_issue.url}')
+
+            result = self.download_file(gazette_issue.url, file_path)
+            if result == NOT_MODIFIED:
+                logging.info(f'{label}公報未變更，略過上傳')
+            elif result:
+                if self.upload_to_drive(drive_service, file_path, gazette_issue.file_name, target_folder_id):
+                    self.mark_uploaded(gazette_issue.url)
+            else:
+                logging.info(f'{label}公報下載失敗，繼續下一期')
+
+        logging.info('爬取完成。')
+
+    async def crawl_concurrently(self, issues, pdf_folder, folder_id, concurrency, rate):
+        limiter = AsyncLimiter(rate, 1)
+        slots = asyncio.Semaphore(concurrency)
+        results = {}
+        state = {'next_to_log': 0}
+
+        async def process(index, gazette_issue):
+            file_path = os.path.join(pdf_folder, gazette_issue.file_name)
+            async with slots:
+                try:
+                    # 與管線模式相同，單一期的錯誤只記錄下來，不中斷其他期
+                    try:
+                        async with limiter:
+                            downloaded = await asyncio.to_thread(self.download_file, gazette_issue.url, file_path)
+                    except Exception as e:
+                        logging.error(f'下載{gazette_issue.label}公報時發生錯誤：{str(e)}')
+                        downloaded = False
+                    if downloaded == NOT_MODIFIED:
+                        results[index] = 'not_modified'
+                    elif downloaded:
+                        try:
+                            uploaded = await asyncio.to_thread(self.upload_in_thread, file_path,
+                                                               gazette_issue.file_name, folder_id)
+                        except Exception as e:
+                            logging.error(f'上傳{gazette_issue.label}公報時發生錯誤：{str(e)}')
+                            uploaded = False
+                        if uploaded:
+                            self.mark_uploaded(gazette_issue.url)
+                        results[index] = 'uploaded' if uploaded else 'upload_failed'
+                    else:
+                        results[index] = 'missing'
+                finally:
+                    results.setdefault(index, 'missing')
+                    self.log_results_in_order(issues, results, state)
+
+        await asyncio.gather(*(process(index, gazette_issue) for index, gazette_issue in enumerate(issues)))
+        logging.info('爬取完成。')
+
+    async def crawl_pipelined(self, issues, pdf_folder, folder_id, download_workers, upload_workers,
+                              queue_size, rate, stats_interval):
+        # 下載與上傳分成兩個階段，中間以有上限的佇列連接：第 N+1 期下載時，第 N 期可以同時上傳，
+        # 佇列滿了則下載端等待，避免本地累積過多尚未上傳的文件。
+        limiter = AsyncLimiter(rate, 1)
+        pending = asyncio.Queue()
+        for index, gazette_issue in enumerate(issues):
+            pending.put_nowait((index, gazette_issue))
+        upload_queue = asyncio.Queue(maxsize=queue_size)
+        results = {}
+        state = {'next_to_log': 0}
+        stats = {
+            'download': {'files': 0, 'bytes': 0},
+            'upload': {'files': 0, 'bytes': 0},
+            'max_queue_depth': 0,
         }
+        started = time.monotonic()
+
+        def finish(index, result):
+            results[index] = result
+            self.log_results_in_order(issues, results, state)
 
+        async def download_worker():
+            while not pending.empty():
+                index, gazette_issue = pending.get_nowait()
+                file_path = os.path.join(pdf_folder, gazette_issue.file_name)
+                try:
+                    async with limiter:
+                        downloaded = await asyncio.to_thread(self.download_file, gazette_issue.url, file_path)
+                except Exception as e:
+                    logging.error(f'下載{gazette_issue.label}公報時發生錯誤：{str(e)}')
+                    downloaded = False
+                if downloaded == NOT_MODIFIED:
+                    finish(index, 'not_modified')
+                elif downloaded:
+                    stats['download']['files'] += 1
+                    stats['download']['bytes'] += os.path.getsize(file_path)
+                    await upload_queue.put((index, gazette_issue, file_path))
+                    stats['max_queue_depth'] = max(stats['max_queue_depth'], upload_queue.qsize())
+                else:
+                    finish(index, 'missing')
+
+        async def upload_worker():
+            while True:
+                item = await upload_queue.get()
+                if item is None:
+                    return
+                index, gazette_issue, file_path = item
+                try:
+                    uploaded = await asyncio.to_thread(self.upload_in_thread, file_path, gazette_issue.file_name,
+                                                       folder_id)
+                except Exception as e:
+                    logging.error(f'上傳{gazette_issue.label}公報時發生錯誤：{str(e)}')
+                    uploaded = False
+                if uploaded:
+                    self.mark_uploaded(gazette_issue.url)
+                    stats['upload']['files'] += 1
+                    stats['upload']['bytes'] += os.path.getsize(file_path)
+                finish(index, 'uploaded' if uploaded else 'upload_failed')
+
+        async def report_periodically():
+            while True:
+                await asyncio.sleep(stats_interval)
+                self.log_pipeline_stats(stats, upload_queue.qsize(), time.monotonic() - started)
+
+        reporter = asyncio.create_task(report_periodically())
+        uploaders = [asyncio.create_task(upload_worker()) for _ in range(upload_workers)]
+        await asyncio.gather(*(download_worker() for _ in range(download_workers)))
+        for _ in uploaders:
+            await upload_queue.put(None)
+        await asyncio.gather(*uploaders)
+        reporter.cancel()
+
+        self.log_pipeline_stats(stats, upload_queue.qsize(), time.monotonic() - started)
+        logging.info(f'爬取完成。等待上傳佇列的最大深度為 {stats["max_queue_depth"]}/{queue_size}')
+
+    def log_pipeline_stats(self, stats, queue_depth, elapsed):
+        elapsed = max(elapsed, 1e-6)
+        for stage, name in (('download', '下載'), ('upload', '上傳')):
+            files = stats[stage]['files']
+            megabytes = stats[stage]['bytes'] / (1024 * 1024)
+            logging.info(f'{name}階段：{files} 個文件，{megabytes:.1f} MB，{megabytes / elapsed:.2f} MB/s，'
+                         f'{files * 60 / elapsed:.1f} 期/分鐘')
+        logging.info(f'等待上傳的佇列深度：{queue_depth}')
+
+    def log_results_in_order(self, issues, results, state):
+        # 依期數順序輸出結果，避免並行完成的順序打亂日誌
+        messages = {
+            'uploaded': '下載並上傳完成',
+            'not_modified': '未變更，略過上傳',
+            'upload_failed': '已下載，但上傳失敗',
+            'missing': '下載失敗',
+        }
+        while state['next_to_log'] in results:
+            index = state['next_to_log']
+            logging.info(f'{issues[index].label}公報：{messages[results.pop(index)]}')
+            state['next_to_log'] += 1
+
+    def upload_in_thread(self, file_path, file_name, folder_id):
+        # 在 asyncio.to_thread 的工作執行緒中取得該執行緒自己的 service 再上傳；
+        # 若在事件迴圈中呼叫 thread_drive_service，所有工作執行緒會共用同一個 service
+        return self.upload_to_drive(self.thread_drive_service(), file_path, file_name, folder_id)
+
+    def thread_drive_service(self):
+        # googleapiclient 的 service 物件不是執行緒安全的，每個工作執行緒各自建立一個
+        if not hasattr(self._thread_local, 'drive_service'):
+            self._thread_local.drive_service = build('drive', 'v3', credentials=self.creds)
+        return self._thread_local.drive_service
+
+    def create_session(self, pool_size=1):
         session = requests.Session()
-        session.mount('https://', TLSAdapter())
+        session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
+        })
+        session.mount('https://', TLSAdapter(pool_maxsize=pool_size))
+        session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=pool_size))
+        return session
 
-        for attempt in range(max_retries):
-            try:
-                response = session.get(file_url, headers=headers, timeout=30, verify=False)
-                response.raise_for_status()
+    def get_session(self):
+        if getattr(self, 'session', None) is None:
+            self.session = self.create_session()
+        return self.session
 
-                with open(file_path, 'wb') as f:
-                    f.write(response.content)
-                logging.info(f'文件 {os.path.basename(file_path)} 已下載到 {file_path}')
-                return True
+    def connection_stats(self):
+        # urllib3 的連線池會記錄建立過的連線數與送出的請求數，兩者相減即為重複使用連線的次數
+        opened = requests_sent = 0
+        for adapter in self.get_session().adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                if pool is not None:
+                    opened += pool.num_connections
+                    requests_sent += pool.num_requests
+        return {'opened': opened, 'reused': requests_sent - opened}
+
+    def log_connection_stats(self):
+        stats = self.connection_stats()
+        logging.info(f'HTTP 連線統計：新建 {stats["opened"]} 條連線，重複使用 {stats["reused"]} 次')
+
+    def download_file(self, file_url, file_path, max_retries=3):
+        session = self.get_session()
+        manifest = getattr(self, 'manifest', None)
+        entry = manifest.get(file_url) if manifest else {}
 
+        # 先寫入 .part 暫存檔，完成後再原子性地改名，中斷時可用 Range 從已下載的位置續傳
+        part_path = file_path + '.part'
+        validators = self.conditional_headers(entry, file_path, part_path)
+        attempt = 0
+        while True:
+            received_before = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            try:
+                status, response_headers = self.stream_to_part(session, file_url, part_path, validators)
+                if status == NOT_MODIFIED:
+                    logging.info(f'文件 {os.path.basename(file_path)} 在伺服器上未變更，略過下載')
+                    return NOT_MODIFIED
+                if status:
+                    return self.finish_download(file_url, file_path, part_path, response_headers, entry)
             except requests.RequestException as e:
                 logging.error(f'下載 {file_url} 時發生錯：{str(e)}')
-                if attempt < max_retries - 1:
-                    wait_time = 3 ** attempt  # 指數退避
-                    logging.info(f'{wait_time} 秒後重試下載...')
-                    time.sleep(wait_time)
-                else:
-                    logging.error(f'在 {max_retries} 次嘗試後仍無法下載 {file_url}')
-                    return False
+
+            received = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if received > received_before:
+                # 有取得新資料的中斷不計入重試次數，直接續傳
+                logging.info(f'已下載 {received} bytes，從中斷處續傳...')
+                continue
+
+            if attempt < max_retries - 1:
+                wait_time = 3 ** attempt  # 指數退避
+                logging.info(f'{wait_time} 秒後重試下載...')
+                time.sleep(wait_time)
+                attempt += 1
+            else:
+                logging.error(f'在 {max_retries} 次嘗試後仍無法下載 {file_url}')
+                return False
+
+    def conditional_headers(self, entry, file_path, part_path):
+        # 只有在上一次已完整下載並上傳、且本地文件仍在時才發出條件式請求
+        if getattr(self, 'force', False) or not entry.get('uploaded'):
+            return {}
+        if not os.path.exists(file_path) or os.path.exists(part_path):
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def finish_download(self, file_url, file_path, part_path, response_headers, entry):
+        sha256 = self.file_digest(part_path, 'sha256')
+        os.replace(part_path, file_path)
+        self.remove_part(part_path)
+        logging.info(f'文件 {os.path.basename(file_path)} 已下載到 {file_path}')
+
+        manifest = getattr(self, 'manifest', None)
+        if manifest is None:
+            return DOWNLOADED
+
+        # 伺服器不支援 ETag 時，內容雜湊相同也視為未變更
+        unchanged = entry.get('uploaded') and entry.get('sha256') == sha256 and not getattr(self, 'force', False)
+        manifest.update(
+            file_url,
+            file=os.path.basename(file_path),
+            etag=response_headers.get('ETag'),
+            last_modified=response_headers.get('Last-Modified'),
+            size=os.path.getsize(file_path),
+            sha256=sha256,
+            uploaded=bool(unchanged),
+        )
+        return NOT_MODIFIED if unchanged else DOWNLOADED
+
+    def mark_uploaded(self, file_url):
+        manifest = getattr(self, 'manifest', None)
+        if manifest is not None:
+            manifest.update(file_url, uploaded=True)
+
+    def file_digest(self, file_path, algorithm, chunk_size=1024 * 1024):
+        digest = hashlib.new(algorithm)
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def stream_to_part(self, session, file_url, part_path, validators=None, chunk_size=64 * 1024):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request_headers = dict(validators or {})
+        if offset:
+            # 以暫存檔開始下載時記錄的 ETag／Last-Modified 作為 If-Range：伺服器上的文件已更正時會回傳 200
+            # 與完整內容，避免把新版本接在舊版本的前半段後面
+            if_range = self.part_validator(part_path)
+            if if_range:
+                request_headers = {'Range': f'bytes={offset}-', 'If-Range': if_range}
+            else:
+                self.remove_part(part_path)
+                offset = 0
+
+        with session.get(file_url, headers=request_headers, timeout=30, verify=False, stream=True) as response:
+            if response.status_code == 304:
+                return NOT_MODIFIED, response.headers
+            if response.status_code == 416:
+                # 暫存檔已不符合伺服器上的文件，重新下載
+                self.remove_part(part_path)
+                return False, response.headers
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                mode = 'ab'
+                total = self.parse_total_size(response.headers.get('Content-Range'))
+            else:
+                # 伺服器不支援 Range 或文件已變更，從頭開始
+                mode = 'wb'
+                offset = 0
+                content_length = response.headers.get('Content-Length')
+                total = int(content_length) if content_length else None
+                self.save_part_validators(part_path, response.headers)
+
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+
+        return total is None or os.path.getsize(part_path) == total, response.headers
+
+    def part_validator(self, part_path):
+        # 弱 ETag（W/ 開頭）不能用於 If-Range，改用 Last-Modified；兩者皆無時無法安全續傳
+        try:
+            with open(part_path + '.json', 'r', encoding='utf-8') as f:
+                validators = json.load(f)
+        except (OSError, ValueError):
+            return None
+        etag = validators.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return validators.get('last_modified')
+
+    def save_part_validators(self, part_path, response_headers):
+        with open(part_path + '.json', 'w', encoding='utf-8') as f:
+            json.dump({'etag': response_headers.get('ETag'), 'last_modified': response_headers.get('Last-Modified')}, f)
+
+    def remove_part(self, part_path):
+        for path in (part_path, part_path + '.json'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def parse_total_size(self, content_range):
+        # Content-Range: bytes 100-199/200
+        if content_range and '/' in content_range:
+            total = content_range.rsplit('/', 1)[1]
+            if total.isdigit():
+                return int(total)
+        return None
 
     def get_google_drive_creds(self):
         client_id = settings.GOOGLE_CLIENT_ID
@@ -228,20 +681,64 @@ class Command(BaseCommand):
             logging.error(f"獲取或創建目標文件夾時發生錯誤：{str(e)}")
             return None
 
+    def index_drive_folder(self, drive_service, folder_id):
+        self.drive_index_lock = threading.Lock()
+        self.drive_index = {}
+        page_token = None
+        while True:
+            response = drive_service.files().list(
+                q=f"'{folder_id}' in parents and trashed=false",
+                spaces='drive',
+                fields='nextPageToken, files(id, name, md5Checksum)',
+                pageSize=1000,
+                pageToken=page_token
+            ).execute()
+            for file in response.get('files', []):
+                self.drive_index.setdefault(file['name'], []).append(file)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        logging.info(f'Google Drive 目標文件夾中已有 {len(self.drive_index)} 個文件')
+
     def upload_to_drive(self, drive_service, file_path, file_name, folder_id):
         if not drive_service or not folder_id:
             logging.warning(f"Google Drive 服務未初始化或找不到目標文件夾，跳過上傳 {file_name}")
             return
-        
-        file_metadata = {
-            'name': file_name,
-            'parents': [folder_id]
-        }
-        media = MediaFileUpload(file_path, resumable=True)
+
+        drive_index = getattr(self, 'drive_index', None)
+        existing = []
+        if drive_index is not None:
+            with self.drive_index_lock:
+                existing = list(drive_index.get(file_name, []))
+
+        md5 = self.file_digest(file_path, 'md5')
+        if any(file.get('md5Checksum') == md5 for file in existing):
+            logging.info(f'Google Drive 上已有內容相同的 {file_name}，略過上傳')
+            return True
+
+        media = MediaFileUpload(file_path, resumable=True,
+                                chunksize=getattr(self, 'upload_chunk_size', 8 * 1024 * 1024))
         try:
-            file = drive_service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-            logging.info(f'文件 {file_name} 已上傳到 Google Drive 的指定文件夾，文件 ID: {file.get("id")}')
+            if existing:
+                # 同名文件內容不同時直接更新，避免在文件夾中累積重複的公報
+                file = drive_service.files().update(fileId=existing[0]['id'], media_body=media,
+                                                    fields='id, name, md5Checksum').execute()
+                logging.info(f'已更新 Google Drive 上的 {file_name}，文件 ID: {file.get("id")}')
+            else:
+                file_metadata = {
+                    'name': file_name,
+                    'parents': [folder_id]
+                }
+                file = drive_service.files().create(body=file_metadata, media_body=media,
+                                                    fields='id, name, md5Checksum').execute()
+                logging.info(f'文件 {file_name} 已上傳到 Google Drive 的指定文件夾，文件 ID: {file.get("id")}')
         except Exception as e:
             logging.error(f'上傳 {file_name} 到 Google Drive 時發生錯誤：{str(e)}')
+            return False
+
+        if drive_index is not None:
+            with self.drive_index_lock:
+                drive_index[file_name] = [file] + [f for f in drive_index.get(file_name, []) if f['id'] != file.get('id')]
+        return True
 
-# 使用方法: python manage.py gazette [--start START_ISSUE]
\ No newline at end of file
+# 使用方法: python manage.py gazette [--start START_ISSUE] [--year 112-113] [--volume 1] [--pipeline --download-workers N --upload-workers M] [--concurrency N] [--rate REQUESTS_PER_SECOND] [--upload-chunk-size MB] [--manifest PATH] [--force]
\ No newline at end of file
@@ -1,3 +1,322 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import os
+import socket
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from scraper.management.commands.gazette import Command, DownloadManifest, GazetteIssue, DOWNLOADED, NOT_MODIFIED
+
+
+class FlakyPDFHandler(BaseHTTPRequestHandler):
+    # 模擬 ly.gov.tw：支援 Range、If-Range 與 keep-alive，且前幾次回應會在傳到一半時斷線
+    protocol_version = 'HTTP/1.1'
+    body = bytes(range(256)) * 4096
+    etag = '"v1"'
+    drops_left = 2
+    ranges_seen = []
+
+    def do_GET(self):
+        offset = 0
+        range_header = self.headers.get('Range')
+        type(self).ranges_seen.append(range_header)
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if range_header and self.headers.get('If-Range', self.etag) != self.etag:
+            # 文件已變更，忽略 Range 回傳完整的新版本
+            range_header = None
+        if range_header:
+            offset = int(range_header.split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {offset}-{len(self.body) - 1}/{len(self.body)}')
+        else:
+            self.send_response(200)
+        self.send_header('ETag', self.etag)
+        remaining = self.body[offset:]
+        self.send_header('Content-Length', str(len(remaining)))
+        self.end_headers()
+
+        if type(self).drops_left > 0:
+            type(self).drops_left -= 1
+            self.wfile.write(remaining[:len(remaining) // 3])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            return
+        self.wfile.write(remaining)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadFileTests(SimpleTestCase):
+    def setUp(self):
+        FlakyPDFHandler.drops_left = 2
+        FlakyPDFHandler.ranges_seen = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyPDFHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/LCIDC01_1130101.pdf'
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.command = Command()
+
+    def tearDown(self):
+        self.command.get_session().close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_resumes_interrupted_download_with_range(self):
+        file_path = os.path.join(self.tmp_dir.name, '第01期公報.pdf')
+
+        self.assertTrue(self.command.download_file(self.url, file_path))
+
+        with open(file_path, 'rb') as f:
+            self.assertEqual(f.read(), FlakyPDFHandler.body)
+        self.assertFalse(os.path.exists(file_path + '.part'))
+        self.assertIsNone(FlakyPDFHandler.ranges_seen[0])
+        self.assertTrue(all(r.startswith('bytes=') for r in FlakyPDFHandler.ranges_seen[1:]))
+        self.assertEqual(len(FlakyPDFHandler.ranges_seen), 3)
+
+    def test_stale_part_from_older_version_is_discarded(self):
+        # 上次失敗留下的暫存檔來自已被更正的舊版本，If-Range 不符時伺服器回傳完整的新版本
+        FlakyPDFHandler.drops_left = 0
+        file_path = os.path.join(self.tmp_dir.name, '第01期公報.pdf')
+        with open(file_path + '.part', 'wb') as f:
+            f.write(b'old' * 1000)
+        with open(file_path + '.part.json', 'w', encoding='utf-8') as f:
+            f.write('{"etag": "\\"v0\\"", "last_modified": null}')
+
+        self.assertTrue(self.command.download_file(self.url, file_path))
+
+        with open(file_path, 'rb') as f:
+            self.assertEqual(f.read(), FlakyPDFHandler.body)
+        self.assertEqual(FlakyPDFHandler.ranges_seen, ['bytes=3000-'])
+        self.assertFalse(os.path.exists(file_path + '.part.json'))
+
+    def test_part_without_validators_restarts_from_zero(self):
+        FlakyPDFHandler.drops_left = 0
+        file_path = os.path.join(self.tmp_dir.name, '第01期公報.pdf')
+        with open(file_path + '.part', 'wb') as f:
+            f.write(b'old' * 1000)
+
+        self.assertTrue(self.command.download_file(self.url, file_path))
+
+        with open(file_path, 'rb') as f:
+            self.assertEqual(f.read(), FlakyPDFHandler.body)
+        self.assertEqual(FlakyPDFHandler.ranges_seen, [None])
+
+    def test_session_reuses_connections_across_issues(self):
+        FlakyPDFHandler.drops_left = 0
+
+        for issue in range(1, 4):
+            file_path = os.path.join(self.tmp_dir.name, f'第{issue:02d}期公報.pdf')
+            self.assertTrue(self.command.download_file(self.url, file_path))
+
+        self.assertEqual(self.command.connection_stats(), {'opened': 1, 'reused': 2})
+
+    def test_manifest_skips_unchanged_issue_with_conditional_request(self):
+        FlakyPDFHandler.drops_left = 0
+        file_path = os.path.join(self.tmp_dir.name, '第01期公報.pdf')
+        manifest_path = os.path.join(self.tmp_dir.name, 'manifest.json')
+        self.command.manifest = DownloadManifest(manifest_path)
+
+        self.assertEqual(self.command.download_file(self.url, file_path), DOWNLOADED)
+        self.command.mark_uploaded(self.url)
+
+        entry = DownloadManifest(manifest_path).get(self.url)
+        self.assertEqual(entry['etag'], '"v1"')
+        self.assertEqual(entry['size'], len(FlakyPDFHandler.body))
+
+        self.command.manifest = DownloadManifest(manifest_path)
+        self.assertEqual(self.command.download_file(self.url, file_path), NOT_MODIFIED)
+        self.assertEqual(len(FlakyPDFHandler.ranges_seen), 2)
+
+
+class DiscoverIssuesTests(SimpleTestCase):
+    def setUp(self):
+        self.command = Command()
+        self.last_issue = {113: 68, 112: 1}
+        self.probed = []
+
+        def issue_exists(gazette_issue):
+            self.probed.append(gazette_issue)
+            return gazette_issue.issue <= self.last_issue.get(gazette_issue.year, 0)
+
+        self.command.issue_exists = issue_exists
+
+    def test_finds_last_issue_with_few_probes(self):
+        issues = self.command.discover_issues(range(111, 114), range(1, 2), 1)
+
+        self.assertEqual(issues[0], GazetteIssue(112, 1, 1))
+        self.assertEqual(issues[-1], GazetteIssue(113, 68, 1))
+        self.assertEqual(len(issues), 69)
+        self.assertLess(len([p for p in self.probed if p.year == 113]), 16)
+
+    def test_default_year_keeps_legacy_file_name(self):
+        self.assertEqual(GazetteIssue(113, 5, 1).file_name, '第05期公報.pdf')
+        self.assertEqual(GazetteIssue(112, 5, 2).file_name, '第112卷第05期第2冊公報.pdf')
+        self.assertTrue(GazetteIssue(113, 5, 1).url.endswith('/pdf/113/05/LCIDC01_1130501.pdf'))
+
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeDriveFiles:
+    def __init__(self, files):
+        self.files = files
+        self.calls = []
+
+    def list(self, q, spaces, fields, pageSize, pageToken=None):
+        # 每頁兩個文件，以測試 nextPageToken 分頁
+        start = int(pageToken or 0)
+        page = {'files': self.files[start:start + 2]}
+        if start + 2 < len(self.files):
+            page['nextPageToken'] = str(start + 2)
+        return FakeRequest(page)
+
+    def create(self, body, media_body, fields):
+        self.calls.append(('create', body['name']))
+        file = {'id': f'new-{len(self.calls)}', 'name': body['name'], 'md5Checksum': self.md5(media_body)}
+        self.files.append(file)
+        return FakeRequest(file)
+
+    def update(self, fileId, media_body, fields):
+        self.calls.append(('update', fileId))
+        file = next(f for f in self.files if f['id'] == fileId)
+        file['md5Checksum'] = self.md5(media_body)
+        return FakeRequest(file)
+
+    def md5(self, media_body):
+        return hashlib.md5(media_body.getbytes(0, media_body.size())).hexdigest()
+
+
+class FakeDriveService:
+    def __init__(self, files):
+        self._files = FakeDriveFiles(files)
+
+    def files(self):
+        return self._files
+
+
+class UploadToDriveTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.command = Command()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_pdf(self, file_name, content):
+        file_path = os.path.join(self.tmp_dir.name, file_name)
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        return file_path
+
+    def test_skips_identical_updates_changed_and_creates_new(self):
+        service = FakeDriveService([
+            {'id': 'a', 'name': '第01期公報.pdf', 'md5Checksum': hashlib.md5(b'one').hexdigest()},
+            {'id': 'b', 'name': '第02期公報.pdf', 'md5Checksum': hashlib.md5(b'old').hexdigest()},
+            {'id': 'c', 'name': '第03期公報.pdf', 'md5Checksum': hashlib.md5(b'three').hexdigest()},
+        ])
+        self.command.index_drive_folder(service, 'folder')
+
+        for file_name, content in (('第01期公報.pdf', b'one'), ('第02期公報.pdf', b'two'), ('第04期公報.pdf', b'four')):
+            path = self.write_pdf(file_name, content)
+            self.assertTrue(self.command.upload_to_drive(service, path, file_name, 'folder'))
+
+        self.assertEqual(service.files().calls, [('update', 'b'), ('create', '第04期公報.pdf')])
+
+        # 重跑時全部都已是最新內容，不應再送出任何上傳
+        path = self.write_pdf('第04期公報.pdf', b'four')
+        self.assertTrue(self.command.upload_to_drive(service, path, '第04期公報.pdf', 'folder'))
+        self.assertEqual(len(service.files().calls), 2)
+
+
+class CrawlModeTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.command = Command()
+        # 第 5 期之後不存在，discover_issues 應停在第 5 期
+        self.command.issue_exists = lambda gazette_issue: gazette_issue.issue <= 5
+        self.issues = self.command.discover_issues([113], [1], 1)
+        self.downloaded = []
+        self.uploads = []
+        self.marked = []
+
+        def download_file(url, file_path):
+            issue = int(url[-8:-6])
+            # 前面的期數下載得比較慢，讓完成順序與期數順序相反
+            time.sleep((6 - issue) * 0.02)
+            self.downloaded.append(issue)
+            if issue == 2:
+                raise OSError('connection reset')
+            if issue == 4:
+                return NOT_MODIFIED
+            with open(file_path, 'wb') as f:
+                f.write(b'%PDF-' + bytes(issue * 1024))
+            return DOWNLOADED
+
+        def upload_to_drive(drive_service, file_path, file_name, folder_id):
+            self.uploads.append((file_name, drive_service, threading.get_ident()))
+            time.sleep(0.02)
+            if file_name == '第03期公報.pdf':
+                raise OSError('quota exceeded')
+            return True
+
+        self.command.download_file = download_file
+        self.command.upload_to_drive = upload_to_drive
+        self.command.thread_drive_service = lambda: threading.get_ident()
+        self.command.mark_uploaded = self.marked.append
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def result_lines(self, logs):
+        return [line.split(':', 2)[2] for line in logs.output if '公報：' in line]
+
+    def assert_results(self, logs):
+        self.assertEqual(self.result_lines(logs), [
+            '第01期公報：下載並上傳完成',
+            '第02期公報：下載失敗',
+            '第03期公報：已下載，但上傳失敗',
+            '第04期公報：未變更，略過上傳',
+            '第05期公報：下載並上傳完成',
+        ])
+        self.assertEqual(sorted(self.downloaded), [1, 2, 3, 4, 5])
+        self.assertCountEqual(self.marked, [GazetteIssue(113, 1, 1).url, GazetteIssue(113, 5, 1).url])
+        # Drive service 必須在執行上傳的同一個工作執行緒中取得
+        for file_name, service, thread_id in self.uploads:
+            self.assertEqual(service, thread_id)
+            self.assertNotEqual(thread_id, threading.get_ident())
+
+    def test_concurrent_crawl_logs_in_order_and_isolates_errors(self):
+        with self.assertLogs(level='INFO') as logs:
+            asyncio.run(self.command.crawl_concurrently(self.issues, self.tmp_dir.name, 'folder', 5, 100))
+
+        self.assert_results(logs)
+        output = '\n'.join(logs.output)
+        self.assertIn('下載第02期公報時發生錯誤：connection reset', output)
+        self.assertIn('上傳第03期公報時發生錯誤：quota exceeded', output)
+
+    def test_pipelined_crawl_reports_stats_and_queue_depth(self):
+        with self.assertLogs(level='INFO') as logs:
+            asyncio.run(self.command.crawl_pipelined(self.issues, self.tmp_dir.name, 'folder', 3, 1, 1, 100, 60))
+
+        self.assert_results(logs)
+        output = '\n'.join(logs.output)
+        self.assertIn('下載階段：3 個文件', output)
+        self.assertIn('上傳階段：2 個文件', output)
+        self.assertIn('最大深度為 1/1', output)